@@ -0,0 +1,56 @@
+"""
+Open time of a HadCM3 raw dataset: combine='by_coords' against the fast nested and lazy modes of HadCM3RDS.
+A synthetic tree of monthly pf-like files is generated in a temporary directory.
+
+Usage: python open_mfdataset.py [n_files]
+"""
+
+import os
+import sys
+import tempfile
+
+import cftime
+import numpy as np
+import xarray as xr
+
+import pylaeoclim_leeds.util_hadcm3 as util
+from benchmarking import Timer
+
+MONTHS = ['ja', 'fb', 'mr', 'ar', 'my', 'jn', 'jl', 'ag', 'sp', 'ot', 'nv', 'dc']
+
+
+def generate_tree(root, n_files, n_lon=288, n_lat=144, n_z=20):
+    paths = []
+    lon, lat, depth = np.arange(n_lon) * 1.25, np.linspace(-89.375, 89.375, n_lat), np.arange(n_z) * 10.
+    for i in range(n_files):
+        year, month = i // 12 + 1, i % 12
+        path = f"{root}/xabcdo#pf{year:09d}{MONTHS[month]}+.nc"
+        xr.Dataset({"temp_mm_dpth": (("t", "depth_1", "latitude", "longitude"),
+                                     np.zeros((1, n_z, n_lat, n_lon), dtype="float32"))},
+                   coords={"t": [cftime.Datetime360Day(year, month + 1, 16)], "longitude": lon, "latitude": lat,
+                           "depth_1": depth}).to_netcdf(path)
+        paths.append(path)
+    return paths
+
+
+def open_by_coords(paths):
+    return xr.open_mfdataset(paths, combine='by_coords')
+
+
+def open_fast(paths, parallel=False):
+    return xr.open_mfdataset(paths, combine='nested', concat_dim='t', data_vars='minimal', coords='minimal',
+                             compat='override', join='override', parallel=parallel)
+
+
+if __name__ == "__main__":
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    with tempfile.TemporaryDirectory() as root:
+        print(f"Generating {n_files} files in {root}")
+        paths = generate_tree(root, n_files)
+        print(f"Size of one file: {os.path.getsize(paths[0]) / 1e6:0.1f} MB")
+        
+        for name, function in [("by_coords", open_by_coords), ("fast", open_fast),
+                               ("fast, parallel", lambda p: open_fast(p, parallel=True)),
+                               ("lazy", util.open_concatenated)]:
+            with Timer(text=f"{name:<16}: {{:0.2f}} seconds"):
+                function(paths).close()
@@ -0,0 +1,35 @@
+"""
+Read time of a North Atlantic box (280E-360E, 0N-70N, top 10 levels) from HadCM3 raw ocean files:
+open_mfdataset reads every file entirely, the lazy mode of HadCM3RDS only reads the hyperslab of the box.
+A synthetic tree of monthly pf-like files is generated in a temporary directory.
+
+Usage: python pushdown.py [n_files]
+"""
+
+import sys
+import tempfile
+
+import pylaeoclim_leeds.util_hadcm3 as util
+from benchmarking import Timer
+from open_mfdataset import generate_tree, open_fast
+
+
+def read_box(dataset):
+    data = dataset.temp_mm_dpth
+    box = {"longitude": util.range_to_slice(data.longitude.values, 280, 360),
+           "latitude": util.range_to_slice(data.latitude.values, 0, 70), "depth_1": slice(0, 10)}
+    return data.isel(box).values
+
+
+if __name__ == "__main__":
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 240
+    with tempfile.TemporaryDirectory() as root:
+        print(f"Generating {n_files} files in {root}")
+        paths = generate_tree(root, n_files)
+        
+        for name, function in [("open_mfdataset", open_fast), ("lazy", util.open_concatenated)]:
+            with Timer(text=f"{name:<16}: {{:0.2f}} seconds"):
+                dataset = function(paths)
+                values = read_box(dataset)
+                dataset.close()
+        print(f"Box: {values.shape}, {values.nbytes / (n_files * 20 * 144 * 288 * 4):0.1%} of the variable.")
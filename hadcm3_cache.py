@@ -0,0 +1,307 @@
+import pylaeoclim_leeds.processing as proc
+import pylaeoclim_leeds.util_hadcm3 as util
+import numpy as np
+import xarray as xr
+import cftime
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import time
+import types
+
+default_path = str(pathlib.Path(__file__).parent.absolute()) + "/resources/hadcm3_cache/"
+# Above this number of source files, the entries are validated against the directories of the files.
+MAX_SOURCE_FILES = 16
+
+# Attributes of GeoDataArray saved with the data.
+COORDINATES = ["lon", "lat", "z", "lonb", "latb", "zb", "lons", "lats", "zs", "lon_p", "lat_p", "z_p",
+               "lonb_p", "latb_p", "zb_p", "lons_p", "lats_p", "zs_p", "t_days"]
+PARAMETERS = ["proc_lon", "proc_lat", "proc_z", "start_year", "end_year", "months", "quantiles"]
+
+
+class HadCM3ResultCache:
+    """
+    On-disk cache of the GeoDataArrays returned by HadCM3DS.get, with their coordinates.
+    The entries are keyed by the experiment, the dataset, the variable, the zone, the modes and values, the crops and
+    the transform, and stored as compressed .npz files.
+    An entry is invalidated when its sources change (see sources). The least recently used entries are removed when the
+    cache grows larger than max_size.
+    The results of the transforms which can't be keyed (see transform_key) are not cached.
+    
+    To use the cache in the datasets: hadcm3_processing.HadCM3DS.RESULT_CACHE = HadCM3ResultCache()
+    """
+    
+    def __init__(self, path=default_path, max_size=2e9, verbose=True):
+        """
+        Parameters
+        ----------
+        path: string
+            Directory of the cache. Created if it doesn't exist.
+        max_size: float
+            Size budget of the cache in bytes.
+        verbose: bool
+            Print the hits and the evictions.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.verbose = verbose
+        os.makedirs(path, exist_ok=True)
+    
+    # INDEX
+    
+    def load_index(self):
+        try:
+            with open(f"{self.path}index.json") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+    
+    def save_index(self, index):
+        try:
+            write_atomically(f"{self.path}index.json", lambda f: json.dump(index, f, indent=1))
+        except OSError as error:
+            print(f"!!!! The index of the cache could not be saved in {self.path}: {error}")
+    
+    def remove(self, index, key):
+        index.pop(key, None)
+        try:
+            os.remove(f"{self.path}{key}.npz")
+        except OSError:
+            pass
+    
+    def clear(self):
+        index = self.load_index()
+        for key in list(index.keys()):
+            self.remove(index, key)
+        self.save_index(index)
+    
+    # KEYS
+    
+    @staticmethod
+    def key(ds, data, zone, modes, crops, transform):
+        """
+        Key of a call of get.
+        :param ds: HadCM3DS
+        :param data: DataArray given to get
+        :param zone: zones.Zone
+        :param modes: [mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t, mode_horizontal]
+        :param crops: [new_start_year, new_end_year, new_month_list]
+        :param transform: function given to get
+        :return: hexadecimal string, None if the transform can't be keyed
+        """
+        transform_description = transform_key(transform) if transform is not None else None
+        if transform is not None and transform_description is None:
+            return None
+        variable = hashlib.sha1()
+        for name, coordinate in data.coords.items():
+            values = coordinate.values
+            variable.update(name.encode())
+            variable.update(str(values.tolist()).encode() if values.dtype.hasobject else values.tobytes())
+        description = {"exp_name": ds.exp_name, "dataset": type(ds).__name__, "paths": ds.paths,
+                       "start_year": ds.start_year, "end_year": ds.end_year, "months": ds.months,
+                       "variable": [data.name, data.dims, data.shape, variable.hexdigest()],
+                       "zone": [type(zone).__name__, {name: value for name, value in vars(zone).items()
+                                                      if name != "verbose"}],
+                       "modes": modes, "crops": crops,
+                       "transform": transform_description}
+        return hashlib.sha1(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+    
+    @staticmethod
+    def sources(ds):
+        """
+        Modification times and sizes of the files of a dataset, or of their directories if there are more than
+        MAX_SOURCE_FILES of them: the raw datasets gather thousands of monthly files. Adding or removing a file changes
+        its directory, rewriting it in place may not: clear the cache after rewriting raw files.
+        """
+        paths = ds.paths if len(ds.paths) <= MAX_SOURCE_FILES else sorted({os.path.dirname(path) for path in ds.paths})
+        sources = dict()
+        for path in paths:
+            stat = os.stat(path)
+            sources[path] = [stat.st_mtime, stat.st_size]
+        return sources
+    
+    # LOAD AND STORE
+    
+    def load(self, key, ds):
+        """
+        GeoDataArray saved under a key, None if it is missing or out of date.
+        """
+        start = time.time()
+        index = self.load_index()
+        entry = index.get(key)
+        if entry is None:
+            return None
+        try:
+            if entry["sources"] != self.sources(ds):
+                raise ValueError("Out of date.")
+            with np.load(f"{self.path}{key}.npz", allow_pickle=False) as npz:
+                meta = json.loads(str(npz["meta"]))
+                coords = {name: (dims, decode(npz[f"coord_{name}"], kind))
+                          for name, (dims, kind) in meta["coords"].items()}
+                data_array = xr.DataArray(npz["data"], dims=meta["dims"], coords=coords, name=meta["name"],
+                                          attrs=meta["attrs"])
+                geo_da = proc.GeoDataArray(data_array, ds=ds, process=ds.process)
+                geo_da.data = data_array  # Nothing left to execute.
+                for name, kind in meta["coordinates"].items():
+                    setattr(geo_da, name, None if kind is None else decode(npz[name], kind))
+                if meta.get("mask_dims") is not None:
+                    geo_da.data_mask = xr.DataArray(npz["data_mask"], dims=meta["mask_dims"],
+                                                    coords={dim: data_array[dim] for dim in meta["mask_dims"]
+                                                            if dim in data_array.coords})
+        except (OSError, ValueError, KeyError) as error:
+            if self.verbose: print(f"____ Cache entry {key} dropped: {error}")
+            self.remove(index, key)
+            self.save_index(index)
+            return None
+        for name in PARAMETERS:
+            setattr(geo_da, name, meta["parameters"].get(name))
+        
+        entry["last_access"] = time.time()
+        self.save_index(index)
+        if self.verbose: print(f"____ Loaded from the cache in {time.time() - start} s.")
+        return geo_da
+    
+    def store(self, key, geo_da, ds):
+        """
+        Save a GeoDataArray under a key. Its selections and reductions are executed.
+        """
+        data_array = geo_da.data
+        arrays, coords, coordinates = dict(), dict(), dict()
+        for name, coordinate in data_array.coords.items():
+            arrays[f"coord_{name}"], kind = encode(coordinate.values)
+            coords[name] = [coordinate.dims, kind]
+        for name in COORDINATES:
+            value = getattr(geo_da, name)
+            if value is None:
+                coordinates[name] = None
+            else:
+                arrays[name], coordinates[name] = encode(value)
+        if geo_da.data_mask is not None:
+            # Land-sea mask of the data (see processing.LSM).
+            arrays["data_mask"] = np.asarray(geo_da.data_mask.values)
+        meta = {"name": data_array.name, "dims": data_array.dims, "attrs": json_attributes(data_array.attrs),
+                "coords": coords, "coordinates": coordinates,
+                "mask_dims": None if geo_da.data_mask is None else geo_da.data_mask.dims,
+                "parameters": {name: json_value(getattr(geo_da, name)) for name in PARAMETERS}}
+        
+        try:
+            write_atomically(f"{self.path}{key}.npz",
+                             lambda f: np.savez_compressed(f, data=np.asarray(data_array.values),
+                                                           meta=np.array(json.dumps(meta)), **arrays), mode="wb")
+        except OSError as error:
+            print(f"!!!! The result could not be saved in the cache {self.path}: {error}")
+            return
+        
+        index = self.load_index()
+        index[key] = {"sources": self.sources(ds), "size": os.path.getsize(f"{self.path}{key}.npz"),
+                      "last_access": time.time()}
+        self.evict(index)
+        self.save_index(index)
+    
+    def evict(self, index):
+        size = sum(entry["size"] for entry in index.values())
+        for key in sorted(index.keys(), key=lambda k: index[k]["last_access"]):
+            if size <= self.max_size:
+                break
+            size -= index[key]["size"]
+            if self.verbose: print(f"____ Cache entry {key} evicted.")
+            self.remove(index, key)
+
+
+def write_atomically(path, write, mode="w"):
+    """
+    Write a file through a temporary file of its own in the same directory, renamed once complete: concurrent writers
+    don't write in the same file and the readers never see a partial one.
+    :param write: function writing the content in the open temporary file
+    """
+    f = None
+    try:
+        with tempfile.NamedTemporaryFile(mode, dir=os.path.dirname(path) or ".", suffix=".tmp", delete=False) as f:
+            write(f)
+        os.replace(f.name, path)
+    except BaseException:
+        if f is not None and os.path.exists(f.name):
+            os.remove(f.name)
+        raise
+
+
+def transform_key(transform):
+    """
+    Description of a transform for the keys: the code of the functions, their constants, defaults, closures and the
+    global values they use, so that two lambdas or two closures with different cells get different keys.
+    :return: string, None if a value can't be described (the result is then not cached)
+    """
+    description = value_key(transform, set())
+    return None if description is None else hashlib.sha1(description.encode()).hexdigest()
+
+
+def value_key(value, seen):
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes, np.generic)):
+        return repr(value)
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return None
+        return f"array{value.shape}{value.dtype}{hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest()}"
+    if isinstance(value, (list, tuple)):
+        items = [value_key(item, seen) for item in value]
+        return None if None in items else f"{type(value).__name__}({', '.join(items)})"
+    if isinstance(value, dict):
+        items = [(value_key(name, seen), value_key(item, seen)) for name, item in sorted(value.items(), key=str)]
+        return None if any(None in item for item in items) else f"dict({items})"
+    if isinstance(value, types.ModuleType):
+        return f"module {value.__name__}"
+    if isinstance(value, (type, types.BuiltinFunctionType, np.ufunc)):
+        name = value.__qualname__ if isinstance(value, type) else value.__name__
+        return f"{getattr(value, '__module__', None)}.{name}"
+    if isinstance(value, types.CodeType):
+        constants = [value_key(constant, seen) for constant in value.co_consts]
+        return None if None in constants else f"code({value.co_code.hex()}, {constants}, {value.co_names})"
+    if isinstance(value, types.FunctionType):
+        if id(value) in seen:
+            # Recursive function: described once.
+            return f"function {value.__qualname__}"
+        seen.add(id(value))
+        cells = [value_key(cell.cell_contents, seen) for cell in value.__closure__ or []]
+        used = {name: value.__globals__[name] for name in value.__code__.co_names if name in value.__globals__}
+        parts = [value_key(value.__code__, seen), value_key(value.__defaults__, seen),
+                 value_key(value.__kwdefaults__, seen), value_key(used, seen)] + cells
+        return None if None in parts else f"function({', '.join(parts)})"
+    return None
+
+
+def encode(value):
+    """
+    Numeric array and kind of a coordinate: the times are saved in days (see util.t_to_days).
+    """
+    array = np.asarray(value)
+    if array.dtype.hasobject and array.size > 0 and isinstance(array.flat[0], cftime.datetime):
+        return util.t_to_days(array).reshape(array.shape), "time"
+    return array, "array"
+
+
+def decode(array, kind):
+    if kind == "time":
+        return cftime.num2date(array, util.DAYS_UNITS, calendar="360_day")
+    return array[()] if array.ndim == 0 else array
+
+
+def json_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [json_value(item) for item in value]
+    return value
+
+
+def json_attributes(attrs):
+    attributes = dict()
+    for name, value in attrs.items():
+        value = value.tolist() if isinstance(value, (np.ndarray, np.generic)) else value
+        try:
+            json.dumps(value)
+            attributes[name] = value
+        except TypeError:
+            attributes[name] = str(value)
+    return attributes
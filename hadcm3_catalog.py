@@ -0,0 +1,181 @@
+import pylaeoclim_leeds.util_hadcm3 as util
+import os
+import re
+import time
+import pathlib
+import sqlite3
+
+input_file = util.generate_input(str(pathlib.Path(__file__).parent.absolute()) + "/resources/hadcm3_input")
+default_path = str(pathlib.Path(__file__).parent.absolute()) + "/resources/hadcm3_catalog.sqlite"
+
+# Sub-directories of the dump path containing the raw streams.
+RAW_DIRECTORIES = ['pcpd', 'pf', 'pg']
+# {expt_id}a#pc000000012ja+.nc, {expt_id}o#pg000000012c1+.nc, ...
+RAW_FILE = re.compile(r"^(?P<expt_id>.+)[ao]#(?P<stream>p[a-z])(?P<year>\d{9})(?P<month>[a-z][a-z0-9])\+\.nc$")
+# {exp_name}.oceantemppg.annual.nc, {exp_name}.sst.monthly.nc, ...
+TS_FILE = re.compile(r"^(?P<exp_name>[^.]+)\.(?P<file_name>.+\.(monthly|annual))\.nc$")
+
+
+class HadCM3Catalog:
+    """
+    On-disk SQLite catalog of the files available for the experiments listed in resources/hadcm3_input.
+    Records which raw stream files (pc, pd, pf, pg) exist for which years and months and which time series
+    (*.monthly.nc, *.annual.nc) exist, with their modification times.
+    The directories are scanned once. refresh only rescans the directories modified since the last scan: a file
+    rewritten in place, which may leave the modification time of its directory unchanged, needs refresh(full=True).
+    
+    To use the catalog in the datasets: hadcm3_processing.HadCM3DS.CATALOG = HadCM3Catalog()
+    """
+    
+    def __init__(self, path=default_path, experiments=None, verbose=True):
+        """
+        Parameters
+        ----------
+        path: string
+            Path of the SQLite file. Created if it doesn't exist.
+        experiments: list
+            Experiments to scan. All the experiments of the input file if None.
+        verbose: bool
+            Print the scanned directories.
+        """
+        self.path = path
+        self.verbose = verbose
+        self.connection = sqlite3.connect(path)
+        self.create_tables()
+        self.refresh(experiments)
+    
+    def create_tables(self):
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS directories (
+                exp_name TEXT, directory TEXT, mtime REAL, PRIMARY KEY (exp_name, directory));
+            CREATE TABLE IF NOT EXISTS raw_files (
+                exp_name TEXT, stream TEXT, year INTEGER, month TEXT, directory TEXT, path TEXT, mtime REAL,
+                PRIMARY KEY (exp_name, stream, year, month));
+            CREATE INDEX IF NOT EXISTS raw_files_directory ON raw_files (exp_name, directory);
+            CREATE TABLE IF NOT EXISTS time_series (
+                exp_name TEXT, file_name TEXT, directory TEXT, path TEXT, mtime REAL,
+                PRIMARY KEY (exp_name, file_name));
+        """)
+        self.connection.commit()
+    
+    def close(self):
+        self.connection.close()
+    
+    # SCAN
+    
+    def refresh(self, experiments=None, full=False):
+        """
+        Scan the directories of the experiments which changed since the last scan.
+        The files of the rescanned directories are stat'ed: the new and modified ones are updated and the deleted ones
+        are removed.
+        :param experiments: experiments to scan. All the experiments of the input file if None.
+        :param full: if True, rescan all the directories and all the files.
+        :return:
+        """
+        start = time.time()
+        experiments = input_file.keys() if experiments is None else experiments
+        for exp_name in experiments:
+            try:
+                expt_id, dump_path, ts_path = input_file[exp_name][0:3]
+            except (KeyError, ValueError) as error:
+                print(f"!!!! {exp_name} was not found in the input file or is incomplete. It was not scanned.")
+                raise error
+            for directory in RAW_DIRECTORIES:
+                self.scan_directory(exp_name, f"{dump_path}{directory}/", self.raw_entry(expt_id), "raw_files",
+                                    full)
+            self.scan_directory(exp_name, ts_path, self.ts_entry(exp_name), "time_series", full)
+        self.connection.commit()
+        if self.verbose: print(f"____ Catalog refreshed in {time.time() - start} s.")
+    
+    @staticmethod
+    def raw_entry(expt_id):
+        def entry(name):
+            match = RAW_FILE.match(name)
+            if match is None or match.group("expt_id") != expt_id:
+                return None
+            return match.group("stream"), int(match.group("year")), match.group("month")
+        
+        return entry
+    
+    @staticmethod
+    def ts_entry(exp_name):
+        def entry(name):
+            match = TS_FILE.match(name)
+            if match is None or match.group("exp_name") != exp_name:
+                return None
+            return match.group("file_name"),
+        
+        return entry
+    
+    def scan_directory(self, exp_name, directory, entry, table, full):
+        try:
+            mtime = os.stat(directory).st_mtime
+        except OSError:
+            if self.verbose: print(f"____ {directory} was not found. Skipped.")
+            return
+        
+        row = self.connection.execute("SELECT mtime FROM directories WHERE exp_name = ? AND directory = ?",
+                                      (exp_name, directory)).fetchone()
+        if row is not None and row[0] == mtime and not full:
+            return
+        
+        if self.verbose: print(f"____ Scanning {directory}")
+        known = dict() if full else \
+            {path: file_mtime for path, file_mtime in
+             self.connection.execute(f"SELECT path, mtime FROM {table} WHERE exp_name = ? AND directory = ?",
+                                     (exp_name, directory))}
+        present, rows = set(), []
+        with os.scandir(directory) as iterator:
+            for dir_entry in iterator:
+                key = entry(dir_entry.name)
+                if key is None:
+                    continue
+                present.add(dir_entry.path)
+                file_mtime = dir_entry.stat().st_mtime
+                if known.get(dir_entry.path) != file_mtime:
+                    rows.append((exp_name, *key, directory, dir_entry.path, file_mtime))
+        
+        if full:
+            self.connection.execute(f"DELETE FROM {table} WHERE exp_name = ? AND directory = ?", (exp_name, directory))
+        else:
+            self.connection.executemany(f"DELETE FROM {table} WHERE path = ?",
+                                        [(path,) for path in known.keys() - present])
+        columns = "?, ?, ?, ?, ?, ?, ?" if table == "raw_files" else "?, ?, ?, ?, ?"
+        self.connection.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({columns})", rows)
+        self.connection.execute("INSERT OR REPLACE INTO directories VALUES (?, ?, ?)", (exp_name, directory, mtime))
+    
+    # QUERIES
+    
+    def has_stream(self, exp_name, stream):
+        return self.connection.execute("SELECT 1 FROM raw_files WHERE exp_name = ? AND stream = ? LIMIT 1",
+                                       (exp_name, stream)).fetchone() is not None
+    
+    def valid_range(self, exp_name, stream):
+        """
+        First and last years available for a raw stream.
+        :return: (start_year, end_year), (None, None) if the stream was not found.
+        """
+        return self.connection.execute("SELECT MIN(year), MAX(year) FROM raw_files WHERE exp_name = ? AND stream = ?",
+                                       (exp_name, stream)).fetchone()
+    
+    def raw_paths(self, exp_name, stream, start_year, end_year):
+        """
+        Paths of the raw files available between two years (included).
+        :return: dictionary (year, month) -> path
+        """
+        rows = self.connection.execute("SELECT year, month, path FROM raw_files "
+                                       "WHERE exp_name = ? AND stream = ? AND year BETWEEN ? AND ?",
+                                       (exp_name, stream, int(start_year), int(end_year)))
+        return {(year, month): path for year, month, path in rows}
+    
+    def time_series(self, exp_name, file_name):
+        """
+        Path of a time series file, None if it was not found.
+        """
+        row = self.connection.execute("SELECT path FROM time_series WHERE exp_name = ? AND file_name = ?",
+                                      (exp_name, file_name)).fetchone()
+        return row[0] if row is not None else None
+    
+    def has_experiment(self, exp_name):
+        return self.connection.execute("SELECT 1 FROM directories WHERE exp_name = ? LIMIT 1",
+                                       (exp_name,)).fetchone() is not None
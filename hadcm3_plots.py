@@ -51,11 +51,11 @@ class OcnTtz(plots.PlotTemplate):
         figMap.subplots_adjust(left=None, bottom=None, right=None, top=None, wspace=None, hspace=0.01)
         # figMap.tight_layout()
         
-        pc_up = axUp.pcolormesh(years, temp_up.z, np.transpose(temp_up.values(processing=False)), cmap="RdYlBu_r",
+        pc_up = axUp.pcolormesh(years, temp_up.z, np.transpose(values_up), cmap="RdYlBu_r",
                                 norm=norm)
         axUp.axes.xaxis.set_visible(False)
         
-        pc_down = axDown.pcolormesh(years, temp_down.z, np.transpose(temp_down.values(processing=False)),
+        pc_down = axDown.pcolormesh(years, temp_down.z, np.transpose(values_down),
                                     cmap="RdYlBu_r", norm=norm)
         axDown.ticklabel_format(style="sci")
         axDown.set_xlabel("Simulation Years")
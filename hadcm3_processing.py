@@ -4,13 +4,18 @@ import numpy as np
 import xarray as xr
 import pylaeoclim_leeds.util_hadcm3 as util
 import abc
-import cftime
 import os
 import time
 import pathlib
-import netCDF4
+import json
+import hashlib
 
 input_file = util.generate_input(str(pathlib.Path(__file__).parent.absolute()) + "/resources/hadcm3_input")
+time_extents = util.TimeExtentCache(str(pathlib.Path(__file__).parent.absolute()) + "/resources/time_extents.json")
+default_lsm_path = str(pathlib.Path(__file__).parent.absolute()) + "/resources/hadcm3_lsm/"
+# Paddings of the latitudes of the ocean grids (see util.pad): the last latitude row is replaced by the previous one.
+OCEAN_LATITUDES = {"latitude": lambda n: np.r_[0:n - 1, n - 2, n - 2],
+                   "latitudeb": lambda n: np.r_[0, 0:n - 1, n - 2, n - 2]}
 
 
 class HadCM3DS(proc.ModelDS):
@@ -22,6 +27,13 @@ class HadCM3DS(proc.ModelDS):
     
     # Default month_list in HadCM3.
     MONTHS = ['ja', 'fb', 'mr', 'ar', 'my', 'jn', 'jl', 'ag', 'sp', 'ot', 'nv', 'dc']
+    # hadcm3_catalog.HadCM3Catalog used to validate the ranges and generate the paths. Filesystem calls if None.
+    CATALOG = None
+    # hadcm3_cache.HadCM3ResultCache used to save and reload the results of get. Not cached if None.
+    RESULT_CACHE = None
+    # Directory of the land-sea masks (see HadCM3LSM), such as default_lsm_path. The zeros are masked if None, and in
+    # the datasets without ocean levels (see ocean_levels).
+    LSM_PATH = None
     
     def __init__(self, exp_name, start_year, end_year, month_list, chunks, verbose, debug, logger):
         """
@@ -53,6 +65,8 @@ class HadCM3DS(proc.ModelDS):
         self.start_year, self.end_year = start_year, end_year
         self.months = month_list
         self.chunks = chunks
+        # Results of climatology and seasonal_means.
+        self.climatologies = dict()
         # Import data or sample data.
         self.import_data()
         # Import available coordinates and compute the others
@@ -66,7 +80,7 @@ class HadCM3DS(proc.ModelDS):
         pass
     
     def processed_time(self, new_start_year=None):
-        return np.linspace(0, self.end_year - self.start_year, len(self.t)) + \
+        return np.linspace(0, self.end_year - self.start_year, len(self.t_days)) + \
                (new_start_year if new_start_year is not None else self.start_year)
     
     @abc.abstractmethod
@@ -77,23 +91,56 @@ class HadCM3DS(proc.ModelDS):
     def import_coordinates(self):
         print("____ Coordinates imported in the HadCM3DS dataset.")
     
+    def set_coordinates(self, family):
+        """
+        Set a coordinate family from the grid registry (util.grid_axis, util.grid_levels). The arrays are shared
+        with the other datasets on the same grid: they are read-only.
+        """
+        for name, coordinate in family.items():
+            setattr(self, name, coordinate)
+    
     def get(self, data, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None,
             mode_z=None, value_z=None, mode_t=None, value_t=None, new_start_year=None, new_end_year=None,
-            new_month_list=None):
+            new_month_list=None, transform=None, mode_horizontal=None):
+        """
+        Parameters
+        ----------
+        transform: function
+            Applied to the data after the selections and before the reductions, such as a unit conversion.
+            Applying it to the data before get would read all of it.
+        mode_horizontal: string
+            "area_mean" or "area_sum": single reduction of the longitude and the latitude weighted by the surfaces of
+            the cells inside the zone (see GeoDataArray.get_horizontal). Also accepted as mode_lon, mode_lat is then
+            ignored. "volume_mean": single reduction of the longitude, the latitude and z weighted by the volumes of
+            the cells, also accepted as mode_z, mode_lon and mode_lat are then ignored.
+        """
+        
+        if mode_lon in ["area_mean", "area_sum"]:
+            mode_horizontal, mode_lon, mode_lat = mode_lon, None, None
+        if mode_z == "volume_mean":
+            mode_horizontal, mode_lon, mode_lat, mode_z = mode_z, None, None, None
+        
+        key = None
+        if self.RESULT_CACHE is not None:
+            key = self.RESULT_CACHE.key(self, data, zone,
+                                        [mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t,
+                                         mode_horizontal, self.LSM_PATH is not None],
+                                        [new_start_year, new_end_year, new_month_list], transform)
+            geo_da = self.RESULT_CACHE.load(key, self) if key is not None else None
+            if geo_da is not None:
+                self.truncate_t(mode_t, new_start_year, new_end_year, new_month_list)
+                return geo_da
         
         start = time.time()
-        geo_da = proc.GeoDataArray(data, ds=self, process=self.process)  # add the GeoDataArray wrapper
+        geo_da = proc.GeoDataArray(data, ds=self, process=self.process, transform=transform)
+        geo_da.lsm = self.land_sea_mask()
         if self.debug: print(f"** Time elapsed for creating GeoDataArray : {time.time() - start}")
         
         start = time.time()
-        geo_da = zone.compact(geo_da)
+        geo_da = zone.compact(geo_da, overlap=mode_horizontal is not None)
         if self.debug: print(f"** Time elapsed to compact the zone : {time.time() - start}")
         
-        if any([new_start_year is not None, new_end_year is not None, new_month_list is not None]) and mode_t is None:
-            print("____ Truncation to new time coordinates.")
-            self.t = [cftime.Datetime360Day(year, month, 1)
-                      for year in np.arange(int(new_start_year), int(new_end_year) + 1)
-                      for month in util.months_to_number(new_month_list)]
+        self.truncate_t(mode_t, new_start_year, new_end_year, new_month_list)
         try:
             start = time.time()
             if new_start_year is not None and new_start_year < self.start_year:
@@ -127,6 +174,12 @@ class HadCM3DS(proc.ModelDS):
             print(error)
             print("____ The crop was not performed.")
         
+        start = time.time()
+        ranges = zone.ranges()
+        geo_da.get_horizontal(mode_horizontal,
+                              [*ranges.get("longitude", [None] * 2), *ranges.get("latitude", [None] * 2)])
+        if self.debug: print(f"* Time elapsed for get_horizontal: {time.time() - start}")
+        
         start = time.time()
         geo_da.get_lon(mode_lon, value_lon)
         if self.debug: print(f"* Time elapsed for get_lon: {time.time() - start}")
@@ -143,10 +196,128 @@ class HadCM3DS(proc.ModelDS):
         geo_da.get_t(mode_t, value_t)
         if self.debug: print(f"* Time elapsed for get_t: {time.time() - start}")
         
-        # Rebuilding the data:
-        if self.chunks is not None:
-            print("____ Rebuilding the data_array")
-            geo_da.data.load()
+        if key is not None:
+            start = time.time()
+            self.RESULT_CACHE.store(key, geo_da, self)
+            if self.debug: print(f"* Time elapsed for saving in the cache: {time.time() - start}")
+        
+        # The selections and reductions are executed (and the data rebuilt if chunked) when geo_da.data is accessed.
+        return geo_da
+    
+    def truncate_t(self, mode_t, new_start_year, new_end_year, new_month_list):
+        if any([new_start_year is not None, new_end_year is not None, new_month_list is not None]) and mode_t is None:
+            print("____ Truncation to new time coordinates.")
+            self.t_days = util.dates_to_days(
+                np.arange(int(new_start_year if new_start_year is not None else self.start_year),
+                          int(new_end_year if new_end_year is not None else self.end_year) + 1),
+                util.months_to_number(new_month_list if new_month_list is not None else
+                                      self.months if self.months is not None else [6]))
+    
+    def land_sea_mask(self):
+        """
+        Land-sea mask of the experiment on the grid of the ocean levels of the dataset (see HadCM3LSM). It is applied
+        to the variables on this grid only (see proc.LSM.mask).
+        :return: HadCM3LSM, None if LSM_PATH is None or if the dataset has no ocean levels
+        """
+        if self.LSM_PATH is None:
+            return None
+        levels = self.ocean_levels()
+        return HadCM3LSM.get(self.exp_name, levels, self.LSM_PATH) if levels is not None else None
+    
+    def ocean_levels(self):
+        """
+        3D ocean variable of the dataset, on (t, zb, latitude, longitude), whose filled levels give the depth of the
+        ocean (see proc.LSM.from_levels). None if the dataset has none, such as the atmosphere datasets.
+        """
+        return None
+    
+    def climatology(self, variable, zone=zones.NoZone(), **kwargs):
+        """
+        Mean of each month of the year of a variable, computed in a single pass over the data, block of years by block
+        of years (see GeoDataArray.stream_t). The results are kept in the dataset: the same GeoDataArray is returned
+        for the same arguments.
+        
+        Parameters
+        ----------
+        variable: string
+            Method of the dataset returning the variable, such as "sst" or "temperature".
+        zone: zones.Zone
+            Zone of the climatology.
+        kwargs:
+            Other arguments of the method, such as mode_lon or new_start_year, except mode_t and value_t.
+        
+        Returns
+        -------
+        GeoDataArray with a month dimension (1 to 12) instead of t
+        """
+        return self.group_means(variable, "climatology", zone, kwargs)
+    
+    def seasonal_means(self, variable, zone=zones.NoZone(), **kwargs):
+        """
+        Mean of each season (djf, mam, jja, son, see util.SEASONS) of a variable, as climatology. Each winter gathers
+        the december of the year before: the incomplete winters at the edges of the years are left out.
+        
+        Returns
+        -------
+        GeoDataArray with a season dimension instead of t
+        """
+        return self.group_means(variable, "seasons", zone, kwargs)
+    
+    def group_means(self, variable, mode_t, zone, kwargs):
+        key = json.dumps([variable, mode_t, type(zone).__name__,
+                          {name: value for name, value in vars(zone).items() if name != "verbose"}, kwargs],
+                         sort_keys=True, default=str)
+        if key not in self.climatologies:
+            self.climatologies[key] = getattr(self, variable)(zone=zone, mode_t=mode_t, **kwargs)
+        return self.climatologies[key]
+    
+    def integrate(self, data, zone=zones.NoZone(), dimensions="all", factor=1, transform=None):
+        """
+        Integral of a 3D ocean field over the volume of its cells, in a zone and along some dimensions.
+        The volumes are broadcast against the data without being tiled, and a large series is integrated block of years
+        by block of years (see GeoDataArray.stream_t): the memory doesn't grow with the number of years. With chunks,
+        the blocks are integrated in parallel by dask.
+        
+        Parameters
+        ----------
+        data: DataArray
+            Field on the dimensions longitude, latitude and zb (and t).
+        zone: zones.Zone
+            Zone to integrate over.
+        dimensions: string or list
+            Dimensions to integrate over, "all" for a single total.
+        factor: float
+            Multiplies the volumes, such as a density.
+        transform: function
+            Applied to the data before the integral, such as a unit conversion.
+        
+        Returns
+        -------
+        GeoDataArray
+        """
+        
+        geo_da = proc.GeoDataArray(data, ds=self, process=self.process, transform=transform)
+        geo_da.lsm = self.land_sea_mask()
+        coordinates = [geo_da.coordinate(dim).values for dim in ["longitude", "latitude", "zb"]]
+        volumes = xr.DataArray(util.volume_matrix(*coordinates) * factor, dims=["latitude", "longitude", "zb"],
+                               coords={"latitude": coordinates[1], "longitude": coordinates[0], "zb": coordinates[2]})
+        geo_da = zone.compact(geo_da)
+        
+        dimensions = geo_da.dims if dimensions == "all" else dimensions
+        if any([dimension not in geo_da.dims for dimension in dimensions]):
+            raise KeyError(f"This coordinate was not recognized. Available coordinates: {geo_da.dims}")
+        print(f"____ Integrating over dimensions: {', '.join(dimensions)}")
+        geo_da.integrate(volumes, dimensions)
+        
+        # Update coordinates:
+        if "longitude" in dimensions:
+            geo_da.update_lon(mode_lon="sum", value_lon=None)
+        if "latitude" in dimensions:
+            geo_da.update_lat(mode_lat="sum", value_lat=None)
+        if "zb" in dimensions:
+            geo_da.update_z(mode_z="sum", value_z=None)
+        if "t" in dimensions:
+            geo_da.update_t(mode_t="sum", value_t=None)
         
         return geo_da
 
@@ -157,34 +328,117 @@ class HadCM3DS(proc.ModelDS):
 
 class HadCM3RDS(HadCM3DS):
     
-    def __init__(self, exp_name, start_year, end_year, file_name, month_list, chunks, verbose, debug, logger):
+    def __init__(self, exp_name, start_year, end_year, file_name, month_list, chunks, verbose, debug, logger,
+                 open_mode="lazy", parallel=False):
+        """
+        Parameters
+        ----------
+        open_mode: string
+            "lazy" concatenates the generated paths along t in their (chronological) order without reading the data:
+            the zone, year and month selections of get are pushed down to the files, so that only the selected
+            hyperslabs are read. The chunks are applied after the selection. The files which don't share the layout of
+            the first one (time steps, variables along t) are opened as in the "fast" mode instead.
+            "fast" concatenates them with open_mfdataset, without comparing the coordinates shared by the files.
+            "by_coords" lets xarray infer the order from the coordinates.
+        parallel: bool
+            If True, open and preprocess the files in parallel with dask.
+        """
         self.sample_data = None
         self.file_name = file_name
+        self.stream = file_name.split("#")[-1]
         self.paths = []
+        # (year, month) of each path.
+        self.dates = []
+        self.open_mode = open_mode
+        self.parallel = parallel
+        self._data = None
         super(HadCM3RDS, self).__init__(exp_name, start_year, end_year, month_list, chunks, verbose, debug, logger)
     
+    def __del__(self):
+        self.release_data()
+    
+    @property
+    def data(self):
+        """
+        Multi-file dataset shared by all the variable accessors.
+        Opened lazily on first access and kept in cache until release_data is called.
+        """
+        if self._data is None:
+            if self.debug: start = time.time()
+            self._data = self.open_data()
+            if self.debug: print(f"* Time elapsed for open_mfdataset : {time.time() - start}")
+        return self._data
+    
+    def open_data(self):
+        chunks = {"t": self.chunks} if self.chunks is not None else None
+        if self.open_mode == "lazy":
+            # The times are built from the dates of the paths: only the first and last files are opened.
+            data = util.open_concatenated(self.paths, dim='t', dates=[
+                (int(year), 1 if month == "c1" else util.months_to_number([month])[0]) for year, month in self.dates])
+            if data is not None:
+                return data
+            print("____ The files can't be concatenated lazily: they are opened with open_mfdataset.")
+        if self.open_mode in ["lazy", "fast"]:
+            # One file per year/month, generated in time order: nothing to infer or to compare between files.
+            return xr.open_mfdataset(self.paths, combine='nested', concat_dim='t', data_vars='minimal',
+                                     coords='minimal', compat='override', join='override', parallel=self.parallel,
+                                     chunks=chunks)
+        elif self.open_mode == "by_coords":
+            return xr.open_mfdataset(self.paths, combine='by_coords', parallel=self.parallel, chunks=chunks)
+        else:
+            raise ValueError(f"!!!! Open mode {self.open_mode} wasn't recognized. "
+                             f"Available modes: lazy, fast, by_coords.")
+    
+    def release_data(self):
+        """
+        Close the files held by the cached dataset. It will be reopened on the next access.
+        """
+        if getattr(self, "_data", None) is not None:
+            self._data.close()
+            self._data = None
+    
     def import_data(self):
         print(f"__ Importing {type(self)}")
         print(f"____ Paths generated for {self.exp_name} between years {self.start_year} and {self.end_year}.")
         
-        # ADD A METHOD TO CHECK THE VALID RANGE
-        
         start = time.time()
         try:
             if self.debug: start = time.time()
             path = input_file[self.exp_name][1]
             if self.months is not None:
-                self.paths = [f"{path}{self.file_name}{year:09d}{month}+.nc"
-                              for year in np.arange(int(self.start_year), int(self.end_year) + 1)
-                              for month in self.months]
+                dates = [(year, month) for year in np.arange(int(self.start_year), int(self.end_year) + 1)
+                         for month in self.months]
             else:
-                self.paths = [f"{path}{self.file_name}{year:09d}c1+.nc"
-                              for year in np.arange(int(self.start_year), int(self.end_year) + 1)]
-            for path in self.paths:
-                if not os.path.isfile(path):
-                    raise FileNotFoundError(f"** {path} was not found. Data import aborted.")
+                dates = [(year, "c1") for year in np.arange(int(self.start_year), int(self.end_year) + 1)]
+            self.dates = dates
+            
+            if self.CATALOG is not None and self.CATALOG.has_stream(self.exp_name, self.stream):
+                available = self.CATALOG.raw_paths(self.exp_name, self.stream, self.start_year, self.end_year)
+                if any(date not in available for date in dates):
+                    # New model years may have been written since the last scan.
+                    self.CATALOG.refresh([self.exp_name])
+                    available = self.CATALOG.raw_paths(self.exp_name, self.stream, self.start_year, self.end_year)
+                self.paths = [available.get((year, month), f"{path}{self.file_name}{year:09d}{month}+.nc")
+                              for year, month in dates]
+                missing = {path for (year, month), path in zip(dates, self.paths) if (year, month) not in available}
+                if self.debug: print(f"* Time elapsed for querying the catalog : {time.time() - start}")
+            else:
+                self.paths = [f"{path}{self.file_name}{year:09d}{month}+.nc" for year, month in dates]
+                if self.debug: print(f"* Time elapsed for creating paths : {time.time() - start}")
+                if self.debug: start = time.time()
+                missing = set(util.missing_files(self.paths))
+                if self.debug: print(f"* Time elapsed for checking paths : {time.time() - start}")
+            
+            if len(missing) > 0:
+                missing_dates = [f"{year}" if month == "c1" else f"{year}-{month}"
+                                 for (year, month), path in zip(dates, self.paths) if path in missing]
+                valid_start_year, valid_end_year = self.valid_range()
+                raise FileNotFoundError(f"** {len(missing)} files were not found in {path}{self.file_name}. "
+                                        f"Data import aborted.\n"
+                                        f"** Missing years/months: {', '.join(missing_dates)}\n"
+                                        f"** Valid range : start_year = {valid_start_year}, "
+                                        f"end_year = {valid_end_year}")
             print("____ Import succeeded.")
-            if self.debug: print(f"* Time elapsed for creating paths : {time.time() - start}")
         except KeyError as error:
             print("!!!! This experiment was not found in \"Experiment_to_filename\". Data import aborted.")
             raise error
@@ -198,6 +452,23 @@ class HadCM3RDS(HadCM3DS):
             print("The file was not found. Data importation aborted.")
             raise error
     
+    def valid_range(self):
+        """
+        First and last years available on disk for the stream of the dataset.
+        Queried from the catalog if available, from a listing of the stream directory otherwise.
+        :return: (start_year, end_year), (None, None) if no file was found.
+        """
+        if self.CATALOG is not None and self.CATALOG.has_stream(self.exp_name, self.stream):
+            return self.CATALOG.valid_range(self.exp_name, self.stream)
+        
+        directory, prefix = os.path.split(f"{input_file[self.exp_name][1]}{self.file_name}")
+        try:
+            years = [int(name[len(prefix):len(prefix) + 9]) for name in os.listdir(directory)
+                     if name.startswith(prefix) and name[len(prefix):len(prefix) + 9].isdigit()]
+        except OSError:
+            years = []
+        return (min(years), max(years)) if len(years) > 0 else (None, None)
+    
     def import_coordinates(self):
         super(HadCM3RDS, self).import_coordinates()
     
@@ -221,23 +492,17 @@ class ATMUPMDS(HadCM3RDS):
     """
     
     def __init__(self, exp_name, start_year, end_year, month_list=None, chunks=None, verbose=True, debug=False,
-                 logger="print"):
+                 logger="print", open_mode="lazy", parallel=False):
         month_list = HadCM3DS.MONTHS if month_list is None else month_list  # To overcome mutable argument error
         expt_id = input_file[exp_name][0]
         file_name = f"pcpd/{expt_id}a#pc"
         super(ATMUPMDS, self).__init__(exp_name, start_year, end_year, file_name=file_name, month_list=month_list,
-                                       chunks=chunks, verbose=verbose, debug=debug, logger=logger)
+                                       chunks=chunks, verbose=verbose, debug=debug, logger=logger, open_mode=open_mode,
+                                       parallel=parallel)
     
     @staticmethod
     def process(array_r, proc_lon, proc_lat, proc_z):
-        array = array_r
-        if "longitude" in array.dims and proc_lon:
-            array = xr.concat([array, array.isel(longitude=0)], dim="longitude")
-        if "longitudeb" in array.dims and proc_lon:
-            array = xr.concat([array, array.isel(longitudeb=0)], dim="longitudeb")
-        if "latitude" in array.dims and proc_lat:
-            array = xr.concat([array.isel(latitude=0), array, array.isel(latitude=-1)], dim="latitude")
-        return array.transpose(*array_r.dims)
+        return util.pad(array_r, proc_lon, proc_lat, proc_z, latitudes={"latitude": lambda n: np.r_[0, 0:n, n - 1]})
     
     def import_coordinates(self):
         self.lon, self.lonb = np.sort(self.sample_data.longitude.values), np.sort(self.sample_data.longitude_1.values)
@@ -260,9 +525,8 @@ class ATMUPMDS(HadCM3RDS):
         self.zb_p = self.zb
         self.zs_p = self.zb_p[1:] - self.zb_p[0:-1]
         
-        self.t = [cftime.Datetime360Day(year, month, 1)
-                  for year in np.arange(int(self.start_year), int(self.end_year) + 1)
-                  for month in util.months_to_number(self.months)]
+        self.t_days = util.dates_to_days(np.arange(int(self.start_year), int(self.end_year) + 1),
+                                         util.months_to_number(self.months))
         
         super(ATMUPMDS, self).import_coordinates()
     
@@ -270,8 +534,7 @@ class ATMUPMDS(HadCM3RDS):
                     mode_z=None, value_z=None, mode_t=None, value_t=None,
                     new_start_year=None, new_end_year=None, new_month_list=None):
         print("__ Importing atmosphere temperaure.")
-        return self.get(xr.open_mfdataset(
-            self.paths, combine='by_coords').temp_mm_p.rename({'p': 'z'}).rename({'longitude_1': 'longitudeb'}).
+        return self.get(self.data.temp_mm_p.rename({'p': 'z'}).rename({'longitude_1': 'longitudeb'}).
                         rename({'latitude_1': 'latitudeb'}), zone,
                         mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t,
                         new_start_year=new_start_year, new_end_year=new_end_year, new_month_list=new_month_list)
@@ -283,24 +546,17 @@ class ATMSURFMDS(HadCM3RDS):
     """
     
     def __init__(self, exp_name, start_year, end_year, month_list=None, chunks=None, verbose=True, debug=False,
-                 logger="print"):
+                 logger="print", open_mode="lazy", parallel=False):
         month_list = HadCM3DS.MONTHS if month_list is None else month_list  # To overcome mutable argument error
         expt_id = input_file[exp_name][0]
         file_name = f"pcpd/{expt_id}a#pd"
         super(ATMSURFMDS, self).__init__(exp_name, start_year, end_year, file_name=file_name, month_list=month_list,
-                                         chunks=chunks, verbose=verbose, debug=debug, logger=logger)
+                                         chunks=chunks, verbose=verbose, debug=debug, logger=logger,
+                                         open_mode=open_mode, parallel=parallel)
     
     @staticmethod
     def process(array_r, proc_lon, proc_lat, proc_z):
-        array = array_r
-        if "longitude" in array.dims and proc_lon:
-            array = xr.concat([array, array.isel(longitude=0)], dim="longitude")
-        if "longitudeb" in array.dims and proc_lon:
-            array = xr.concat([array, array.isel(longitudeb=0)], dim="longitudeb")
-        if "latitudeb" in array.dims and proc_lat:
-            array.isel(latitudeb=-1).values = array.isel(latitudeb=-2).values
-            array = xr.concat([array.isel(latitudeb=0), array, array.isel(latitudeb=-2)], dim="latitudeb")
-        return array.transpose(*array_r.dims)
+        return util.pad(array_r, proc_lon, proc_lat, proc_z, latitudes={"latitudeb": lambda n: np.r_[0, 0:n, n - 2]})
     
     def import_coordinates(self):
         self.lon, self.lonb = np.sort(self.sample_data.longitude.values), np.sort(self.sample_data.longitude_1.values)
@@ -315,9 +571,8 @@ class ATMSURFMDS(HadCM3RDS):
         self.latb_p = np.concatenate(([-90], self.latb, [2 * self.latb[-1] - self.latb[-2]]))
         self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
         
-        self.t = [cftime.Datetime360Day(year, month, 1)
-                  for year in np.arange(int(self.start_year), int(self.end_year) + 1)
-                  for month in util.months_to_number(self.months)]
+        self.t_days = util.dates_to_days(np.arange(int(self.start_year), int(self.end_year) + 1),
+                                         util.months_to_number(self.months))
         
         super(ATMSURFMDS, self).import_coordinates()
     
@@ -325,14 +580,14 @@ class ATMSURFMDS(HadCM3RDS):
             mode_t=None, value_t=None, new_start_year=None, new_end_year=None, new_month_list=None):
         print("__ Importing SAT.")
         return self.get(
-            xr.open_mfdataset(self.paths, combine='by_coords').temp_mm_srf.isel(surface=0), zone,
+            self.data.temp_mm_srf.isel(surface=0), zone,
             mode_lon, value_lon, mode_lat, value_lat, None, None, mode_t, value_t,
             new_start_year=new_start_year, new_end_year=new_end_year, new_month_list=new_month_list)
     
     def u_wind(self, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None,
                mode_t=None, value_t=None, new_start_year=None, new_end_year=None, new_month_list=None):
         print("__ Importing eastward component of wind at 10m.")
-        return self.get(xr.open_mfdataset(self.paths, combine='by_coords').u_mm_10m.isel(ht=0).drop('ht').
+        return self.get(self.data.u_mm_10m.isel(ht=0).drop('ht').
                         rename({'longitude_1': 'longitudeb'}).rename({'latitude_1': 'latitudeb'}), zone,
                         mode_lon, value_lon, mode_lat, value_lat, None, None, mode_t, value_t,
                         new_start_year=new_start_year, new_end_year=new_end_year, new_month_list=new_month_list)
@@ -340,7 +595,7 @@ class ATMSURFMDS(HadCM3RDS):
     def v_wind(self, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None,
                mode_t=None, value_t=None, new_start_year=None, new_end_year=None, new_month_list=None):
         print("__ Importing northward component of wind at 10m.")
-        return self.get(xr.open_mfdataset(self.paths, combine='by_coords').v_mm_10m.isel(ht=0).drop('ht').
+        return self.get(self.data.v_mm_10m.isel(ht=0).drop('ht').
                         rename({'longitude_1': 'longitudeb'}).rename({'latitude_1': 'latitudeb'}), zone,
                         mode_lon, value_lon, mode_lat, value_lat, None, None, mode_t, value_t,
                         new_start_year=new_start_year, new_end_year=new_end_year, new_month_list=new_month_list)
@@ -348,22 +603,21 @@ class ATMSURFMDS(HadCM3RDS):
     def mslp(self, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None,
              mode_t=None, value_t=None, new_start_year=None, new_end_year=None, new_month_list=None):
         print("__ Importing mean sea level pressure.")
-        return self.get(xr.open_mfdataset(self.paths, combine='by_coords').p_mm_msl.isel(msl=0).drop('msl'), zone,
+        return self.get(self.data.p_mm_msl.isel(msl=0).drop('msl'), zone,
                         mode_lon, value_lon, mode_lat, value_lat, None, None, mode_t, value_t,
                         new_start_year=new_start_year, new_end_year=new_end_year, new_month_list=new_month_list)
     
     def surfp(self, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None,
               mode_t=None, value_t=None, new_start_year=None, new_end_year=None, new_month_list=None):
         print("__ Importing sea level pressure.")
-        return self.get(xr.open_mfdataset(self.paths, combine='by_coords').p_mm_srf.isel(surface=0).drop('surface'),
+        return self.get(self.data.p_mm_srf.isel(surface=0).drop('surface'),
                         zone, mode_lon, value_lon, mode_lat, value_lat, None, None, mode_t, value_t,
                         new_start_year=new_start_year, new_end_year=new_end_year, new_month_list=new_month_list)
     
     def downsol_toa(self, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None,
                     mode_t=None, value_t=None, new_start_year=None, new_end_year=None, new_month_list=None):
         print("__ Importing incoming shortwave solar radiation.")
-        return self.get(xr.open_mfdataset(
-            self.paths, combine='by_coords').downSol_mm_TOA.isel(toa=0).drop('toa'), zone,
+        return self.get(self.data.downSol_mm_TOA.isel(toa=0).drop('toa'), zone,
                         mode_lon, value_lon, mode_lat, value_lat, None, None, mode_t, value_t,
                         new_start_year=new_start_year, new_end_year=new_end_year, new_month_list=new_month_list)
 
@@ -374,32 +628,18 @@ class OCNMDS(HadCM3RDS):
     """
     
     def __init__(self, exp_name, start_year, end_year, month_list=None, chunks=None, verbose=True, debug=False,
-                 logger="print"):
+                 logger="print", open_mode="lazy", parallel=False):
         month_list = HadCM3DS.MONTHS if month_list is None else month_list  # To overcome mutable argument error
         expt_id = input_file[exp_name][0]
         file_name = f"pf/{expt_id}o#pf"
         super(OCNMDS, self).__init__(exp_name, start_year, end_year, file_name=file_name, month_list=month_list,
-                                     chunks=chunks, verbose=verbose, debug=debug, logger=logger)
+                                     chunks=chunks, verbose=verbose, debug=debug, logger=logger, open_mode=open_mode,
+                                     parallel=parallel)
     
     @staticmethod
     def process(array_r, proc_lon, proc_lat, proc_z):
-        array = array_r
-        if "longitude" in array.dims and proc_lon:
-            array = xr.concat([array, array.isel(longitude=0)], dim="longitude")
-        if "longitudeb" in array.dims and proc_lon:
-            array = xr.concat([array, array.isel(longitudeb=0)], dim="longitudeb")
-        if "latitude" in array.dims and proc_lat:
-            array.isel(latitude=-1).values = array.isel(latitude=-2).values
-            array = xr.concat([array.isel(latitude=np.arange(0, len(array.latitude) - 1, 1)), array.isel(latitude=-2),
-                               array.isel(latitude=-2)], dim="latitude")
-        if "latitudeb" in array.dims and proc_lat:
-            array.isel(latitudeb=-1).values = array.isel(latitudeb=-2).values
-            array = xr.concat(
-                [array.isel(latitudeb=0), array.isel(latitudeb=np.arange(0, len(array.latitudeb) - 1, 1)),
-                 array.isel(latitudeb=-2), array.isel(latitudeb=-2)], dim="latitudeb")
-        if "zb" in array.dims and proc_z:
-            array = xr.concat([array, array.isel(zb=-1)], dim="zb")
-        return array.transpose(*array_r.dims)
+        return util.pad(array_r, proc_lon, proc_lat, proc_z, latitudes=OCEAN_LATITUDES,
+                        levels={"zb": lambda n: np.r_[0:n, n - 1]})
     
     def import_coordinates(self):
         self.lon, self.lonb = np.sort(self.sample_data.longitude.values), np.sort(self.sample_data.longitude_1.values)
@@ -421,24 +661,26 @@ class OCNMDS(HadCM3RDS):
         self.zb_p = np.append(self.zb, self.zb[-1] + (self.z[-1] - self.zb[-1]) * 2)
         self.zs_p = self.zb_p[1:] - self.zb_p[0:-1]
         
-        self.t = [cftime.Datetime360Day(year, month, 1)
-                  for year in np.arange(int(self.start_year), int(self.end_year) + 1)
-                  for month in util.months_to_number(self.months)]
+        self.t_days = util.dates_to_days(np.arange(int(self.start_year), int(self.end_year) + 1),
+                                         util.months_to_number(self.months))
         super(OCNMDS, self).import_coordinates()
     
     def sst(self, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None, mode_t=None,
             value_t=None, new_start_year=None, new_end_year=None, new_month_list=None):
         print("__ Importing SST.")
         return self.get(
-            xr.open_mfdataset(self.paths, combine='by_coords').temp_mm_uo.isel(unspecified=0).drop("unspecified"), zone,
+            self.data.temp_mm_uo.isel(unspecified=0).drop("unspecified"), zone,
             mode_lon, value_lon, mode_lat, value_lat, None, None, mode_t, value_t,
             new_start_year=new_start_year, new_end_year=new_end_year, new_month_list=new_month_list)
     
+    def ocean_levels(self):
+        return self.data.temp_mm_dpth.assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'})
+    
     def temperature(self, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None,
                     mode_z=None, value_z=None, mode_t=None, value_t=None, new_start_year=None, new_end_year=None,
                     new_month_list=None):
         print("__ Importing temperature.")
-        return self.get(xr.open_mfdataset(self.paths, combine='by_coords').temp_mm_dpth.
+        return self.get(self.data.temp_mm_dpth.
                         assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'}), zone,
                         mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t,
                         new_start_year=new_start_year, new_end_year=new_end_year, new_month_list=new_month_list)
@@ -447,14 +689,10 @@ class OCNMDS(HadCM3RDS):
                  mode_z=None, value_z=None, mode_t=None, value_t=None, new_start_year=None, new_end_year=None,
                  new_month_list=None, convert=True):
         print("__ Importing salinity.")
-        if convert:
-            data = self.convert_salinity(xr.open_mfdataset(self.paths, combine='by_coords', chunks={"t": self.chunks}))
-        else:
-            data = xr.open_mfdataset(self.paths, combine='by_coords', chunks={"t": self.chunks})
-        return self.get(data.salinity_mm_dpth.
-                        assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'}),
-                        zone, mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t,
-                        new_start_year=new_start_year, new_end_year=new_end_year, new_month_list=new_month_list)
+        return self.get(self.data.salinity_mm_dpth.assign_coords(depth_1=-self.sample_data.depth_1).
+                        rename({'depth_1': 'zb'}), zone, mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z,
+                        mode_t, value_t, new_start_year=new_start_year, new_end_year=new_end_year,
+                        new_month_list=new_month_list, transform=self.convert_salinity if convert else None)
     
     @staticmethod
     def convert_salinity(data_array):
@@ -464,7 +702,7 @@ class OCNMDS(HadCM3RDS):
             value_t=None, new_start_year=None, new_end_year=None, new_month_list=None):
         print("__ Importing net surface heat flux.")
         return self.get(
-            xr.open_mfdataset(self.paths, combine='by_coords').HTN_mm_uo.isel(unspecified=0).drop("unspecified"), zone,
+            self.data.HTN_mm_uo.isel(unspecified=0).drop("unspecified"), zone,
             mode_lon, value_lon, mode_lat, value_lat, None, None, mode_t, value_t,
             new_start_year=new_start_year, new_end_year=new_end_year, new_month_list=new_month_list)
     
@@ -472,7 +710,7 @@ class OCNMDS(HadCM3RDS):
                    mode_z=None, value_z=None, mode_t=None, value_t=None, new_start_year=None, new_end_year=None,
                    new_month_list=None):
         print("__ Importing meridional (eastward) velocity.")
-        return self.get(xr.open_mfdataset(self.paths, combine='by_coords').ucurrTot_mm_dpth.
+        return self.get(self.data.ucurrTot_mm_dpth.
                         assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'})
                         .rename({'longitude_1': 'longitudeb'}).rename({'latitude_1': 'latitudeb'}),
                         zone, mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t,
@@ -482,7 +720,7 @@ class OCNMDS(HadCM3RDS):
                    mode_z=None, value_z=None, mode_t=None, value_t=None, new_start_year=None, new_end_year=None,
                    new_month_list=None):
         print("__ Importing zonal (northward) velocity.")
-        return self.get(xr.open_mfdataset(self.paths, combine='by_coords').vcurrTot_mm_dpth.
+        return self.get(self.data.vcurrTot_mm_dpth.
                         assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'})
                         .rename({'longitude_1': 'longitudeb'}).rename({'latitude_1': 'latitudeb'}),
                         zone, mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t,
@@ -492,15 +730,13 @@ class OCNMDS(HadCM3RDS):
                  mode_z=None, value_z=None, mode_t=None, value_t=None, new_start_year=None, new_end_year=None,
                  new_month_list=None):
         print("__ Importing zonal and meridional velocities and computing total velocity.")
-        return self.get(np.sqrt(
-            (xr.open_mfdataset(self.paths, combine='by_coords').vcurrTot_mm_dpth.
-             assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'})
-             .rename({'longitude_1': 'longitudeb'}).rename({'latitude_1': 'latitudeb'})) ** 2 +
-            (xr.open_mfdataset(self.paths, combine='by_coords').vcurrTot_mm_dpth.
-             assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'})
-             .rename({'longitude_1': 'longitudeb'}).rename({'latitude_1': 'latitudeb'})) ** 2),
-            zone, mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t,
-            new_start_year=new_start_year, new_end_year=new_end_year, new_month_list=new_month_list)
+        # Computed by a transform after the selection, so that only the selected hyperslabs are read.
+        return self.get(self.data.vcurrTot_mm_dpth.
+                        assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'})
+                        .rename({'longitude_1': 'longitudeb'}).rename({'latitude_1': 'latitudeb'}),
+                        zone, mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t,
+                        new_start_year=new_start_year, new_end_year=new_end_year, new_month_list=new_month_list,
+                        transform=lambda data: np.sqrt(data ** 2 + data ** 2))
 
 
 class OCNYDS(HadCM3RDS):
@@ -509,31 +745,16 @@ class OCNYDS(HadCM3RDS):
     """
     
     def __init__(self, exp_name, start_year, end_year, month_list=None, chunks=None, verbose=True, debug=False,
-                 logger="print"):
+                 logger="print", open_mode="lazy", parallel=False):
         expt_id = input_file[exp_name][0]
         file_name = f"pg/{expt_id}o#pg"
         super(OCNYDS, self).__init__(exp_name, start_year, end_year, file_name=file_name, month_list=month_list,
-                                     chunks=chunks, verbose=verbose, debug=debug, logger=logger)
+                                     chunks=chunks, verbose=verbose, debug=debug, logger=logger, open_mode=open_mode,
+                                     parallel=parallel)
     
     @staticmethod
     def process(array_r, proc_lon, proc_lat, proc_z):
-        array = array_r
-        if "longitude" in array.dims and proc_lon:
-            array = xr.concat([array, array.isel(longitude=0)], dim="longitude")
-        if "longitudeb" in array.dims and proc_lon:
-            array = xr.concat([array, array.isel(longitudeb=0)], dim="longitudeb")
-        if "latitude" in array.dims and proc_lat:
-            array.isel(latitude=-1).values = array.isel(latitude=-2).values
-            array = xr.concat([array.isel(latitude=np.arange(0, len(array.latitude) - 1, 1)), array.isel(latitude=-2),
-                               array.isel(latitude=-2)], dim="latitude")
-        if "latitudeb" in array.dims and proc_lat:
-            array.isel(latitudeb=-1).values = array.isel(latitudeb=-2).values
-            array = xr.concat(
-                [array.isel(latitudeb=0), array.isel(latitudeb=np.arange(0, len(array.latitudeb) - 1, 1)),
-                 array.isel(latitudeb=-2), array.isel(latitudeb=-2)], dim="latitudeb")
-        if "zb" in array.dims and proc_z:
-            pass
-        return array.transpose(*array_r.dims)
+        return util.pad(array_r, proc_lon, proc_lat, proc_z, latitudes=OCEAN_LATITUDES)
     
     def import_coordinates(self):
         self.lon, self.lonb = np.sort(self.sample_data.longitude.values), np.sort(self.sample_data.longitude_1.values)
@@ -555,14 +776,17 @@ class OCNYDS(HadCM3RDS):
         self.zb_p = self.zb
         self.zs_p = self.zb_p[1:] - self.zb_p[0:-1]
         
-        self.t = [cftime.Datetime360Day(year, 6, 1) for year in np.arange(int(self.start_year), int(self.end_year) + 1)]
+        self.t_days = util.dates_to_days(np.arange(int(self.start_year), int(self.end_year) + 1), [6])
         
         super(OCNYDS, self).import_coordinates()
     
+    def ocean_levels(self):
+        return self.data.temp_ym_dpth.assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'})
+    
     def temperature(self, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None,
                     mode_z=None, value_z=None, mode_t=None, value_t=None, new_start_year=None, new_end_year=None):
         print("__ Importing temperature.")
-        return self.get(xr.open_mfdataset(self.paths, combine='by_coords').temp_ym_dpth.
+        return self.get(self.data.temp_ym_dpth.
                         assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'}),
                         zone, mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t,
                         new_start_year=new_start_year, new_end_year=new_end_year)
@@ -570,7 +794,7 @@ class OCNYDS(HadCM3RDS):
     def salinity(self, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None,
                  mode_z=None, value_z=None, mode_t=None, value_t=None, new_start_year=None, new_end_year=None):
         print("__ Importing salinity.")
-        return self.get(xr.open_mfdataset(self.paths, combine='by_coords').salinity_ym_dpth.
+        return self.get(self.data.salinity_ym_dpth.
                         assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'}),
                         zone, mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t,
                         new_start_year=new_start_year, new_end_year=new_end_year)
@@ -578,7 +802,7 @@ class OCNYDS(HadCM3RDS):
     def u_velocity(self, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None,
                    mode_z=None, value_z=None, mode_t=None, value_t=None, new_start_year=None, new_end_year=None):
         print("__ Importing meridional (eastward) velocity.")
-        return self.get(xr.open_mfdataset(self.paths, combine='by_coords').ucurrTot_mm_dpth.
+        return self.get(self.data.ucurrTot_mm_dpth.
                         assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'})
                         .rename({'longitude_1': 'longitudeb'}).rename({'latitude_1': 'latitudeb'}),
                         zone, mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t,
@@ -587,7 +811,7 @@ class OCNYDS(HadCM3RDS):
     def v_velocity(self, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None,
                    mode_z=None, value_z=None, mode_t=None, value_t=None, new_start_year=None, new_end_year=None):
         print("__ Importing zonal (northward) velocity.")
-        return self.get(xr.open_mfdataset(self.paths, combine='by_coords').vcurrTot_mm_dpth.
+        return self.get(self.data.vcurrTot_mm_dpth.
                         assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'})
                         .rename({'longitude_1': 'longitudeb'}).rename({'latitude_1': 'latitudeb'}),
                         zone, mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t,
@@ -596,20 +820,18 @@ class OCNYDS(HadCM3RDS):
     def velocity(self, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None,
                  mode_z=None, value_z=None, mode_t=None, value_t=None, new_start_year=None, new_end_year=None):
         print("__ Importing zonal and meridional velocities and computing total velocity.")
-        return self.get(np.sqrt(
-            (xr.open_mfdataset(self.paths, combine='by_coords').vcurrTot_mm_dpth.
-             assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'})
-             .rename({'longitude_1': 'longitudeb'}).rename({'latitude_1': 'latitudeb'})) ** 2 +
-            (xr.open_mfdataset(self.paths, combine='by_coords').vcurrTot_mm_dpth.
-             assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'})
-             .rename({'longitude_1': 'longitudeb'}).rename({'latitude_1': 'latitudeb'})) ** 2),
-            zone, mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t,
-            new_start_year=new_start_year, new_end_year=new_end_year)
+        # Computed by a transform after the selection, so that only the selected hyperslabs are read.
+        return self.get(self.data.vcurrTot_mm_dpth.
+                        assign_coords(depth_1=-self.sample_data.depth_1).rename({'depth_1': 'zb'})
+                        .rename({'longitude_1': 'longitudeb'}).rename({'latitude_1': 'latitudeb'}),
+                        zone, mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t,
+                        new_start_year=new_start_year, new_end_year=new_end_year,
+                        transform=lambda data: np.sqrt(data ** 2 + data ** 2))
     
     def stream(self, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None,
                mode_z=None, value_z=None, mode_t=None, value_t=None, new_start_year=None, new_end_year=None):
         print("__ Importing salinity.")
-        return self.get(xr.open_mfdataset(self.paths, combine='by_coords').streamFn_ym_uo.
+        return self.get(self.data.streamFn_ym_uo.
                         isel(unspecified=0).drop("unspecified"),
                         zone, mode_lon, value_lon, mode_lat, value_lat, mode_z, value_z, mode_t, value_t,
                         new_start_year=new_start_year, new_end_year=new_end_year)
@@ -641,6 +863,7 @@ class HadCM3TS(HadCM3DS):
     def __init__(self, exp_name, start_year, end_year, file_name, month_list, chunks, verbose, debug, logger):
         self.data = None
         self.file_name = file_name
+        self.paths = []
         start_year = self.get_start_year(exp_name, file_name) if start_year is None else start_year
         end_year = self.get_end_year(exp_name, file_name) if end_year is None else end_year
         self.chunks = chunks
@@ -659,23 +882,21 @@ class HadCM3TS(HadCM3DS):
                f"{util.print_coordinates('t', self.t)}\n" \
                f"DATA: {self.data}"
     
-    def get_start_year(self, exp_name=None, file_name=None):
-        # To sort
+    def get_time_extent(self, exp_name=None, file_name=None):
+        """
+        First and last years, length, units and calendar of the time series, cached per (exp_name, file_name).
+        """
         exp_name = exp_name if exp_name is not None else self.exp_name
         file_name = file_name if file_name is not None else self.file_name
         
         path = input_file[exp_name][2]
-        times = netCDF4.Dataset(f"{path}{exp_name}.{file_name}.nc").variables['t']
-        return netCDF4.num2date(np.sort(times[:]), units=times.units, calendar=times.calendar)[0].year
+        return time_extents.get(f"{exp_name}.{file_name}", f"{path}{exp_name}.{file_name}.nc")
+    
+    def get_start_year(self, exp_name=None, file_name=None):
+        return self.get_time_extent(exp_name, file_name)["start_year"]
     
     def get_end_year(self, exp_name=None, file_name=None):
-        # To sort
-        exp_name = exp_name if exp_name is not None else self.exp_name
-        file_name = file_name if file_name is not None else self.file_name
-        
-        path = input_file[exp_name][2]
-        times = netCDF4.Dataset(f"{path}{exp_name}.{file_name}.nc").variables['t']
-        return netCDF4.num2date(np.sort(times[:]), units=times.units, calendar=times.calendar)[-1].year
+        return self.get_time_extent(exp_name, file_name)["end_year"]
     
     def import_data(self):
         
@@ -688,28 +909,27 @@ class HadCM3TS(HadCM3DS):
                 f"{self.start_year} and {self.end_year}.")
             
             path = input_file[self.exp_name][2]
+            if self.CATALOG is not None and self.CATALOG.has_experiment(self.exp_name) and \
+                    self.CATALOG.time_series(self.exp_name, self.file_name) is None:
+                self.CATALOG.refresh([self.exp_name])
+                if self.CATALOG.time_series(self.exp_name, self.file_name) is None:
+                    raise FileNotFoundError(f"** {self.exp_name}.{self.file_name} is not in the catalog.")
             
             if self.debug: start = time.time()
-            if self.chunks is not None:
-                self.data = xr.open_dataset(f"{path}{self.exp_name}.{self.file_name}.nc", chunks={"t": self.chunks})
-            else:
-                self.data = xr.open_dataset(f"{path}{self.exp_name}.{self.file_name}.nc")
+            # Opened without chunks: the selections of get are read lazily from the file and chunked afterwards.
+            self.paths = [f"{path}{self.exp_name}.{self.file_name}.nc"]
+            self.data = xr.open_dataset(self.paths[0])
             if self.debug: print(f"* Time elapsed for open_dataset : {time.time() - start}")
             
-            if min(self.data.t.values).year > self.start_year or max(self.data.t.values).year < self.end_year:
+            if self.get_start_year() > self.start_year or self.get_end_year() < self.end_year:
                 raise ValueError(f"Inavlid start_year or end_year. Please check that they fit the valid range\n"
-                                 f"Valid range : start_year = {min(self.data.t.values).year}, "
-                                 f"end_year = {max(self.data.t.values).year}")
+                                 f"Valid range : start_year = {self.get_start_year()}, "
+                                 f"end_year = {self.get_end_year()}")
             
             if self.debug: start = time.time()
-            if self.start_year != self.get_start_year():
-                self.data = self.data.where(self.data.t >= cftime.Datetime360Day(self.start_year, 1, 1), drop=True)
-            if self.debug: print(f"* Time elapsed for crop start year : {time.time() - start}")
-            
-            if self.debug: start = time.time()
-            if self.end_year != self.get_end_year():
-                self.data = self.data.where(self.data.t <= cftime.Datetime360Day(self.end_year, 12, 30), drop=True)
-            if self.debug: print(f"* Time elapsed for crop end years : {time.time() - start}")
+            if self.start_year != self.get_start_year() or self.end_year != self.get_end_year():
+                self.data = self.data.isel(t=util.years_to_slice(self.data.t, self.start_year, self.end_year))
+            if self.debug: print(f"* Time elapsed for crop years : {time.time() - start}")
             
             if self.debug: start = time.time()
             if self.months is not self.MONTHS and self.months is not None:
@@ -747,19 +967,8 @@ class SAL01MTS(HadCM3TS):
         return OCNMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("ocean_t", "lat", self.data.latitude))
         
         super(SAL01MTS, self).import_coordinates()
     
@@ -783,19 +992,8 @@ class SAL01ATS(HadCM3TS):
         return OCNYDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("ocean_t", "lat", self.data.latitude))
         
         super(SAL01ATS, self).import_coordinates()
     
@@ -819,19 +1017,8 @@ class SAL12ATS(HadCM3TS):
         return OCNYDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("ocean_t", "lat", self.data.latitude))
         
         super(SAL12ATS, self).import_coordinates()
     
@@ -855,19 +1042,8 @@ class SAL16ATS(HadCM3TS):
         return OCNYDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("ocean_t", "lat", self.data.latitude))
         
         super(SAL16ATS, self).import_coordinates()
     
@@ -881,6 +1057,9 @@ class SAL16ATS(HadCM3TS):
 
 class SALATS(HadCM3TS):
     
+    # Reference salinity (psu) of the freshwater content.
+    REFERENCE_SALINITY = 34.8
+    
     def __init__(self, exp_name, start_year=None, end_year=None, chunks=None, verbose=True, debug=False,
                  logger="print"):
         super(SALATS, self).__init__(exp_name, start_year, end_year, file_name="oceansalipg.annual",
@@ -891,72 +1070,40 @@ class SALATS(HadCM3TS):
         return OCNYDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("ocean_t", "lat", self.data.latitude))
         
         self.data = self.data.assign_coords(depth_1=-self.data.depth_1)
-        self.zb = np.sort(self.data.depth_1.values)
-        self.z = util.guess_from_bounds(self.zb)
-        self.zs = self.zb[1:] - self.zb[0:-1]
-        self.z_p = self.z
-        self.zb_p = self.zb
-        self.zs_p = self.zb_p[1:] - self.zb_p[0:-1]
+        self.set_coordinates(util.grid_levels("ocean_levels", self.data.depth_1))
         
         super(SALATS, self).import_coordinates()
     
+    def ocean_levels(self):
+        return self.data.salinity_ym_dpth.rename({"depth_1": "zb"})
+    
     def salinity(self, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None, mode_z=None,
                  value_z=None, mode_t=None, value_t=None, new_start_year=None, new_end_year=None, new_month_list=None,
                  convert=True):
         print("__ Importing sea water salinity (annual).")
-        data = self.convert() if convert else self.data
-        return self.get(data.salinity_ym_dpth.rename({"depth_1": "zb"}), zone, mode_lon, value_lon, mode_lat,
+        return self.get(self.data.salinity_ym_dpth.rename({"depth_1": "zb"}), zone, mode_lon, value_lon, mode_lat,
                         value_lat, mode_z, value_z, mode_t, value_t, new_start_year=new_start_year,
-                        new_end_year=new_end_year, new_month_list=new_month_list)
+                        new_end_year=new_end_year, new_month_list=new_month_list,
+                        transform=OCNMDS.convert_salinity if convert else None)
     
     def budget(self, zone=zones.NoZone(), dimensions="all"):
         """
-        To factorise
-        Returns
-        -------
-
+        Salt budget: integral of the salinity anomaly of the file times the mass of the cells (see HadCM3DS.integrate).
         """
         print("__ Budget sea water salinity (annual).")
+        return self.integrate(self.data.salinity_ym_dpth.rename({"depth_1": "zb"}), zone, dimensions, factor=1000)
         
-        geo_da = proc.GeoDataArray(self.data.salinity_ym_dpth.rename({"depth_1": "zb"}), ds=self, process=self.process)
-        geo_da = zone.compact(geo_da)
-        
-        mass_matrix = util.volume_matrix(geo_da.lon, geo_da.lat, geo_da.zb) * 1000
-        geo_da.data = geo_da.data * np.resize(mass_matrix, geo_da.data.shape)
-        
-        if dimensions == "all":
-            geo_da.data = geo_da.data.sum(skipna=True)
-        elif any([dimension not in geo_da.data.dims for dimension in dimensions]):
-            raise KeyError(f"This coordinate was not recognized. Available coordinates: {geo_da.data.dims}")
-        else:
-            for dimension in dimensions:
-                print(f"____ Summing over dimension: {dimension}")
-                geo_da.data = geo_da.data.sum(dim=dimension, skipna=True)
-        
-        # Update coordinates:
-        if "longitude" in dimensions or "longitudeb" in dimensions:
-            geo_da.update_lon(mode_lon="sum", value_lon=None)
-        if "latitude" in dimensions or "latitudeb" in dimensions:
-            geo_da.update_lat(mode_lat="sum", value_lat=None)
-        if "z" in dimensions or "zb" in dimensions:
-            geo_da.update_z(mode_z="sum", value_z=None)
-        
-        return geo_da
+    def freshwater_content(self, zone=zones.NoZone(), dimensions="all", reference=REFERENCE_SALINITY):
+        """
+        Freshwater content (m3) relative to a reference salinity (psu): integral of (reference - S) / reference.
+        """
+        print(f"__ Freshwater content relative to {reference} psu (annual).")
+        return self.integrate(self.data.salinity_ym_dpth.rename({"depth_1": "zb"}), zone, dimensions,
+                              transform=lambda data: (reference - OCNMDS.convert_salinity(data)) / reference)
     
     def convert(self):
         return self.data * 1000 + 35
@@ -976,19 +1123,8 @@ class SSTMTS(HadCM3TS):
         return OCNMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("ocean_t", "lat", self.data.latitude))
         
         super(SSTMTS, self).import_coordinates()
     
@@ -1015,19 +1151,8 @@ class OCNT01MTS(HadCM3TS):
         return OCNMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("ocean_t", "lat", self.data.latitude))
         
         super(OCNT01MTS, self).import_coordinates()
     
@@ -1051,19 +1176,8 @@ class OCNT01ATS(HadCM3TS):
         return OCNYDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("ocean_t", "lat", self.data.latitude))
         
         super(OCNT01ATS, self).import_coordinates()
     
@@ -1087,19 +1201,8 @@ class OCNT12ATS(HadCM3TS):
         return OCNYDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("ocean_t", "lat", self.data.latitude))
         
         super(OCNT12ATS, self).import_coordinates()
     
@@ -1123,19 +1226,8 @@ class OCNT16ATS(HadCM3TS):
         return OCNYDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("ocean_t", "lat", self.data.latitude))
         
         super(OCNT16ATS, self).import_coordinates()
     
@@ -1149,6 +1241,10 @@ class OCNT16ATS(HadCM3TS):
 
 class OCNTATS(HadCM3TS):
     
+    # Reference density (kg.m-3) and specific heat capacity (J.kg-1.K-1) of sea water for the heat content.
+    RHO_0 = 1026
+    C_P = 3992
+    
     def __init__(self, exp_name, start_year=None, end_year=None, chunks=None, verbose=True, debug=False,
                  logger="print"):
         super(OCNTATS, self).__init__(exp_name, start_year, end_year, file_name="oceantemppg.annual",
@@ -1159,30 +1255,17 @@ class OCNTATS(HadCM3TS):
         return OCNYDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("ocean_t", "lat", self.data.latitude))
         
         self.data = self.data.assign_coords(depth_1=-self.data.depth_1)
-        self.zb = np.sort(self.data.depth_1.values)
-        self.z = util.guess_from_bounds(self.zb)
-        self.zs = self.zb[1:] - self.zb[0:-1]
-        self.z_p = self.z
-        self.zb_p = self.zb
-        self.zs_p = self.zb_p[1:] - self.zb_p[0:-1]
+        self.set_coordinates(util.grid_levels("ocean_levels", self.data.depth_1))
         
         super(OCNTATS, self).import_coordinates()
     
+    def ocean_levels(self):
+        return self.data.temp_ym_dpth.rename({"depth_1": "zb"})
+    
     def temperature(self, zone=zones.NoZone(), mode_lon=None, value_lon=None, mode_lat=None, value_lat=None,
                     mode_z=None, value_z=None, mode_t=None, value_t=None,
                     new_start_year=None, new_end_year=None, new_month_list=None):
@@ -1197,6 +1280,14 @@ class OCNTATS(HadCM3TS):
             return self.get(self.data.temp_ym_dpth.rename({"depth_1": "zb"}), zone, mode_lon, value_lon, mode_lat,
                             value_lat, mode_z, value_z, mode_t, value_t,
                             new_start_year=new_start_year, new_end_year=new_end_year, new_month_list=new_month_list)
+    
+    def heat_content(self, zone=zones.NoZone(), dimensions="all"):
+        """
+        Heat content (J) relative to 0 degC: integral of RHO_0 * C_P * T (see HadCM3DS.integrate).
+        """
+        print("__ Heat content of sea water (annual).")
+        return self.integrate(self.data.temp_ym_dpth.rename({"depth_1": "zb"}), zone, dimensions,
+                              factor=self.RHO_0 * self.C_P)
 
 
 class OCNUVEL01MTS(HadCM3TS):
@@ -1214,19 +1305,8 @@ class OCNUVEL01MTS(HadCM3TS):
         return OCNMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lonb = np.sort(self.data.longitude1.values)
-        self.lon = util.guess_from_bounds(self.lonb)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.latb = np.sort(self.data.latitude1.values)
-        self.lat = util.guess_from_bounds(self.latb)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_uv", "lon", self.data.longitude1, from_bounds=True))
+        self.set_coordinates(util.grid_axis("ocean_uv", "lat", self.data.latitude1, from_bounds=True))
         
         super(OCNUVEL01MTS, self).import_coordinates()
     
@@ -1250,27 +1330,11 @@ class OCNUVELATS(HadCM3TS):
         return OCNYDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lonb = np.sort(self.data.longitude1.values)
-        self.lon = util.guess_from_bounds(self.lonb)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.latb = np.sort(self.data.latitude1.values)
-        self.lat = util.guess_from_bounds(self.latb)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_uv", "lon", self.data.longitude1, from_bounds=True))
+        self.set_coordinates(util.grid_axis("ocean_uv", "lat", self.data.latitude1, from_bounds=True))
         
         self.data = self.data.assign_coords(depth_1=-self.data.depth_1)
-        self.zb = np.sort(self.data.depth_1.values)
-        self.z = util.guess_from_bounds(self.zb)
-        self.zs = self.zb[1:] - self.zb[0:-1]
-        self.z_p = self.z
-        self.zb_p = self.zb
-        self.zs_p = self.zb_p[1:] - self.zb_p[0:-1]
+        self.set_coordinates(util.grid_levels("ocean_levels", self.data.depth_1))
         
         super(OCNUVELATS, self).import_coordinates()
     
@@ -1299,19 +1363,8 @@ class OCNVVEL01MTS(HadCM3TS):
         return OCNMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lonb = np.sort(self.data.longitude1.values)
-        self.lon = util.guess_from_bounds(self.lonb)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.latb = np.sort(self.data.latitude1.values)
-        self.lat = util.guess_from_bounds(self.latb)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_uv", "lon", self.data.longitude1, from_bounds=True))
+        self.set_coordinates(util.grid_axis("ocean_uv", "lat", self.data.latitude1, from_bounds=True))
         
         super(OCNVVEL01MTS, self).import_coordinates()
     
@@ -1335,27 +1388,11 @@ class OCNVVELATS(HadCM3TS):
         return OCNYDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lonb = np.sort(self.data.longitude1.values)
-        self.lon = util.guess_from_bounds(self.lonb)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.latb = np.sort(self.data.latitude1.values)
-        self.lat = util.guess_from_bounds(self.latb)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_uv", "lon", self.data.longitude1, from_bounds=True))
+        self.set_coordinates(util.grid_axis("ocean_uv", "lat", self.data.latitude1, from_bounds=True))
         
         self.data = self.data.assign_coords(depth_1=-self.data.depth_1)
-        self.zb = np.sort(self.data.depth_1.values)
-        self.z = util.guess_from_bounds(self.zb)
-        self.zs = self.zb[1:] - self.zb[0:-1]
-        self.z_p = self.z
-        self.zb_p = self.zb
-        self.zs_p = self.zb_p[1:] - self.zb_p[0:-1]
+        self.set_coordinates(util.grid_levels("ocean_levels", self.data.depth_1))
         
         super(OCNVVELATS, self).import_coordinates()
     
@@ -1383,19 +1420,8 @@ class MLDMTS(HadCM3TS):
         return OCNMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("ocean_t", "lat", self.data.latitude))
         
         super(MLDMTS, self).import_coordinates()
     
@@ -1419,20 +1445,10 @@ class MERIDATS(HadCM3TS):
         return OCNYDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_t", "lat", self.data.latitude))
         
         self.data = self.data.assign_coords(depth=-self.data.depth)
-        self.z = np.sort(self.data.depth.values)
-        self.zb = util.guess_bounds(self.z)
-        self.zs = self.zb[1:] - self.zb[0:-1]
-        self.z_p = self.z
-        self.zb_p = self.zb
-        self.zs_p = self.zb_p[1:] - self.zb_p[0:-1]
+        self.set_coordinates(util.grid_levels("ocean_levels", self.data.depth, from_bounds=False))
         
         super(MERIDATS, self).import_coordinates()
     
@@ -1480,19 +1496,8 @@ class OCNSTREAMMTS(HadCM3TS):
         return OCNMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.append(self.lat, self.lat[-1] + self.lats[-1])
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("ocean_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("ocean_t", "lat", self.data.latitude))
         
         super(OCNSTREAMMTS, self).import_coordinates()
     
@@ -1519,19 +1524,8 @@ class PRECIPMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(PRECIPMTS, self).import_coordinates()
     
@@ -1593,19 +1587,8 @@ class Q2MMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(Q2MMTS, self).import_coordinates()
     
@@ -1631,19 +1614,8 @@ class RH2MMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(RH2MMTS, self).import_coordinates()
     
@@ -1669,19 +1641,8 @@ class SHMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(SHMTS, self).import_coordinates()
     
@@ -1707,19 +1668,8 @@ class LHMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(LHMTS, self).import_coordinates()
     
@@ -1746,19 +1696,8 @@ class ICECONCMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(ICECONCMTS, self).import_coordinates()
     
@@ -1785,19 +1724,8 @@ class ICEDEPTHMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(ICEDEPTHMTS, self).import_coordinates()
     
@@ -1823,19 +1751,8 @@ class SNOWMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(SNOWMTS, self).import_coordinates()
     
@@ -1861,19 +1778,8 @@ class SATMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(SATMTS, self).import_coordinates()
     
@@ -1906,19 +1812,8 @@ class ATMT2MMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(ATMT2MMTS, self).import_coordinates()
     
@@ -1945,19 +1840,8 @@ class SOLNETSURFMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(SOLNETSURFMTS, self).import_coordinates()
     
@@ -1984,19 +1868,8 @@ class SOLTOTSMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(SOLTOTSMTS, self).import_coordinates()
     
@@ -2023,19 +1896,8 @@ class SOLTOAMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(SOLTOAMTS, self).import_coordinates()
     
@@ -2062,19 +1924,8 @@ class SOLUPMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(SOLUPMTS, self).import_coordinates()
     
@@ -2100,19 +1951,8 @@ class OLRMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(OLRMTS, self).import_coordinates()
     
@@ -2138,19 +1978,9 @@ class U10MTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lonb = np.sort(self.data.longitude_1.values)
-        self.lon = util.guess_from_bounds(self.lonb)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.latb = np.sort(self.data.latitude_1.values)
-        self.lat = util.guess_from_bounds(self.latb)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_uv", "lon", self.data.longitude_1, from_bounds=True))
+        self.set_coordinates(util.grid_axis("atmosphere_uv", "lat", self.data.latitude_1, from_bounds=True,
+                                            padding="none"))
         
         super(U10MTS, self).import_coordinates()
     
@@ -2177,19 +2007,8 @@ class U200MTS(HadCM3TS):
         return ATMUPMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.concatenate(([-90], self.lat, [90]))
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="poles"))
         
         super(U200MTS, self).import_coordinates()
     
@@ -2215,19 +2034,8 @@ class U850MTS(HadCM3TS):
         return ATMUPMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.concatenate(([-90], self.lat, [90]))
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="poles"))
         
         super(U850MTS, self).import_coordinates()
     
@@ -2253,19 +2061,9 @@ class V10MTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lonb = np.sort(self.data.longitude_1.values)
-        self.lon = util.guess_from_bounds(self.lonb)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.latb = np.sort(self.data.latitude_1.values)
-        self.lat = util.guess_from_bounds(self.latb)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_uv", "lon", self.data.longitude_1, from_bounds=True))
+        self.set_coordinates(util.grid_axis("atmosphere_uv", "lat", self.data.latitude_1, from_bounds=True,
+                                            padding="none"))
         
         super(V10MTS, self).import_coordinates()
     
@@ -2292,19 +2090,8 @@ class V200MTS(HadCM3TS):
         return ATMUPMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.concatenate(([-90], self.lat, [90]))
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="poles"))
         
         super(V200MTS, self).import_coordinates()
     
@@ -2330,19 +2117,8 @@ class V850MTS(HadCM3TS):
         return ATMUPMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.concatenate(([-90], self.lat, [90]))
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="poles"))
         
         super(V850MTS, self).import_coordinates()
     
@@ -2368,19 +2144,8 @@ class MSLPMTS(HadCM3TS):
         return ATMSURFMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lon = np.sort(self.data.longitude.values)
-        self.lonb = util.guess_bounds(self.lon)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.lat = np.sort(self.data.latitude.values)
-        self.latb = util.guess_bounds(self.lat)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = self.lat
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lon", self.data.longitude))
+        self.set_coordinates(util.grid_axis("atmosphere_t", "lat", self.data.latitude, padding="none"))
         
         super(MSLPMTS, self).import_coordinates()
     
@@ -2406,19 +2171,9 @@ class Z500MTS(HadCM3TS):
         return ATMUPMDS.process(array_r, proc_lon, proc_lat, proc_z)
     
     def import_coordinates(self):
-        self.lonb = np.sort(self.data.longitude_1.values)
-        self.lon = util.guess_from_bounds(self.lonb)
-        self.lons = self.lonb[1:] - self.lonb[0:-1]
-        self.lon_p = np.append(self.lon, self.lon[-1] + self.lons[-1])
-        self.lonb_p = util.guess_bounds(self.lon_p)
-        self.lons_p = self.lonb_p[1:] - self.lonb_p[0:-1]
-        
-        self.latb = np.sort(self.data.latitude_1.values)
-        self.lat = util.guess_from_bounds(self.latb)
-        self.lats = self.latb[1:] - self.latb[0:-1]
-        self.lat_p = np.concatenate(([-90], self.lat, [90]))
-        self.latb_p = util.guess_bounds(self.lat_p)
-        self.lats_p = self.latb_p[1:] - self.latb_p[0:-1]
+        self.set_coordinates(util.grid_axis("atmosphere_uv", "lon", self.data.longitude_1, from_bounds=True))
+        self.set_coordinates(util.grid_axis("atmosphere_uv", "lat", self.data.latitude_1, from_bounds=True,
+                                            padding="poles"))
         
         super(Z500MTS, self).import_coordinates()
     
@@ -2490,32 +2245,43 @@ class SOILTMTS(HadCM3TS):
 # LAND-SEA MASK
 # *************
 
-# class HadCM3LSM(proc.LSM):
-#
-#     def __init__(self):
-#         super(HadCM3LSM, self).__init__()
-#
-#     def get_lsm(self, lsm_name):
-#         ds_lsm = xr.open_dataset(util.path2lsm[lsm_name])
-#         self.lon = ds_lsm.longitude.values
-#         self.lat = ds_lsm.latitude.values
-#         self.depth = ds_lsm.depthdepth.values
-#         self.level = ds_lsm.depthlevel.values
-#         self.lsm2d = ds_lsm.lsm.values
-#         self.mask2d = (self.lsm2d - 1) * -1
-#
-#     def fit_lsm_ds(self, ds):
-#         # Should check if longitudes are equal
-#         if self.depth is None:
-#             print("The lsm haven't been imported yet. Calling ls_from_ds instead")
-#             self.lsm_from_ds(ds)
-#         else:
-#             self.lon, self.lat, self.z = ds.longitude.values, ds.latitude.values, ds.depth.values
-#             lsm3d = np.zeros((len(self.lon), len(self.lat), len(self.z)))
-#             for i in range(len(self.z)):
-#                 lsm3d[:, :, i] = np.ma.masked_less(self.depth, self.z[i])
-#             self.lsm3d = lsm3d
-#             self.mask3d = (lsm3d - 1) * -1
-#
-#     def lsm_from_ds(self, ds):
-#         pass
+class HadCM3LSM(proc.LSM):
+    """
+    Land-sea mask of a HadCM3 experiment on the ocean grid, derived from the depth of the ocean given by the filled
+    levels of a 3D ocean variable (see LSM.from_levels). Saved in path/exp_name/grid/ and shared by all the datasets of
+    the experiment on this grid: each mask is derived once.
+    
+    To mask the data with it instead of the zeros: hadcm3_processing.HadCM3DS.LSM_PATH = default_lsm_path
+    """
+    
+    # (path, exp_name, grid) -> HadCM3LSM
+    MASKS = dict()
+    
+    def __init__(self):
+        super(HadCM3LSM, self).__init__()
+    
+    @classmethod
+    def get(cls, exp_name, levels, path=default_lsm_path):
+        """
+        Land-sea mask of an experiment on the grid of a 3D ocean variable, loaded or derived and saved.
+        :param levels: DataArray of the variable, see HadCM3DS.ocean_levels
+        :return: HadCM3LSM
+        """
+        grid = hashlib.sha1()
+        for dim in sorted(dim for dim in levels.dims if dim != 't'):
+            grid.update(dim.encode())
+            grid.update(np.sort(levels[dim].values).tobytes() if dim in levels.coords else
+                        str(levels.sizes[dim]).encode())
+        key = (path, exp_name, grid.hexdigest()[:16])
+        if key not in cls.MASKS:
+            directory = f"{path}{exp_name}/{key[2]}/"
+            lsm = cls().load(directory)
+            if lsm is None:
+                print(f"____ Deriving the land-sea mask of {exp_name} from the levels of {levels.name}.")
+                lsm = cls().from_levels(levels)
+                try:
+                    lsm.save(directory)
+                except OSError as error:
+                    print(f"!!!! The land-sea mask could not be saved in {directory}: {error}")
+            cls.MASKS[key] = lsm
+        return cls.MASKS[key]
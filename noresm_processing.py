@@ -4,8 +4,6 @@ import numpy as np
 import xarray as xr
 import pylaeoclim_leeds.util_hadcm3 as util
 import abc
-import cftime
-import os
 import time
 import pathlib
 
@@ -15,8 +13,8 @@ input_file = util.generate_input(str(pathlib.Path(__file__).parent.absolute()) +
 class NorESMDS(proc.ModelDS):
     MONTHS = ['ja', 'fb', 'mr', 'ar', 'my', 'jn', 'jl', 'ag', 'sp', 'ot', 'nv', 'dc']
     
-    def __init__(self, experiment, start_year, end_year, month_list, verbose, logger):
-        super(NorESMDS, self).__init__(verbose, logger)
+    def __init__(self, experiment, start_year, end_year, month_list, verbose, logger, debug=False):
+        super(NorESMDS, self).__init__(verbose, debug, logger)
 
         self.t = None
         self.lsm = None
@@ -101,14 +99,14 @@ class NorESMDS(proc.ModelDS):
 
 class NorESMRDS(NorESMDS):
     
-    def __init__(self, experiment, start_year, end_year, file_name, month_list, verbose, logger):
+    def __init__(self, experiment, start_year, end_year, file_name, month_list, verbose, logger, debug=False):
         self.buffer_name = "None"
         self.buffer_array = None
         self.file_name = file_name
         self.paths = []
         self.transform_matrix = None
         self.sample_data = None
-        super(NorESMRDS, self).__init__(experiment, start_year, end_year, month_list, verbose, logger)
+        super(NorESMRDS, self).__init__(experiment, start_year, end_year, month_list, verbose, logger, debug)
         
         try:
             self.sample_data = xr.open_dataset(self.paths[0])
@@ -123,13 +121,21 @@ class NorESMRDS(NorESMDS):
         print(f"__ Importing {type(self)}")
         print(f"____ Paths generated for {self.experiment} between years {self.start_year} and {self.end_year}.")
         try:
+            if self.debug: start = time.time()
             path = input_file[self.experiment][1]
-            self.paths = [f"{path}{self.file_name}{year:04d}-{month:02d}.nc"
-                          for year in np.arange(int(self.start_year), int(self.end_year) + 1)
-                          for month in self.months]
-            for path in self.paths:
-                if not os.path.isfile(path):
-                    raise FileNotFoundError(f"** {path} was not found. Data import aborted.")
+            dates = [(year, month) for year in np.arange(int(self.start_year), int(self.end_year) + 1)
+                     for month in self.months]
+            self.paths = [f"{path}{self.file_name}{year:04d}-{month:02d}.nc" for year, month in dates]
+            if self.debug: print(f"* Time elapsed for creating paths : {time.time() - start}")
+            if self.debug: start = time.time()
+            missing = set(util.missing_files(self.paths))
+            if self.debug: print(f"* Time elapsed for checking paths : {time.time() - start}")
+            if len(missing) > 0:
+                missing_dates = [f"{year:04d}-{month:02d}" for (year, month), path in zip(dates, self.paths)
+                                 if path in missing]
+                raise FileNotFoundError(f"** {len(missing)} files were not found in {path}{self.file_name}. "
+                                        f"Data import aborted.\n"
+                                        f"** Missing years/months: {', '.join(missing_dates)}")
             print("____ Import succeeded.")
         except KeyError as error:
             print("**** This experiment was not found in \"Experiment_to_filename\". Data import aborted.")
@@ -166,12 +172,13 @@ class OCNMDS(NorESMRDS):
     micom.hm
     """
     
-    def __init__(self, experiment, start_year, end_year, month_list="full", verbose=False, logger="print"):
+    def __init__(self, experiment, start_year, end_year, month_list="full", verbose=False, logger="print",
+                 debug=False):
         expt_id = input_file[experiment][0]
         file_name = f"ocn/hist/{expt_id}.micom.hm."
         self.grid = xr.open_dataset(input_file[experiment][2])
         super(OCNMDS, self).__init__(experiment, start_year, end_year, file_name=file_name, month_list=month_list,
-                                     verbose=verbose, logger=logger)
+                                     verbose=verbose, logger=logger, debug=debug)
 
     def transform(self, xarray):
         """
@@ -195,9 +202,8 @@ class OCNMDS(NorESMRDS):
         self.z = np.sort(self.sample_data.depth.values)
         self.z_p = self.z
 
-        self.t = [cftime.Datetime360Day(year, month, 1)
-                  for year in np.arange(int(self.start_year), int(self.end_year) + 1)
-                  for month in util.months_to_number(self.months)]
+        self.t_days = util.dates_to_days(np.arange(int(self.start_year), int(self.end_year) + 1),
+                                         util.months_to_number(self.months))
 
         super(OCNMDS, self).import_coordinates()
     
@@ -2,10 +2,57 @@ import numpy as np
 import abc
 import xarray as xr
 import pylaeoclim_leeds.util_hadcm3 as util
-import cftime
 import time
+import itertools
+import os
+from collections import OrderedDict
 
 import matplotlib.colors
+
+# Results of GeoDataArray.values shared by all the instances, least recently used first:
+# (token, version, processing, proc_lon, proc_lat, proc_z) -> read-only array.
+VALUES_CACHE = OrderedDict()
+# Size of VALUES_CACHE in bytes, and running total of the sizes of its arrays.
+VALUES_CACHE_SIZE = 5e8
+values_cache_bytes = 0
+tokens = itertools.count()
+
+
+class TimeAxis:
+    """
+    Time coordinate t, stored either as dates or as days of the 360 days calendar (t_days, see util.t_to_days), and
+    converted on demand: the selections use the days and the dates are only created to be displayed.
+    """
+    
+    _t, _t_days = None, None
+    
+    @property
+    def t(self):
+        if self._t is None and self._t_days is not None:
+            self._t = util.days_to_t(self._t_days)
+        return self._t
+    
+    @t.setter
+    def t(self, t):
+        self._t, self._t_days = t, None
+    
+    @property
+    def t_days(self):
+        if self._t_days is None and self._t is not None:
+            self._t_days = util.t_to_days(self._t)
+        return self._t_days
+    
+    @t_days.setter
+    def t_days(self, t_days):
+        self._t, self._t_days = None, t_days
+    
+    def share_t(self, source):
+        """
+        Share the time coordinate of another TimeAxis, in the form it is stored in.
+        """
+        self._t, self._t_days = source._t, source._t_days
+
+
 class GeoDS:
     """
     Mother class to treat all files (proxies, model outputs...).
@@ -37,7 +84,7 @@ class GeoDS:
         self.logger = logger
 
 
-class ModelDS(GeoDS):
+class ModelDS(GeoDS, TimeAxis):
     
     def __init__(self, verbose, debug, logger):
         """
@@ -82,10 +129,7 @@ class ModelDS(GeoDS):
     def filter_months(data_array, month_list):
         # To define in GeoDataArray !!!!and GeoDS!!!!
         if month_list is not None:
-            condition = xr.zeros_like(data_array.t)
-            for i in range(len(data_array.t)):
-                condition[i] = data_array.t[i].values[()].month in util.months_to_number(month_list)
-            data_array = data_array.where(condition, drop=True)
+            data_array = data_array.isel(t=util.months_to_indexes(util.months_of_year(data_array.t), month_list))
         return data_array
     
     def guess_bounds(self):
@@ -94,11 +138,13 @@ class ModelDS(GeoDS):
         self.zb = util.guess_bounds(self.z)
 
 
-class GeoDataArray:
+class GeoDataArray(TimeAxis):
     
     def __init__(self, data_input, ds=None, coords=None, dims=None, name=None, attrs=None, indexes=None,
-                 fastpath=False, process=None):
+                 fastpath=False, process=None, transform=None):
         
+        # Identify the results of values in VALUES_CACHE. The version changes with the data and the query plan.
+        self.token, self.version = next(tokens), 0
         if isinstance(data_input, xr.DataArray):
             self.data = data_input
         else:
@@ -126,18 +172,275 @@ class GeoDataArray:
         self.lons_p, self.lats_p, self.zs_p = ds.lons_p if ds is not None else None, \
                                               ds.lats_p if ds is not None else None, \
                                               ds.zs_p if ds is not None else None
-        self.t = ds.t if ds is not None else None
+        if ds is not None:
+            self.share_t(ds)
+        self.t_index = None
+        # Land-sea mask of the dataset (see LSM), and its selection on the executed data.
+        self.lsm, self.data_mask = None, None
         self.process = process
         self.proc_lon, self.proc_lat, self.proc_z = True, True, True
         self.start_year = ds.start_year if ds is not None else None
         self.end_year = ds.end_year if ds is not None else None
         self.months = ds.months if ds is not None else None
+        # Quantiles along the quantile dimension of the data (list quantile mode along t), None without it.
+        self.quantiles = None
         self.verbose = ds.verbose if ds is not None else None
         self.debug = ds.verbose if ds is not None else None
         self.logger = ds.verbose if ds is not None else None
+        self.chunks = getattr(ds, "chunks", None)
+        self.transform = transform  # Set once the data is sorted: applied to the selection only.
+        self.executed = False
         
         print("____ Coordinates imported in the GeoDataArray instance.")
     
+    # QUERY PLAN
+    # The selections (isel) and reductions of the get_* methods are recorded and only executed when the data is
+    # accessed: all the selections are composed into a single isel, followed by the reductions.
+    
+    FUSED_REDUCTIONS = ["sum", "min", "max"]
+    # Reductions along t computed block by block (see stream_t) when the data is larger than STREAM_SIZE bytes and not
+    # chunked: dask already reduces chunk by chunk, except for the quantiles and medians, always streamed if the data is
+    # chunked. The medians are then approximated with the quantile sketch, exact while it holds them all. The medians
+    # along the other dimensions stay exact: they are computed on each block. The reductions along the other dimensions
+    # only are also computed block by block and concatenated along t. The means by group of months are always computed
+    # in a single pass over the blocks.
+    STREAMED_REDUCTIONS = ["mean", "min", "max", "sum", "std", "median", "quantile", "integral", "group_mean"]
+    STREAM_SIZE = 5e8
+    SKETCH_SIZE = 256
+    
+    @property
+    def data(self):
+        if not self.executed:
+            self.execute()
+        return self._data
+    
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self.selection, self.reductions, self.transform, self.executed = {}, [], None, True
+        self.data_mask = None
+        self.version += 1
+    
+    @property
+    def dims(self):
+        """
+        Dimensions of the data once the plan is executed.
+        """
+        reduced = [dim for _, dims, _ in self.reductions for dim in (dims if isinstance(dims, tuple) else [dims])]
+        return tuple(dim for dim in self._data.dims if dim not in reduced and
+                     not isinstance(self.selection.get(dim), (int, np.integer)))
+    
+    def coordinate(self, dim):
+        """
+        Coordinate of a dimension once the selections are executed.
+        """
+        coordinate = self._data[dim]
+        return coordinate.isel({dim: self.selection[dim]}) if dim in self.selection else coordinate
+    
+    def select(self, **indexers):
+        """
+        Record a selection by index, composed with the previous selections along the same dimensions.
+        Raise IndexError if an index is out of bound.
+        """
+        for dim, indexer in indexers.items():
+            self.selection[dim] = util.compose_indexes(self._data.sizes[dim], self.selection.get(dim), indexer)
+        self.executed = False
+        self.version += 1
+        return self
+    
+    def reduce(self, mode, dim, weights=None, q=None, groups=None):
+        """
+        Record a reduction along a dimension.
+        :param mode: "mean", "weighted_mean", "min", "max", "median", "sum", "std", "quantile" or "group_mean"
+        :param dim: dimension to reduce
+        :param weights: weights of the weighted_mean
+        :param q: quantile or list of quantiles (between 0 and 1) of the quantile mode
+        :param groups: (name, {label: months}) of the group_mean mode along t: the mean of the times of each group of
+        months (numbers) replaces t by a new dimension name
+        """
+        self.reductions.append((mode, dim, {"quantile": q, "group_mean": groups}.get(mode, weights)))
+        self.executed = False
+        self.version += 1
+        return self
+    
+    def integrate(self, weights, dims):
+        """
+        Record the integral of the data over several dimensions: the sum of the data times the weights, NaNs skipped.
+        The weights are broadcast against the data without being tiled, and the integral is computed block of years
+        by block of years if the data is large (see stream_t).
+        :param weights: DataArray on dimensions of the data, indexed like the data before the selections
+        :param dims: dimensions to integrate over
+        """
+        return self.reduce("integral", tuple(dims), weights)
+    
+    def selected(self, array):
+        """
+        Selection of the query plan applied to an array indexed like the data, such as weights or a mask.
+        """
+        return array.isel({dim: index for dim, index in self.selection.items() if dim in array.dims})
+    
+    def ocean_mask(self):
+        """
+        Land-sea mask (see LSM) on the grid of the data, selected like it. None without LSM or on another grid.
+        """
+        mask = self.lsm.mask(self._data) if self.lsm is not None else None
+        return self.selected(mask) if mask is not None else None
+    
+    def execute(self):
+        data = self._data.isel(self.selection) if self.selection else self._data
+        if self.chunks is not None and 't' in data.dims and data.chunks is None:
+            # Lazily indexed data: chunked once selected, so that only the selection is read.
+            data = data.chunk({"t": self.chunks})
+        
+        transform, mask = self.transform, self.ocean_mask()
+        if mask is not None and any(mode not in ["integral", "integral_mean"] and
+                                    set(dim if isinstance(dim, tuple) else [dim]) & set(mask.dims)
+                                    for mode, dim, _ in self.reductions):
+            # The land is left out of the unweighted reductions along the dimensions of the mask. The weighted ones
+            # use the mask in their weights.
+            transform = (lambda block: block.where(mask)) if self.transform is None else \
+                (lambda block: self.transform(block).where(mask))
+        
+        reductions = self.reductions
+        i_t = next((i for i, (_, dim, _) in enumerate(reductions)
+                    if dim == "t" or isinstance(dim, tuple) and "t" in dim), None)
+        mode_t = reductions[i_t][0] if i_t is not None else None
+        if reductions and 't' in data.dims and (mode_t is None or mode_t in self.STREAMED_REDUCTIONS) and \
+                (data.chunks is None and data.nbytes > self.STREAM_SIZE or
+                 mode_t in ["median", "quantile"] and data.chunks is not None or mode_t == "group_mean"):
+            # The transform is applied to each block: applied to the whole data, it would read all of it.
+            if i_t is None:
+                data, reductions = self.stream_t(data, reductions, None, transform), []
+            else:
+                data = self.stream_t(data, reductions[:i_t], reductions[i_t], transform)
+                reductions = reductions[i_t + 1:]
+        elif transform is not None:
+            data = transform(data)
+        data = self.reduce_data(data, reductions)
+        
+        if self.chunks is not None:
+            print("____ Rebuilding the data_array")
+            data = data.load()
+        elif data.chunks is None:
+            # Lazily indexed data: the selection is read once and for all.
+            data = data.load()
+        self.data = data
+        if mask is not None and any(dim in data.dims for dim in mask.dims):
+            # Ocean where any of the reduced cells is.
+            self.data_mask = mask.any([dim for dim in mask.dims if dim not in data.dims])
+    
+    def reduce_data(self, data, reductions):
+        # Successive sums, min or max are fused in a single call. The means and medians are computed one dimension
+        # after the other, as before: with missing values, the mean of means differs from the mean over all dims.
+        i = 0
+        while i < len(reductions):
+            mode, dim, argument = reductions[i]
+            dims = [dim]
+            while mode in self.FUSED_REDUCTIONS and i + 1 < len(reductions) and reductions[i + 1][0] == mode:
+                i += 1
+                dims.append(reductions[i][1])
+            if mode == "weighted_mean":
+                data = data.weighted(argument).mean(dim)
+            elif mode in ["integral", "integral_mean"]:
+                weights, mask = self.selected(argument), self.ocean_mask()
+                if mask is not None and set(mask.dims) & set(dim):
+                    weights = weights * mask
+                integral = xr.dot(data.fillna(0), weights, dim=list(dim))
+                # The mean is divided by the weights of the valid values only: the masked cells are left out.
+                data = integral if mode == "integral" else \
+                    integral / xr.dot(data.notnull(), weights, dim=list(dim))
+            elif mode == "quantile":
+                data = data.quantile(argument, dim=dim, skipna=True)
+            else:
+                data = getattr(data, mode)(dim=dims if len(dims) > 1 else dim, skipna=True)
+            i += 1
+        return data
+    
+    def stream_t(self, data, reductions, reduction, transform=None):
+        """
+        Reduce the data along t block of years by block of years, so that a single block is read and held in memory.
+        The reductions preceding the one along t are applied to each block, then running accumulators are updated:
+        count, sum, min, max, and mean and variance merged with Welford's (Chan's) formulas. The quantiles and medians
+        are approximated with a sketch of SKETCH_SIZE values per level (see util.QuantileSketch for the error bound).
+        The integrals of the blocks are summed, and the sums and counts of each group of months of the group_mean are
+        accumulated (see util.group_selection). Without reduction along t, the reduced blocks are concatenated.
+        :param data: DataArray
+        :param reductions: reductions along the other dimensions, applied before the one along t
+        :param reduction: reduction along t, with the mode "mean", "min", "max", "sum", "std", "median", "quantile",
+        "integral" or "group_mean", or None
+        :param transform: function applied to each block before the reductions
+        :return: DataArray reduced along t
+        """
+        mode, _, q = reduction if reduction is not None else (None, None, None)
+        size = data.sizes['t']
+        per_year = 1
+        if 't' in data.indexes and size > 0:
+            days = util.t_to_days(data.indexes['t'])
+            per_year = max(1, int(np.searchsorted(days, days[0] + 360)))
+        block = max(1, int(self.STREAM_SIZE // (data.nbytes / size)) // per_year) * per_year
+        if self.debug: print(f"* Streaming t by blocks of {block} times")
+        
+        template, count, total, mean, m2, minimum, maximum = None, 0, 0, 0, 0, None, None
+        if mode == "group_mean" and size > 0:
+            # Years of the series: the groups which wrap the year are only complete between them.
+            years = np.floor(util.as_days(data.indexes['t'][[0, -1]])) // 360 + 1
+        sketch, blocks = util.QuantileSketch(self.SKETCH_SIZE), []
+        for start in range(0, size, block):
+            reduced = data.isel(t=slice(start, start + block))
+            reduced = self.reduce_data(reduced if transform is None else transform(reduced), reductions)
+            if mode is None:
+                blocks.append(reduced.load())
+                continue
+            if template is None and mode == "group_mean":
+                name, groups = q
+                template = reduced.isel(t=slice(0, 1)).mean(dim='t').expand_dims({name: list(groups)})
+                total = np.zeros((len(groups), *template.shape[1:]))
+                count = np.zeros_like(total)
+            elif template is None:
+                # Dimensions, coordinates and dtype of the result.
+                template = self.reduce_data(reduced.isel(t=slice(0, 1)), [reduction])
+            if mode == "group_mean":
+                days = util.t_to_days(reduced.indexes['t'])
+                values = reduced.transpose('t', ...).values.astype(np.float64)
+                for i, group in enumerate(q[1].values()):
+                    selected = values[util.group_selection(days, group, *years)]
+                    count[i] += np.sum(~np.isnan(selected), axis=0)
+                    total[i] += np.nansum(selected, axis=0)
+                continue
+            if mode in ["median", "quantile"]:
+                sketch.update(reduced.transpose('t', ...).values)
+                continue
+            if mode == "integral":
+                total = total + self.reduce_data(reduced, [reduction]).transpose(*template.dims).values
+                continue
+            values = reduced.transpose('t', ...).values.astype(np.float64)
+            count_b = np.sum(~np.isnan(values), axis=0)
+            total_b = np.nansum(values, axis=0)
+            minimum_b, maximum_b = np.fmin.reduce(values, axis=0), np.fmax.reduce(values, axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean_b = total_b / count_b
+                m2_b = np.nansum((values - mean_b) ** 2, axis=0)
+                delta, new_count = mean_b - mean, count + count_b
+                mean = np.where(count_b > 0, mean + delta * count_b / np.maximum(new_count, 1), mean)
+                m2 = np.where(count_b > 0, m2 + m2_b + delta ** 2 * count * count_b / np.maximum(new_count, 1), m2)
+            count, total = new_count, total + total_b
+            minimum = minimum_b if minimum is None else np.fmin(minimum, minimum_b)
+            maximum = maximum_b if maximum is None else np.fmax(maximum, maximum_b)
+        
+        if mode is None:
+            return xr.concat(blocks, 't')
+        if mode in ["median", "quantile"]:
+            return template.copy(data=sketch.quantile(0.5 if mode == "median" else q).astype(template.dtype))
+        if mode == "integral":
+            return template.copy(data=np.asarray(total).astype(template.dtype))
+        if mode == "group_mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return template.copy(data=np.where(count > 0, total / count, np.nan).astype(template.dtype))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = {"mean": np.where(count > 0, mean, np.nan), "sum": total, "min": minimum, "max": maximum,
+                      "std": np.where(count > 0, np.sqrt(m2 / count), np.nan)}[mode]
+        return template.copy(data=np.asarray(result).astype(template.dtype))
+    
     def __repr__(self):
         return f"{util.print_coordinates('lon', self.lon)}; {util.print_coordinates('lon_p', self.lon_p)}\n" \
                f"{util.print_coordinates('lonb', self.lonb)}; {util.print_coordinates('lonb_p', self.lonb_p)}\n" \
@@ -151,116 +454,164 @@ class GeoDataArray:
                f"{util.print_coordinates('t', self.t)}\n" \
                f"DATA: {self.data}"
     
-    def values(self, processing=True):
-        if self.debug:
-            data = self.process(self.data.where(self.data.values != 0), self.proc_lon, self.proc_lat,
-                                self.proc_z).values if processing else self.data.where(self.data.values != 0).values
-            return data
+    def values(self, processing=True, masked=False):
+        """
+        Values of the data, with the land masked (with the land-sea mask if there is one, the zeros otherwise), and
+        processed if processing is True.
+        Memoized in VALUES_CACHE until the data or the query plan change. The cached arrays are read-only: a copy of
+        them is returned, which the callers may modify.
+        :param processing: pad the data with the process method of the dataset
+        :param masked: return a numpy masked array instead of NaNs
+        :return: array of the dtype of the data if it is floating, float64 otherwise, with the quantiles (see
+        self.quantiles) along its first axis after the list quantile mode
+        """
+        global values_cache_bytes
+        data = self.data
+        key = (self.token, self.version, processing, self.proc_lon, self.proc_lat, self.proc_z, masked)
+        if key in VALUES_CACHE:
+            VALUES_CACHE.move_to_end(key)
+            return VALUES_CACHE[key].copy()
+        
+        mask = self.data_mask
+        if data.chunks is not None or not np.issubdtype(data.dtype, np.floating):
+            # Masked lazily, chunk by chunk. NaN doesn't fit in integers: they are converted to floats.
+            data = data.where(data != 0) if mask is None else data.where(mask)
+            values = (self.process(data, self.proc_lon, self.proc_lat, self.proc_z) if processing else data).values
+        elif mask is not None:
+            # The mask is padded like the data and broadcast against it: a single boolean array on its grid.
+            mask = (self.process(mask, self.proc_lon, self.proc_lat, self.proc_z) if processing else mask)
+            mask = mask.transpose(*[dim for dim in data.dims if dim in mask.dims])
+            values = (self.process(data, self.proc_lon, self.proc_lat, self.proc_z) if processing else data).values
+            if np.may_share_memory(values, data.values):
+                values = values.copy(order="K")
+            np.copyto(values, np.nan, where=~mask.values.reshape([mask.sizes.get(dim, 1) for dim in data.dims]))
         else:
-            return self.process(self.data.where(self.data.values != 0), self.proc_lon, self.proc_lat,
-                                self.proc_z).values if processing else self.data.where(self.data.values != 0).values
+            # The padding of process only gathers values: the zeros are masked in place in its output, along the first
+            # axis so that the boolean masks stay small.
+            values = (self.process(data, self.proc_lon, self.proc_lat, self.proc_z) if processing else data).values
+            if np.may_share_memory(values, data.values):
+                values = values.copy(order="K")
+            for block in values if values.ndim > 1 else [values]:
+                block[block == 0] = np.nan
+        if masked:
+            values = np.ma.masked_invalid(values, copy=False)
+        values.flags.writeable = False
+        VALUES_CACHE[key] = values
+        values_cache_bytes += values.nbytes
+        while len(VALUES_CACHE) > 1 and values_cache_bytes > VALUES_CACHE_SIZE:
+            values_cache_bytes -= VALUES_CACHE.popitem(last=False)[1].nbytes
+        return values.copy()
     
     def processed_time(self, new_start_year=None):
-        return np.linspace(0, self.end_year - self.start_year, len(self.t)) + \
+        return np.linspace(0, self.end_year - self.start_year, len(self.t_days)) + \
                (new_start_year if new_start_year is not None else self.start_year)
     
     @staticmethod
     def filter_months(data_array, month_list):
         # To define in GeoDataArray !!!!and GeoDS!!!!
         if month_list is not None:
-            condition = xr.zeros_like(data_array.t)
-            for i in range(len(data_array.t)):
-                condition[i] = data_array.t[i].values[()].month in util.months_to_number(month_list)
-            data_array = data_array.where(condition, drop=True)
+            data_array = data_array.isel(t=util.months_to_indexes(util.months_of_year(data_array.t), month_list))
         return data_array
     
     def sort_data(self):
         """
-        Sort all dimensions of the data.
+        Sort all dimensions of the data, with a single isel. The ascending dimensions are skipped and the descending
+        ones are reversed with a slice: only the unsorted ones are gathered, with a permutation computed once per
+        coordinate (see util.sort_indexes).
         :return:
         """
+        indexers = {}
         for dim in self.data.dims:
-            # if self.debug:print(f"____ Sorting data along dimension : {dim}")
-            self.data = self.data.sortby(dim, ascending=True)
+            if dim not in self.data.indexes:
+                continue
+            index = self.data.indexes[dim]
+            if index.is_monotonic_increasing:
+                continue
+            elif index.is_monotonic_decreasing and index.is_unique:
+                indexers[dim] = slice(None, None, -1)
+            else:
+                indexers[dim] = util.sort_indexes(index.values)
+        if indexers:
+            self.data = self.data.isel(indexers)
     
     def get_lon(self, mode_lon, value_lon, offset_lon=1):
         
         try:
             if mode_lon is None:
                 pass
-            elif 'longitude' in self.data.dims:
+            elif 'longitude' in self.dims:
                 if mode_lon == "index":
                     if value_lon is None:
                         raise ValueError("!!!! To use the index mode, please indicate a value_lon.")
                     print(f"____ New longitude value : {self.lon[int(value_lon)]}")
-                    self.data = self.data.isel(longitude=value_lon)
+                    self.select(longitude=value_lon)
                 elif mode_lon == "value":
                     if value_lon is None:
                         raise ValueError("!!!! To use the value mode, please indicate a value_lon.")
                     new_lon = self.lon[util.lon_to_index(self.lon, value_lon)]
                     print(
                         f"____ New longitude value : {new_lon}")
-                    self.data = self.data.isel(longitude=util.lon_to_index(self.lon, value_lon))
+                    self.select(longitude=util.lon_to_index(self.lon, value_lon))
                 elif mode_lon == "mean":
                     print("____ Processing longitude: mean")
-                    self.data = self.data.mean(dim="longitude", skipna=True)
+                    self.reduce("mean", "longitude")
                 elif mode_lon == "weighted_mean":
                     # No weights for longitude.
                     print("____ Processing longitude: weighted_mean")
-                    self.data = self.data.mean(dim="longitude", skipna=True)
+                    self.reduce("mean", "longitude")
                 elif mode_lon == "min":
                     print("____ Processing longitude: min")
-                    self.data = self.data.min(dim="longitude", skipna=True)
+                    self.reduce("min", "longitude")
                 elif mode_lon == "max":
                     print("____ Processing longitude: max")
-                    self.data = self.data.max(dim="longitude", skipna=True)
+                    self.reduce("max", "longitude")
                 elif mode_lon == "median":
                     print("____ Processing longitude: median")
-                    self.data = self.data.median(dim="longitude", skipna=True)
+                    self.reduce("median", "longitude")
                 elif mode_lon == "sum":
                     print("____ Processing longitude: sum")
-                    self.data = self.data.sum(dim="longitude", skipna=True)
+                    self.reduce("sum", "longitude")
                 else:
                     print("!!!! Mode wasn't recognized. The data_array was not changed.")
                 self.update_lon(mode_lon, value_lon)
             
-            elif 'longitudeb' in self.data.dims:
+            elif 'longitudeb' in self.dims:
                 if mode_lon == "index":
                     if value_lon is None:
                         raise ValueError("!!!! To use the index mode, please indicate a value_lon.")
                     print(f"____ New longitudeb value : {self.lonb[int(value_lon)]}")
-                    self.data = self.data.isel(longitudeb=value_lon)
+                    self.select(longitudeb=value_lon)
                 elif mode_lon == "value":
                     if value_lon is None:
                         raise ValueError("!!!! To use the value mode, please indicate a value_lon.")
                     new_lon = self.lonb[util.lon_to_index(self.lonb, value_lon)]
                     print(
                         f"____ New longitudeb value : {new_lon}")
-                    self.data = self.data.isel(longitudeb=util.lon_to_index(self.lonb, value_lon))
+                    self.select(longitudeb=util.lon_to_index(self.lonb, value_lon))
                 elif mode_lon == "mean":
                     print("____ Processing longitudeb: mean")
-                    self.data = self.data.mean(dim="longitudeb", skipna=True)
+                    self.reduce("mean", "longitudeb")
                 elif mode_lon == "weighted_mean":
                     # No weights for longitude.
                     print("____ Processing longitudeb: weighted_mean")
-                    self.data = self.data.mean(dim="longitudeb", skipna=True)
+                    self.reduce("mean", "longitudeb")
                 elif mode_lon == "min":
                     print("____ Processing longitudeb: min")
-                    self.data = self.data.min(dim="longitudeb", skipna=True)
+                    self.reduce("min", "longitudeb")
                 elif mode_lon == "max":
                     print("____ Processing longitudeb: max")
-                    self.data = self.data.max(dim="longitudeb", skipna=True)
+                    self.reduce("max", "longitudeb")
                 elif mode_lon == "median":
                     print("____ Processing longitudeb: median")
-                    self.data = self.data.median(dim="longitudeb", skipna=True)
+                    self.reduce("median", "longitudeb")
                 elif mode_lon == "sum":
                     print("____ Processing longitude: sum")
-                    self.data = self.data.sum(dim="longitudeb", skipna=True)
+                    self.reduce("sum", "longitudeb")
                 else:
                     print("!!!! Mode wasn't recognized. The data_array was not changed.")
                 self.update_lon(mode_lon, value_lon)
             
-            elif 'row_index' in self.data.dims:
+            elif 'row_index' in self.dims:
                 print("!!!! Impossible to use get_lon method for the moment. The data_array was not changed.")
                 if mode_lon == "value":
                     if value_lon is None:
@@ -283,14 +634,14 @@ class GeoDataArray:
         elif mode_lon == "index":
             if value_lon is None:
                 raise ValueError("!!!! To use the index mode, please indicate a value_lon.")
-            self.lon = self.lon[int(value_lon)] if 'longitude' in self.data.dims else self.lonb[int(value_lon)]
+            self.lon = self.lon[int(value_lon)] if 'longitude' in self.dims else self.lonb[int(value_lon)]
             self.lonb, self.lons = self.lon, None
             self.lon_p, self.lonb_p, self.lons_p = self.lon, self.lon, None
         elif mode_lon == "value":
             if value_lon is None:
                 raise ValueError("!!!! To use the value mode, please indicate a value_lon.")
             # Take the closest longitude
-            new_lon = self.lon[util.lon_to_index(self.lon, value_lon)] if 'longitude' in self.data.dims else self.lonb[
+            new_lon = self.lon[util.lon_to_index(self.lon, value_lon)] if 'longitude' in self.dims else self.lonb[
                 util.lon_to_index(self.lonb, value_lon)]
             self.lon = new_lon
             self.lonb, self.lons = self.lon, None
@@ -301,87 +652,123 @@ class GeoDataArray:
         else:
             print("!!!! Mode wasn't recognized. The data_array was not changed.")
     
+    def get_horizontal(self, mode_horizontal, box=None):
+        """
+        Reduce the longitude and the latitude together, in a single reduction weighted by the surfaces of the cells
+        (see util.area_weights), or the longitude, the latitude and z weighted by the volumes of the cells (see
+        util.volume_matrix).
+        :param mode_horizontal: "area_mean", "area_sum" or "volume_mean". The missing values (masked cells, such as the
+        land in the ocean) are left out of the means.
+        :param box: (lon_min, lon_max, lat_min, lat_max): the cells at its edges only count for their part inside it
+        """
+        
+        try:
+            if mode_horizontal is None:
+                pass
+            elif mode_horizontal in ["area_mean", "area_sum", "volume_mean"]:
+                names = ["latitude", "longitude"] + (["z"] if mode_horizontal == "volume_mean" else [])
+                dims = [next((dim for dim in [name, f"{name}b"] if dim in self.dims), None) for name in names]
+                if None in dims:
+                    raise ValueError(f"!!!! The {mode_horizontal} mode needs the dimensions {', '.join(names)}.")
+                print(f"____ Processing {', '.join(dims)}: {mode_horizontal}")
+                coordinates = [self._data[dim].values for dim in dims]
+                box = box if box is not None else [None] * 4
+                if mode_horizontal == "volume_mean":
+                    weights = util.volume_matrix(coordinates[1], coordinates[0], coordinates[2]) * \
+                        util.cell_fractions(coordinates[1], coordinates[0], *box)[:, :, np.newaxis]
+                else:
+                    weights = util.area_weights(coordinates[1], coordinates[0], *box)
+                weights = xr.DataArray(weights, dims=dims, coords=dict(zip(dims, coordinates)))
+                self.reduce("integral" if mode_horizontal == "area_sum" else "integral_mean", tuple(dims), weights)
+                self.update_lon("sum", None)
+                self.update_lat("sum", None)
+                if mode_horizontal == "volume_mean":
+                    self.update_z("sum", None)
+            else:
+                print("!!!! Mode wasn't recognized. The data_array was not changed.")
+        except ValueError as error:
+            print(error)
+            print("____ The DataArray was not changed.")
+        finally:
+            return self
+    
     def get_lat(self, mode_lat, value_lat, latitude=None):
         
         try:
             if mode_lat is None:
                 pass
-            elif 'latitude' in self.data.dims:
+            elif 'latitude' in self.dims:
                 if mode_lat == "index":
                     if value_lat is None:
                         raise ValueError("!!!! To use the index mode, please indicate a value_lat.")
                     print(f"____ New latitude value : {self.lat[int(value_lat)]}")
-                    self.data = self.data.isel(latitude=value_lat)
+                    self.select(latitude=value_lat)
                 elif mode_lat == "value":
                     if value_lat is None:
                         raise ValueError("!!!! To use the value mode, please indicate a value_lat.")
                     new_lat = self.lat[util.lat_to_index(self.lat, value_lat)]
                     print(
                         f"____ New latitude value : {new_lat}")
-                    self.data = self.data.isel(latitude=util.lat_to_index(self.lat, value_lat))
+                    self.select(latitude=util.lat_to_index(self.lat, value_lat))
                 elif mode_lat == "mean":
                     print("____ Processing latitude: mean")
-                    self.data = self.data.mean(dim="latitude", skipna=True)
+                    self.reduce("mean", "latitude")
                 elif mode_lat == "weighted_mean":
                     # proportionnal to cosinus
                     print("____ Processing latitude: weighted_mean")
-                    lat_weights = np.cos(np.deg2rad(self.data.latitude))
-                    weights = self.data.weighted(lat_weights)
-                    self.data = weights.mean("latitude")
+                    self.reduce("weighted_mean", "latitude", np.cos(np.deg2rad(self.coordinate("latitude"))))
                 elif mode_lat == "min":
                     print("____ Processing latitude: min")
-                    self.data = self.data.min(dim="latitude", skipna=True)
+                    self.reduce("min", "latitude")
                 elif mode_lat == "max":
                     print("____ Processing latitude: max")
-                    self.data = self.data.max(dim="latitude", skipna=True)
+                    self.reduce("max", "latitude")
                 elif mode_lat == "median":
                     print("____ Processing latitude: median")
-                    self.data = self.data.median(dim="latitude", skipna=True)
+                    self.reduce("median", "latitude")
                 elif mode_lat == "sum":
                     print("____ Processing latitude: sum")
-                    self.data = self.data.sum(dim="latitude", skipna=True)
+                    self.reduce("sum", "latitude")
                 else:
                     print("!!!! Mode wasn't recognized. The data_array was not changed.")
                 self.update_lat(mode_lat, value_lat)
             
-            elif 'latitudeb' in self.data.dims:
+            elif 'latitudeb' in self.dims:
                 if mode_lat == "index":
                     if value_lat is None:
                         raise ValueError("!!!! To use the index mode, please indicate a value_lat.")
                     print(f"____ New latitudeb value : {self.latb[int(value_lat)]}")
-                    self.data = self.data.isel(latitudeb=value_lat)
+                    self.select(latitudeb=value_lat)
                 elif mode_lat == "value":
                     if value_lat is None:
                         raise ValueError("!!!! To use the value mode, please indicate a value_lat.")
                     new_lat = self.latb[util.lat_to_index(self.latb, value_lat)]
                     print(f"____ New latitudeb value : {new_lat}")
-                    self.data = self.data.isel(latitudeb=util.lat_to_index(self.latb, value_lat))
+                    self.select(latitudeb=util.lat_to_index(self.latb, value_lat))
                 elif mode_lat == "mean":
                     print("____ Processing latitudeb: mean")
-                    self.data = self.data.mean(dim="latitudeb", skipna=True)
+                    self.reduce("mean", "latitudeb")
                 elif mode_lat == "weighted_mean":
                     # proportionnal to cosinus
                     print("____ Processing latitudeb: weighted_mean")
-                    lat_weights = np.cos(np.deg2rad(self.data.latitudeb))
-                    weights = self.data.weighted(lat_weights)
-                    self.data = weights.mean("latitudeb")
+                    self.reduce("weighted_mean", "latitudeb", np.cos(np.deg2rad(self.coordinate("latitudeb"))))
                 elif mode_lat == "min":
                     print("____ Processing latitudeb: min")
-                    self.data = self.data.min(dim="latitudeb", skipna=True)
+                    self.reduce("min", "latitudeb")
                 elif mode_lat == "max":
                     print("____ Processing latitudeb: max")
-                    self.data = self.data.max(dim="latitudeb", skipna=True)
+                    self.reduce("max", "latitudeb")
                 elif mode_lat == "median":
                     print("____ Processing latitudeb: median")
-                    self.data = self.data.median(dim="latitudeb", skipna=True)
+                    self.reduce("median", "latitudeb")
                 elif mode_lat == "sum":
                     print("____ Processing latitudeb: sum")
-                    self.data = self.data.sum(dim="latitudeb", skipna=True)
+                    self.reduce("sum", "latitudeb")
                 else:
                     print("!!!! Mode wasn't recognized. The data_array was not changed.")
                 self.update_lat(mode_lat, value_lat)
             
-            elif 'col_index' in self.data.dims or latitude is None:
+            elif 'col_index' in self.dims or latitude is None:
                 print("!!!! Impossible to use get_lat method for the moment. The data_array was not changed.")
         
         except ValueError as error:
@@ -400,14 +787,14 @@ class GeoDataArray:
             if value_lat is None:
                 raise ValueError("!!!! To use the index mode, please indicate a value_lat.")
             print(f"____ New latitude value : {self.lat[int(value_lat)]}")
-            self.lat = self.lat[int(value_lat)] if 'latitude' in self.data.dims else self.latb[int(value_lat)]
+            self.lat = self.lat[int(value_lat)] if 'latitude' in self.dims else self.latb[int(value_lat)]
             self.latb, self.lats = self.lat, None
             self.lat_p, self.latb_p, self.lats_p = self.lat, self.lat, None
         elif mode_lat == "value":
             if value_lat is None:
                 raise ValueError("!!!! To use the value mode, please indicate a value_lat.")
             # Take the closest latitude
-            new_lat = self.lat[util.lat_to_index(self.lat, value_lat)] if 'latitudeb' in self.data.dims else self.latb[
+            new_lat = self.lat[util.lat_to_index(self.lat, value_lat)] if 'latitudeb' in self.dims else self.latb[
                 util.lat_to_index(self.latb, value_lat)]
             self.lat = new_lat
             self.latb, self.lats = self.lat, None
@@ -424,82 +811,74 @@ class GeoDataArray:
             if mode_z is None:
                 pass
             
-            elif 'z' in self.data.dims:
+            elif 'z' in self.dims:
                 if mode_z == "index":
                     if value_z is None:
                         raise ValueError("!!!! To use the index mode, please indicate a value_z.")
                     print(f"____ New z value : {self.z[int(value_z)]}")
-                    self.data = self.data.isel(z=value_z)
+                    self.select(z=value_z)
                 elif mode_z == "value":
                     if value_z is None:
                         raise ValueError("!!!! To use the value mode, please indicate a value_z.")
                     new_z = self.z[util.z_to_index(self.z, value_z)]
                     print(
                         f"New z value : {new_z}")
-                    self.data = self.data.isel(z=util.z_to_index(self.z, value_z))
+                    self.select(z=util.z_to_index(self.z, value_z))
                 elif mode_z == "mean":
                     print("____ Processing z: mean")
-                    self.data = self.data.mean(dim="z", skipna=True)
+                    self.reduce("mean", "z")
                 elif mode_z == "weighted_mean":
-                    # proportionnal to steps.
+                    # Proportional to the thickness of the levels, cached per grid (see util.level_weights).
                     print("____ Processing z: weighted_mean")
-                    if len(self.zs) == len(self.z):
-                        self.data = self.data.weighted(xr.DataArray(self.zs, dims=["z"])).mean("z")
-                    else:
-                        zs = util.compute_steps(util.guess_bounds(self.z))
-                        self.data = self.data.weighted(xr.DataArray(zs, dims=["z"])).mean("z")
+                    self.reduce("integral_mean", ("z",), util.level_weights("z", self._data["z"].values))
                 elif mode_z == "min":
                     print("____ Processing z: min")
-                    self.data = self.data.min(dim="z", skipna=True)
+                    self.reduce("min", "z")
                 elif mode_z == "max":
                     print("____ Processing z: max")
-                    self.data = self.data.max(dim="z", skipna=True)
+                    self.reduce("max", "z")
                 elif mode_z == "median":
                     print("____ Processing z: median")
-                    self.data = self.data.median(dim="z", skipna=True)
+                    self.reduce("median", "z")
                 elif mode_z == "sum":
                     print("____ Processing z: sum")
-                    self.data = self.data.sum(dim="z", skipna=True)
+                    self.reduce("sum", "z")
                 else:
                     print("!!!! Mode wasn't recognized. The data_array was not changed.")
                 self.update_z(mode_z, value_z)
             
-            elif 'zb' in self.data.dims:
+            elif 'zb' in self.dims:
                 if mode_z == "index":
                     if value_z is None:
                         raise ValueError("!!!! To use the index mode, please indicate a value_z.")
                     print(f"____ New zb value : {self.zb[int(value_z)]}")
-                    self.data = self.data.isel(zb=value_z)
+                    self.select(zb=value_z)
                 elif mode_z == "value":
                     if value_z is None:
                         raise ValueError("!!!! To use the value mode, please indicate a value_z.")
                     new_z = self.zb[util.z_to_index(self.zb, value_z)]
                     print(
                         f"New zb value : {new_z}")
-                    self.data = self.data.isel(zb=util.z_to_index(self.zb, value_z))
+                    self.select(zb=util.z_to_index(self.zb, value_z))
                 elif mode_z == "mean":
                     print("____ Processing zb: mean")
-                    self.data = self.data.mean(dim="zb", skipna=True)
+                    self.reduce("mean", "zb")
                 elif mode_z == "weighted_mean":
-                    # proportionnal to steps.
+                    # Proportional to the thickness of the levels, cached per grid (see util.level_weights).
                     print("____ Processing zb: weighted_mean")
-                    if len(self.zs) == len(self.zb):
-                        self.data = self.data.weighted(xr.DataArray(self.zs, dims=["zb"])).mean("zb")
-                    else:
-                        zs = util.compute_steps(util.guess_bounds(self.zb))
-                        self.data = self.data.weighted(xr.DataArray(zs, dims=["zb"])).mean("zb")
+                    self.reduce("integral_mean", ("zb",), util.level_weights("zb", self._data["zb"].values))
                 elif mode_z == "min":
                     print("____ Processing zb: min")
-                    self.data = self.data.min(dim="zb", skipna=True)
+                    self.reduce("min", "zb")
                 elif mode_z == "max":
                     print("____ Processing zb: max")
-                    self.data = self.data.max(dim="zb", skipna=True)
+                    self.reduce("max", "zb")
                 elif mode_z == "median":
                     print("____ Processing zb: median")
-                    self.data = self.data.median(dim="zb", skipna=True)
+                    self.reduce("median", "zb")
                 elif mode_z == "sum":
                     print("____ Processing zb: sum")
-                    self.data = self.data.sum(dim="zb", skipna=True)
+                    self.reduce("sum", "zb")
                 else:
                     print("!!!! Mode wasn't recognized. The data_array was not changed.")
                 self.update_z(mode_z, value_z)
@@ -519,14 +898,14 @@ class GeoDataArray:
         elif mode_z == "index":
             if value_z is None:
                 raise ValueError("!!!! To use the index mode, please indicate a value_z.")
-            self.z = self.z[int(value_z)] if 'z' in self.data.dims else self.zb[int(value_z)]
+            self.z = self.z[int(value_z)] if 'z' in self.dims else self.zb[int(value_z)]
             self.zb, self.zs = self.z, None
             self.z_p, self.zb_p, self.zs_p = self.z, self.z, None
         elif mode_z == "value":
             if value_z is None:
                 raise ValueError("!!!! To use the value mode, please indicate a value_z.")
             # Take the closest z
-            new_z = self.z[util.z_to_index(self.z, value_z)] if 'z' in self.data.dims else self.zb[
+            new_z = self.z[util.z_to_index(self.z, value_z)] if 'z' in self.dims else self.zb[
                 util.z_to_index(self.zb, value_z)]
             self.z = new_z
             self.zb, self.zs = self.z, None
@@ -545,30 +924,43 @@ class GeoDataArray:
             elif mode_t == "index":
                 if value_t is None:
                     raise ValueError("!!!! To use the index mode, please indicate a value_t.")
-                print(f"____ New t value : {self.t[int(value_t)]}")
-                self.data = self.data.isel(t=value_t)
+                print(f"____ New t value : {util.days_to_t(self.t_days[int(value_t)])}")
+                self.select(t=value_t)
             elif mode_t == "value":
                 if value_t is None:
                     raise ValueError("!!!! To use the value mode, please indicate a value_t.")
-                new_t = self.t[util.t_to_index(self.t, value_t)]
-                print(
-                    f"____ New t value : {new_t}")
-                self.data = self.data.isel(t=util.t_to_index(self.t, value_t))
+                index = util.t_to_index(self.t_days, value_t)
+                print(f"____ New t value : {util.days_to_t(self.t_days[index])}")
+                self.select(t=index)
             elif mode_t == "mean":
                 print("____ Processing t: mean")
-                self.data = self.data.mean(dim="t", skipna=True)
+                self.reduce("mean", "t")
             elif mode_t == "min":
                 print("____ Processing t: min")
-                self.data = self.data.min(dim="t", skipna=True)
+                self.reduce("min", "t")
             elif mode_t == "max":
                 print("____ Processing t: max")
-                self.data = self.data.max(dim="t", skipna=True)
+                self.reduce("max", "t")
             elif mode_t == "median":
                 print("____ Processing t: median")
-                self.data = self.data.median(dim="t", skipna=True)
+                self.reduce("median", "t")
             elif mode_t == "sum":
                 print("____ Processing t: sum")
-                self.data = self.data.sum(dim="t", skipna=True)
+                self.reduce("sum", "t")
+            elif mode_t == "std":
+                print("____ Processing t: std")
+                self.reduce("std", "t")
+            elif mode_t == "quantile":
+                if value_t is None:
+                    raise ValueError("!!!! To use the quantile mode, please indicate the quantile(s) in value_t.")
+                print(f"____ Processing t: quantile {value_t}")
+                self.reduce("quantile", "t", q=value_t)
+            elif mode_t == "climatology":
+                print("____ Processing t: climatology")
+                self.reduce("group_mean", "t", groups=("month", util.MONTHS_OF_YEAR))
+            elif mode_t == "seasons":
+                print("____ Processing t: seasonal means")
+                self.reduce("group_mean", "t", groups=("season", util.SEASONS))
             else:
                 print("!!!! Mode wasn't recognited. The data_array was not changed.")
             self.update_t(mode_t, value_t)
@@ -587,74 +979,208 @@ class GeoDataArray:
         elif mode_t == "index":
             if value_t is None:
                 raise ValueError("!!!! To use the index mode, please indicate a value_t.")
-            self.t = self.t[int(value_t)]
+            self.t_days = self.t_days[int(value_t)]
         elif mode_t == "value":
             if value_t is None:
                 raise ValueError("!!!! To use the value mode, please indicate a value_t.")
-            new_t = self.t[util.t_to_index(self.t, value_t)]
-            self.z = new_t
-        elif mode_t in ["mean", "min", "max", "median", "sum"]:
+            self.t_days = self.t_days[util.t_to_index(self.t_days, value_t)]
+        elif mode_t in ["mean", "min", "max", "median", "sum", "std", "quantile", "climatology", "seasons"]:
             self.t = None
+            if mode_t == "quantile" and np.ndim(value_t) > 0:
+                self.quantiles = list(value_t)
         else:
             print("!!!! Mode wasn't recognized. The data_array was not changed.")
     
+    def data_t_days(self):
+        """
+        Times of the data in days (see util.t_to_days), once the selections are executed. Cached until the time index
+        of the data changes.
+        :return: array of floats
+        """
+        index = self._data.indexes['t']
+        if self.t_index is None or self.t_index[0] is not index:
+            self.t_index = index, util.t_to_days(index)
+        return self.t_index[1][self.selection['t']] if 't' in self.selection else self.t_index[1]
+    
+    def months_of_year(self):
+        """
+        Month of the year of each time of the data, once the selections are executed.
+        :return: array of integers
+        """
+        return util.months_of_year(self.data_t_days())
+    
     def crop_months(self, new_month_list):
-        condition = xr.zeros_like(self.data.t)
-        for i in range(len(self.data.t)):
-            condition[i] = self.data.t[i].values[()].month in util.months_to_number(new_month_list)
-        self.data = self.data.where(condition, drop=True)
+        self.select(t=util.months_to_indexes(self.months_of_year(), new_month_list))
         self.months = new_month_list
         print("____ Data cropped to the new month list.")
         return self
     
     def crop_years(self, new_start_year, new_end_year):
+        self.select(t=util.years_to_slice(self.data_t_days(), new_start_year, new_end_year))
         if new_start_year is not None:
-            self.data = self.data.where(self.data.t >= cftime.Datetime360Day(new_start_year, 1, 1),
-                                        drop=True)
             self.start_year = new_start_year
         if new_end_year is not None:
-            self.data = self.data.where(self.data.t <= cftime.Datetime360Day(new_end_year, 12, 30),
-                                        drop=True)
             self.end_year = new_end_year
         print("____ Data cropped to the new start and end years.")
         return self
 
 
 class LSM:
+    """
+    Land-sea mask: True in the ocean, on (latitude, longitude) in 2D and on (z, latitude, longitude) in 3D.
+    The masks are kept as bits packed along the longitude (numpy.packbits), saved as .npy files and memory-mapped when
+    loaded. The boolean masks are only unpacked on first access, once for all the datasets sharing the LSM.
+    """
+    
+    FILES = ["packed2d", "packed3d"]
     
     def __init__(self):
         self.lon = None
         self.lat = None
         self.z = None
+        # Depth of the sea floor and number of ocean levels of each column (see from_bathymetry).
         self.depth = None
         self.level = None
-        self.lsm2d = None
-        self.mask2d = None
-        self.lsm3d = None
-        self.mask3d = None
-    
-    @classmethod
-    def default_lsm(cls, lon, lat, z):
-        """
-        Global function.
-        :param lon:
-        :param lat:
-        :param z:
-        :return:
+        # Dimensions of the data: (latitude, longitude) or (z, latitude, longitude), with their names in the data.
+        self.dims = None
+        self.packed2d = None
+        self.packed3d = None
+        self.masks = dict()
+        # Grids (dimensions and sizes) of the data left unmasked, reported once.
+        self.skipped = set()
+    
+    # MASKS
+    
+    def set_mask(self, dims, lon, lat, z, mask):
+        """
+        :param dims: names of the dimensions of the mask in the data, the last ones being the latitude and the longitude
+        :param mask: boolean array on dims, True in the ocean
+        """
+        self.dims, self.lon, self.lat, self.z = list(dims), np.asarray(lon), np.asarray(lat), \
+            None if z is None else np.asarray(z)
+        mask = np.asarray(mask, dtype=bool)
+        if mask.ndim == 3:
+            self.packed3d, mask = np.packbits(mask, axis=-1), mask.any(axis=0)
+        self.packed2d = np.packbits(mask, axis=-1)
+        self.masks = dict()
+        return self
+    
+    def unpack(self, name):
+        if name not in self.masks:
+            packed = getattr(self, f"packed{name}")
+            mask = None if packed is None else np.unpackbits(packed, axis=-1, count=len(self.lon)).view(bool)
+            if mask is not None:
+                mask.flags.writeable = False
+            self.masks[name] = mask
+        return self.masks[name]
+    
+    @property
+    def mask2d(self):
+        return self.unpack("2d")
+    
+    @property
+    def mask3d(self):
+        return self.unpack("3d")
+    
+    @property
+    def lsm2d(self):
+        return None if self.mask2d is None else ~self.mask2d
+    
+    @property
+    def lsm3d(self):
+        return None if self.mask3d is None else ~self.mask3d
+    
+    def mask(self, data):
+        """
+        Mask on the grid of a DataArray: 3D if the data has the vertical dimension of the mask, 2D otherwise.
+        :param data: DataArray with sorted coordinates
+        :return: boolean DataArray, None if the data isn't on the grid of the mask
         """
-        return np.ones((len(lon), len(lat), len(z)))
+        dims = self.dims if self.packed3d is not None and self.dims[0] in data.dims else self.dims[-2:]
+        coordinates = [self.z, self.lat, self.lon][3 - len(dims):]
+        if any(dim not in data.dims or data.sizes[dim] != len(coordinate) or
+               dim in data.coords and not np.array_equal(np.sort(data[dim].values), coordinate)
+               for dim, coordinate in zip(dims, coordinates)):
+            grid = tuple(data.sizes.items())
+            if grid not in self.skipped:
+                self.skipped.add(grid)
+                print(f"____ The land-sea mask on {tuple(dims)} doesn't match the grid of {data.name} "
+                      f"({dict(grid)}): it isn't applied.")
+            return None
+        key = tuple(dims)
+        if key not in self.masks:
+            self.masks[key] = xr.DataArray(self.mask3d if len(dims) == 3 else self.mask2d, dims=dims,
+                                           coords=dict(zip(dims, coordinates)))
+        return self.masks[key]
     
-    @classmethod
-    def default_mask(cls, lon, lat, z):
+    # DERIVATION
+    
+    def from_levels(self, data):
         """
-        Global function.
-        :param lon:
-        :param lat:
-        :param z:
-        :return:
+        Bathymetry given by the levels of a 3D ocean variable: the sea floor of each column lies below the deepest
+        level where its first time step is neither missing nor zero (see from_bathymetry). A zero above the sea floor,
+        such as a physical one, doesn't make land of the level.
+        :param data: DataArray on a vertical dimension (negative below the surface), a latitude and a longitude one, and
+        possibly t
         """
-        return np.zeros((len(lon), len(lat), len(z)))
-
+        first = data.isel(t=0) if 't' in data.dims else data
+        lat_dim = next(dim for dim in first.dims if dim.startswith("latitude"))
+        lon_dim = next(dim for dim in first.dims if dim.startswith("longitude"))
+        dims = [dim for dim in first.dims if dim not in [lat_dim, lon_dim]] + [lat_dim, lon_dim]
+        if len(dims) != 3:
+            raise ValueError(f"!!!! The land-sea mask can't be derived from the dimensions {first.dims}.")
+        first = first.sortby(dims).transpose(*dims)
+        values, z = first.values, first[dims[0]].values
+        # Levels from the surface downwards, and depth of the level below each of them.
+        order = np.argsort(-z)
+        filled = (~np.isnan(values) & (values != 0))[order]
+        below = np.append(-z[order][1:], np.inf)
+        levels = np.where(filled.any(axis=0), len(z) - np.argmax(filled[::-1], axis=0), 0)
+        depth = np.where(levels > 0, below[np.maximum(levels - 1, 0)], 0)
+        return self.from_bathymetry(dims, first[lon_dim].values, first[lat_dim].values, z, depth)
+    
+    def from_bathymetry(self, dims, lon, lat, z, depth):
+        """
+        Ocean where the sea floor is below the level.
+        :param dims: names of the (z, latitude, longitude) dimensions in the data
+        :param z: levels, negative below the surface
+        :param depth: (lat, lon) depth of the sea floor, positive, 0 on land
+        """
+        self.depth = np.asarray(depth)
+        mask = self.depth[np.newaxis, :, :] > -np.asarray(z)[:, np.newaxis, np.newaxis]
+        self.level = mask.sum(axis=0)
+        return self.set_mask(dims, lon, lat, z, mask)
+    
+    # FILES
+    
+    def save(self, path):
+        """
+        Save the packed masks and their grid in a directory.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in self.FILES:
+            if getattr(self, name) is not None:
+                np.save(f"{path}{name}.npy", getattr(self, name))
+        np.savez(f"{path}grid.npz", dims=np.array(self.dims), lon=self.lon, lat=self.lat,
+                 z=self.z if self.z is not None else np.array([]))
+    
+    def load(self, path):
+        """
+        Load the masks saved in a directory, memory-mapped.
+        :return: self, None if they are missing
+        """
+        try:
+            with np.load(f"{path}grid.npz") as grid:
+                self.dims, self.lon, self.lat = list(grid["dims"]), grid["lon"], grid["lat"]
+                self.z = grid["z"] if len(self.dims) == 3 else None
+            for name in self.FILES:
+                setattr(self, name, np.load(f"{path}{name}.npy", mmap_mode="r")
+                        if os.path.exists(f"{path}{name}.npy") else None)
+        except (OSError, ValueError, KeyError):
+            return None
+        self.masks = dict()
+        return self
+    
 
 class Grid:
     
@@ -0,0 +1,63 @@
+import os
+import types
+import numpy as np
+import xarray as xr
+import pylaeoclim_leeds.hadcm3_cache as cache
+import pylaeoclim_leeds.zones as zones
+
+MODES = [None, None, None, None, None, None, "mean", None, None]
+
+
+def dataset(paths):
+    return types.SimpleNamespace(exp_name="xabcd", paths=paths, start_year=1, end_year=10, months=None)
+
+
+def data():
+    return xr.DataArray(np.zeros((2, 3)), dims=["t", "latitude"], coords={"latitude": [0., 1., 2.]}, name="sst")
+
+
+def scaled(factor):
+    return lambda values: values * factor
+
+
+# KEYS
+
+def test_transform_key():
+    assert cache.transform_key(lambda values: values * 2) == cache.transform_key(lambda values: values * 2)
+    assert cache.transform_key(lambda values: values * 2) != cache.transform_key(lambda values: values * 3)
+    assert cache.transform_key(scaled(2)) == cache.transform_key(scaled(2))
+    assert cache.transform_key(scaled(2)) != cache.transform_key(scaled(3))
+    unkeyable = object()
+    assert cache.transform_key(lambda values: values * unkeyable) is None
+
+
+def test_key_changes_with_the_call():
+    ds, zone = dataset(["a.nc"]), zones.NoZone()
+    key = cache.HadCM3ResultCache.key(ds, data(), zone, MODES, [None, None, None], None)
+    assert key == cache.HadCM3ResultCache.key(ds, data(), zone, MODES, [None, None, None], None)
+    assert key != cache.HadCM3ResultCache.key(ds, data(), zone, MODES[:6] + ["std", None, None], [None, None, None],
+                                              None)
+    assert key != cache.HadCM3ResultCache.key(ds, data(), zone, MODES, [2, None, None], None)
+    assert key != cache.HadCM3ResultCache.key(dataset(["b.nc"]), data(), zone, MODES, [None, None, None], None)
+    assert key != cache.HadCM3ResultCache.key(ds, data().assign_coords(latitude=[0., 1., 3.]), zone, MODES,
+                                              [None, None, None], None)
+    assert key != cache.HadCM3ResultCache.key(ds, data(), zone, MODES, [None, None, None], scaled(2))
+    assert cache.HadCM3ResultCache.key(ds, data(), zone, MODES, [None, None, None], scaled(object())) is None
+
+
+def test_sources_change_with_the_files(tmp_path):
+    paths = [str(tmp_path / f"file_{i}.nc") for i in range(3)]
+    for path in paths:
+        with open(path, "w") as file:
+            file.write("data")
+    sources = cache.HadCM3ResultCache.sources(dataset(paths))
+    os.utime(paths[1], (0, os.stat(paths[1]).st_mtime + 10))
+    assert cache.HadCM3ResultCache.sources(dataset(paths)) != sources
+    
+    many = [str(tmp_path / f"file_{i}.nc") for i in range(cache.MAX_SOURCE_FILES + 1)]
+    sources = cache.HadCM3ResultCache.sources(dataset(many))
+    assert list(sources) == [str(tmp_path)]
+    with open(tmp_path / "new.nc", "w") as file:
+        file.write("data")
+    os.utime(tmp_path, (0, os.stat(tmp_path).st_mtime + 10))
+    assert cache.HadCM3ResultCache.sources(dataset(many)) != sources
@@ -0,0 +1,110 @@
+import cftime
+import numpy as np
+import xarray as xr
+import pylaeoclim_leeds.processing as proc
+import pylaeoclim_leeds.util_hadcm3 as util
+
+LON, LAT = np.arange(0, 360, 3.75), np.linspace(-90, 90, 73)
+
+
+def field(values, n_t=4):
+    return xr.DataArray(np.broadcast_to(values, (n_t, len(LAT), len(LON))).copy(), dims=["t", "latitude", "longitude"],
+                        coords={"latitude": LAT, "longitude": LON})
+
+
+# HORIZONTAL MODES
+
+def test_area_mean_of_a_constant_field():
+    for box in [None, (10, 100, -30, 45), (0, 360, 60, 90)]:
+        geo_da = proc.GeoDataArray(field(2.5)).get_horizontal("area_mean", box)
+        assert np.allclose(geo_da.data.values, 2.5)
+
+
+def test_area_mean_leaves_out_the_missing_values():
+    values = np.where(LAT[:, np.newaxis] > 0, 1., np.nan) * np.ones(len(LON))
+    geo_da = proc.GeoDataArray(field(values)).get_horizontal("area_mean")
+    assert np.allclose(geo_da.data.values, 1)
+
+
+def test_volume_mean_weights_the_levels_by_their_thickness():
+    z = np.array([-5., -15., -30., -60.])
+    per_level = np.array([1., 2., 3., np.nan])
+    data = xr.DataArray(per_level[np.newaxis, :, np.newaxis, np.newaxis] * np.ones((2, 4, len(LAT), len(LON))),
+                        dims=["t", "z", "latitude", "longitude"], coords={"z": z, "latitude": LAT, "longitude": LON})
+    assert np.allclose(proc.GeoDataArray(data * 0 + 4).get_horizontal("volume_mean").data.values, 4)
+    thickness = np.abs(np.diff(util.guess_bounds(z)))[:3]
+    mean = proc.GeoDataArray(data).get_horizontal("volume_mean").data.values
+    assert np.allclose(mean, np.sum(per_level[:3] * thickness) / thickness.sum())
+
+
+# STREAMING
+
+def test_streamed_reductions_along_t_match_xarray(monkeypatch):
+    values = np.random.default_rng(2).normal(10, 3, size=(50, len(LAT), len(LON)))
+    values[values > 14] = np.nan
+    data = xr.DataArray(values, dims=["t", "latitude", "longitude"], coords={"latitude": LAT, "longitude": LON})
+    monkeypatch.setattr(proc.GeoDataArray, "STREAM_SIZE", data.nbytes / 7)
+    for mode in ["mean", "std", "min", "max", "sum"]:
+        streamed = proc.GeoDataArray(data).reduce(mode, "t").data
+        assert np.allclose(streamed, getattr(data, mode)("t"), equal_nan=True), mode
+    streamed = proc.GeoDataArray(data).reduce("mean", "longitude").reduce("std", "t").data
+    assert np.allclose(streamed, data.mean("longitude").std("t"), equal_nan=True)
+
+
+def test_seasonal_means_drop_the_incomplete_winters(monkeypatch):
+    t = [cftime.Datetime360Day(year, month, 16) for year in range(1, 4) for month in range(1, 13)]
+    data = xr.DataArray(np.arange(36.)[:, np.newaxis, np.newaxis] * np.ones((36, len(LAT), len(LON))),
+                        dims=["t", "latitude", "longitude"], coords={"t": t, "latitude": LAT, "longitude": LON})
+    for stream_size in [proc.GeoDataArray.STREAM_SIZE, data.nbytes / 5]:
+        monkeypatch.setattr(proc.GeoDataArray, "STREAM_SIZE", stream_size)
+        seasons = proc.GeoDataArray(data).reduce("group_mean", "t", groups=("season", util.SEASONS)).data
+        assert list(seasons.season.values) == list(util.SEASONS)
+        assert np.allclose(seasons.sel(season="djf"), np.mean([11, 12, 13, 23, 24, 25]))
+        assert np.allclose(seasons.sel(season="mam"), np.mean([2, 3, 4, 14, 15, 16, 26, 27, 28]))
+
+
+# QUANTILES
+
+def test_streamed_median_and_quantiles_along_t(monkeypatch):
+    values = np.random.default_rng(0).normal(size=(40, len(LAT), len(LON)))
+    data = xr.DataArray(values, dims=["t", "latitude", "longitude"], coords={"latitude": LAT, "longitude": LON})
+    exact = proc.GeoDataArray(data).reduce("median", "t").data
+    monkeypatch.setattr(proc.GeoDataArray, "STREAM_SIZE", data.nbytes / 10)
+    streamed = proc.GeoDataArray(data).reduce("median", "t").data
+    assert streamed.dims == ("latitude", "longitude") and np.allclose(streamed, exact)
+    geo_da = proc.GeoDataArray(data).reduce("quantile", "t", q=[0.25, 0.75])
+    geo_da.update_t("quantile", [0.25, 0.75])
+    assert geo_da.data.dims == ("quantile", "latitude", "longitude") and geo_da.quantiles == [0.25, 0.75]
+    assert np.allclose(geo_da.data, data.quantile([0.25, 0.75], dim="t"))
+
+
+# VALUES
+
+def test_values_are_writable_copies_of_the_cache():
+    geo_da = proc.GeoDataArray(field(np.arange(len(LON), dtype=float)))
+    values = geo_da.values(processing=False)
+    values[...] = -1
+    again = geo_da.values(processing=False)
+    assert np.isnan(again[:, :, 0]).all() and np.array_equal(again[0, 0, 1:], np.arange(1., len(LON)))
+    assert proc.values_cache_bytes == sum(array.nbytes for array in proc.VALUES_CACHE.values())
+
+
+# LAND-SEA MASK
+
+def test_masked_area_mean_leaves_out_the_land(tmp_path, capsys):
+    ocean = LAT[:, np.newaxis] * np.ones(len(LON)) < 30
+    levels = xr.DataArray(np.where(ocean, 3., np.nan)[np.newaxis] * np.ones((2, 1, 1)),
+                          dims=["z", "latitude", "longitude"], coords={"z": [-5., -15.], "latitude": LAT,
+                                                                       "longitude": LON})
+    proc.LSM().from_levels(levels).save(f"{tmp_path}/")
+    lsm = proc.LSM().load(f"{tmp_path}/")
+    assert isinstance(lsm.packed2d, np.memmap) and np.array_equal(lsm.mask2d, ocean)
+    
+    geo_da = proc.GeoDataArray(field(np.where(ocean, 1., 100.)))
+    geo_da.lsm = lsm
+    assert np.allclose(geo_da.get_horizontal("area_mean").data.values, 1)
+    
+    other = proc.GeoDataArray(field(1.)[:, ::2])
+    other.lsm = lsm
+    other.get_horizontal("area_mean").data
+    assert "doesn't match the grid" in capsys.readouterr().out
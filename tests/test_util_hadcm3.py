@@ -0,0 +1,105 @@
+import numpy as np
+import xarray as xr
+import pylaeoclim_leeds.util_hadcm3 as util
+
+EARTH_SURFACE = 4 * np.pi * 6371000 ** 2
+# Atmosphere grid: points at the poles.
+ATM_LON, ATM_LAT = np.arange(0, 360, 3.75), np.linspace(-90, 90, 73)
+# Ocean grid: no point at the poles.
+OCN_LON, OCN_LAT = np.arange(0, 360, 1.25), np.linspace(-89.375, 89.375, 144)
+
+
+# AREA WEIGHTS
+
+def test_area_weights_cover_the_sphere():
+    for lon, lat in [(ATM_LON, ATM_LAT), (OCN_LON, OCN_LAT)]:
+        weights = util.area_weights(lon, lat)
+        assert np.all(np.isfinite(weights)) and np.all(weights >= 0)
+        assert np.isclose(weights.sum(), EARTH_SURFACE)
+
+
+def test_area_weights_of_a_box():
+    weights = util.area_weights(ATM_LON, ATM_LAT, None, None, 0, None)
+    assert np.isclose(weights.sum(), EARTH_SURFACE / 2)
+    weights = util.area_weights(ATM_LON, ATM_LAT, 0, 90, None, None)
+    assert np.isclose(weights.sum(), EARTH_SURFACE / 4)
+
+
+def test_volumes_fill_the_layer():
+    z = np.array([-5., -15., -30., -60.])
+    volumes = util.volume_matrix(ATM_LON, ATM_LAT, z)
+    assert volumes.shape == (len(ATM_LAT), len(ATM_LON), len(z)) and np.all(volumes >= 0)
+    assert np.isclose(volumes.sum(), EARTH_SURFACE * np.abs(np.diff(util.guess_bounds(z))).sum())
+
+
+def test_cell_fractions_at_the_poles():
+    fractions = util.cell_fractions(ATM_LON, ATM_LAT)
+    assert np.all(np.isfinite(fractions))
+    assert np.allclose(fractions, 1)
+
+
+# SEASONS
+
+def test_winter_gathers_december_with_the_next_year():
+    days = np.arange(36) * 30 + 15.  # Monthly times of the years 1 to 3.
+    selected = util.group_selection(days, util.SEASONS["djf"], 1, 3)
+    # December of the years 1 and 2 with the January and February which follow them, not the incomplete edge winters.
+    assert np.array_equal(np.flatnonzero(selected), [11, 12, 13, 23, 24, 25])
+    assert np.array_equal(np.flatnonzero(util.group_selection(days, util.SEASONS["jja"], 1, 3)),
+                          [5, 6, 7, 17, 18, 19, 29, 30, 31])
+
+
+# QUANTILE SKETCH
+
+def test_quantile_sketch_error_bound():
+    rng = np.random.default_rng(0)
+    n, k = 5000, 64
+    values = rng.normal(size=(n, 3, 4))
+    sketch = util.QuantileSketch(k)
+    for start in range(0, n, 300):
+        sketch.update(values[start:start + 300])
+    q = np.array([0.05, 0.5, 0.95])
+    approximated = sketch.quantile(q)
+    assert approximated.shape == (3, 3, 4)
+    ranks = np.sum(values[np.newaxis] <= approximated[:, np.newaxis], axis=1)
+    epsilon = (np.log2(n / k) + 1) / k
+    assert np.all(np.abs(ranks - q[:, np.newaxis, np.newaxis] * n) <= epsilon * n)
+
+
+def test_quantile_sketch_is_exact_on_short_series():
+    values = np.random.default_rng(1).normal(size=(100, 5))
+    values[::7, 0] = np.nan
+    sketch = util.QuantileSketch(64)
+    sketch.update(values[:40])
+    sketch.update(values[40:])
+    assert np.allclose(sketch.quantile([0.1, 0.5]), np.nanquantile(values, [0.1, 0.5], axis=0))
+
+
+# LAZY CONCATENATION
+
+def monthly_files(directory, steps, n_files=3, dims=("t", "y")):
+    directory.mkdir(exist_ok=True)
+    paths = []
+    for i, n in enumerate(steps if isinstance(steps, list) else [steps] * n_files):
+        t = xr.DataArray(30. * (np.arange(n) + i * n), dims="t",
+                         attrs={"units": "days since 1850-01-01", "calendar": "360_day"})
+        values = np.random.default_rng(i).random((n, 3) if dims[0] == "t" else (3, n))
+        paths.append(str(directory / f"file_{i}.nc"))
+        xr.Dataset({"v": (dims, values), "t": t}, coords={"y": [1., 2., 3.]}).to_netcdf(
+            paths[-1], encoding={"v": {"scale_factor": 0.001, "dtype": "int16", "_FillValue": -32767}})
+    return paths
+
+
+def test_open_concatenated_reads_the_selected_hyperslabs(tmp_path):
+    paths = monthly_files(tmp_path, 2)
+    dataset = util.open_concatenated(paths, "t", [(1850, 1), (1850, 3), (1850, 5)])
+    expected = xr.open_mfdataset(paths, combine="nested", concat_dim="t")
+    assert np.allclose(dataset.v.isel(t=[1, 4], y=1).values, expected.v.isel(t=[1, 4], y=1).values)
+    assert np.array_equal(util.t_to_days(dataset.t.values), util.t_to_days(expected.t.values))
+
+
+def test_open_concatenated_gives_up_on_other_layouts(tmp_path):
+    dates = [(1850, 1), (1850, 3), (1850, 5)]
+    paths = monthly_files(tmp_path / "steps", [2, 2, 3])
+    assert util.open_concatenated(paths, "t", dates) is None and util.open_concatenated(paths, "t") is None
+    assert util.open_concatenated(monthly_files(tmp_path / "dims", 2, dims=("y", "t")), "t", dates) is None
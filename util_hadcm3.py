@@ -1,9 +1,20 @@
 import numpy as np
 # import pathlib
 import cftime
-
-
-# import xarray as xr
+import netCDF4
+import os
+import json
+import tempfile
+import functools
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import xarray as xr
+try:
+    # Lazy indexing of the custom backend arrays (see open_concatenated).
+    from xarray.core import indexing
+except ImportError:
+    indexing = None
 
 
 class Grid:
@@ -16,26 +27,69 @@ class Grid:
         self.lat_b = guess_bounds(self.lat)
         self.z_b = guess_bounds(self.z)
     
+    # The matrices are repeated along t as read-only broadcast views, without copy.
+    
     def get_surface_matrix(self, n_t=0):
         matrix = surface_matrix(self.lon, self.lat)
-        return matrix if n_t <= 0 else np.resize(matrix, (n_t, matrix.shape[0], matrix.shape[1]))
+        return matrix if n_t <= 0 else np.broadcast_to(matrix, (n_t,) + matrix.shape)
     
     def get_surface_ratio(self, n_t=0):
         matrix = surface_matrix(self.lon, self.lat)
-        return matrix / np.sum(matrix) if n_t <= 0 else np.resize(matrix / np.sum(matrix),
-                                                                  (n_t, matrix.shape[0], matrix.shape[1]))
+        return matrix / np.sum(matrix) if n_t <= 0 else np.broadcast_to(matrix / np.sum(matrix), (n_t,) + matrix.shape)
     
     def get_volume_matrix(self, n_t=0):
         matrix = volume_matrix(self.lon, self.lat, self.z)
-        return matrix if n_t <= 0 else np.resize(matrix, (n_t, matrix.shape[0], matrix.shape[1], matrix.shape[2]))
+        return matrix if n_t <= 0 else np.broadcast_to(matrix, (n_t,) + matrix.shape)
+
+
+# GEOMETRY
+
+MEMOIZE_SIZE = 64
+
+
+def memoize(function):
+    """
+    Cache the results of a function of coordinate arrays, keyed by the content of the arrays (least recently used
+    results are dropped first). The cached arrays are read-only: copy them before modifying them.
+    """
+    cache = OrderedDict()
+    
+    @functools.wraps(function)
+    def wrapper(*arrays):
+        keys = [array_key(array) for array in arrays]
+        if any(key is NotImplemented for key in keys):
+            return function(*arrays)
+        key = tuple(keys)
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        result = function(*arrays)
+        if isinstance(result, np.ndarray):
+            result.flags.writeable = False
+        cache[key] = result
+        if len(cache) > MEMOIZE_SIZE:
+            cache.popitem(last=False)
+        return result
+    
+    wrapper.cache = cache
+    return wrapper
+
+
+def array_key(array):
+    if array is None:
+        return None
+    array = np.asarray(array)
+    if array.dtype.hasobject:
+        return NotImplemented
+    return array.dtype.str, array.shape, array.tobytes()
 
 
 def cell_area(n_lon, lat1, lat2):
     """
     Area of a cell on a regular lon-lat grid.
     :param n_lon: number of longitude divisions
-    :param lat1: bottom of the cell
-    :param lat2: top of the cell
+    :param lat1: bottom of the cell (scalar or array)
+    :param lat2: top of the cell (scalar or array)
     :return:
     """
     r = 6371000
@@ -43,34 +97,86 @@ def cell_area(n_lon, lat1, lat2):
     return 2 * np.pi * r ** 2 * np.abs(np.sin(lat1_rad) - np.sin(lat2_rad)) / n_lon
 
 
+def latitude_bounds(lat):
+    """
+    Bounds of the latitude cells (see guess_bounds), clipped to the poles: the cells centered on a pole, such as on the
+    atmosphere grid, stop at the pole instead of overlapping it.
+    """
+    return np.clip(guess_bounds(lat), -90, 90)
+
+
+@memoize
 def surface_matrix(lon, lat):
     """
     Compute a matrix with all the surfaces values.
     :param lon:
     :param lat:
-    :return:
+    :return: (lat, lon) array
     """
-    n_j, n_i = len(lat), len(lon)
-    lat_b = guess_bounds(lat)
-    surface = np.zeros((n_j, n_i))
-    for i in range(n_i - 1):
-        for j in range(n_j - 1):
-            surface[j, i] = cell_area(n_i, lat_b[j], lat_b[j + 1])
-    return surface
+    lat_b = latitude_bounds(lat)
+    area = cell_area(len(lon), lat_b[:-1], lat_b[1:])
+    return np.repeat(area[:, np.newaxis], len(lon), axis=1)
 
 
+@memoize
+def cell_fractions(lon, lat, lon_min=None, lon_max=None, lat_min=None, lat_max=None):
+    """
+    Fraction of the surface of each cell inside a box: the cells at the edges of the box only count for their part
+    inside it, and the cells outside of it for nothing.
+    :param lon: sorted longitudes
+    :param lat: sorted latitudes
+    :return: (lat, lon) array
+    """
+    lon_b, lat_b = guess_bounds(lon), latitude_bounds(lat)
+    lon_min, lon_max = -np.inf if lon_min is None else lon_min, np.inf if lon_max is None else lon_max
+    lat_min, lat_max = -90 if lat_min is None else lat_min, 90 if lat_max is None else lat_max
+    lon_fraction = np.clip(np.minimum(lon_b[1:], lon_max) - np.maximum(lon_b[:-1], lon_min), 0, None) / \
+        np.diff(lon_b)
+    sin_b = np.sin(np.deg2rad(lat_b))
+    sin_inside = np.sin(np.deg2rad(np.clip(lat_b, lat_min, lat_max)))
+    # Cells without surface, such as degenerate ones at the poles, count for nothing.
+    with np.errstate(invalid="ignore", divide="ignore"):
+        lat_fraction = np.where(np.diff(sin_b) > 0, np.diff(sin_inside) / np.diff(sin_b), 0)
+    return lat_fraction[:, np.newaxis] * lon_fraction[np.newaxis, :]
+
+
+@memoize
+def area_weights(lon, lat, lon_min=None, lon_max=None, lat_min=None, lat_max=None):
+    """
+    Surfaces of the cells (see surface_matrix) inside a box (see cell_fractions).
+    :return: (lat, lon) array
+    """
+    return surface_matrix(lon, lat) * cell_fractions(lon, lat, lon_min, lon_max, lat_min, lat_max)
+
+
+@memoize
+def level_weights(dim, coordinate):
+    """
+    Thickness of the levels of a vertical coordinate (depths or pressures), their bounds being guessed halfway between
+    the levels (see guess_bounds): the weights of the vertical means, cached per grid.
+    :param dim: name of the dimension
+    :return: read-only DataArray on dim
+    """
+    coordinate = np.array(coordinate)
+    thickness = np.abs(np.diff(guess_bounds(coordinate))) if len(coordinate) > 1 else np.ones(len(coordinate))
+    thickness.flags.writeable = False
+    return xr.DataArray(thickness, dims=[dim], coords={dim: coordinate})
+
+
+@memoize
 def volume_matrix(lon, lat, z):
+    """
+    Compute a matrix with all the volumes values.
+    :return: (lat, lon, z) array
+    """
     n_lat, n_lon, n_z = len(lat), len(lon), len(z)
     if any([n_lat == 1, n_lon == 1, n_z == 1]):
         raise ValueError(f"Dimensions length must be >= 1.")
-    lat_b = guess_bounds(lat)
+    lat_b = latitude_bounds(lat)
     z_b = guess_bounds(z)
-    volume = np.zeros((n_lat, n_lon, n_z))
-    for i in range(n_lat):
-        for j in range(n_lon):
-            for k in range(n_z):
-                volume[i, j, k] = cell_area(n_lon, lat_b[i], lat_b[i + 1]) * np.abs(z_b[k + 1] - z_b[k])
-    return volume
+    area = cell_area(n_lon, lat_b[:-1], lat_b[1:])
+    return np.ascontiguousarray(np.broadcast_to(area[:, np.newaxis, np.newaxis] * np.abs(np.diff(z_b)),
+                                                (n_lat, n_lon, n_z)))
 
 
 def running_mean(data, n, axis=0):
@@ -115,6 +221,98 @@ def running_mean(data, n, axis=0):
     return out_mean
 
 
+class QuantileSketch:
+    """
+    Approximate quantiles of many series at once (one per grid cell), fed block by block along their first axis.
+    Deterministic compactors (Manku, Rajagopalan and Lindsay, 1998): the values are kept in sorted buffers of k values
+    per level. When a level holds two buffers, they are merged and one value out of two (alternately the even and the
+    odd ones) is kept in the next level, where each value stands for twice as many values. All the cells receive the
+    same number of values: the buffers are shared by the grid and each compaction is a single sort.
+    
+    Error bound: the rank of the quantile returned is within ε·n of the exact rank, with ε <= (log2(n / k) + 1) / k
+    for n values per cell (missing values included), and exact while n < 2k.
+    Memory: at most k·(log2(n / k) + 2) values per cell.
+    """
+    
+    def __init__(self, k=256):
+        self.k = k
+        self.levels = []
+        self.offsets = []
+        self.pending = None
+        self.shape = None
+    
+    def update(self, values):
+        """
+        :param values: array of the next values of the series, along the first axis
+        """
+        values = np.asarray(values)
+        if self.shape is None:
+            self.shape = values.shape[1:]
+            self.dtype = np.result_type(values.dtype, np.float32)
+        values = values.reshape(len(values), -1).astype(self.dtype, copy=False)
+        if self.pending is not None:
+            values = np.concatenate([self.pending, values])
+        full = len(values) // self.k * self.k
+        for start in range(0, full, self.k):
+            self.push(np.sort(values[start:start + self.k], axis=0), 0)
+        self.pending = values[full:].copy()
+    
+    def push(self, buffer, level):
+        while True:
+            if level == len(self.levels):
+                self.levels.append(None)
+                self.offsets.append(0)
+            if self.levels[level] is None:
+                self.levels[level] = buffer
+                return
+            merged = np.sort(np.concatenate([self.levels[level], buffer]), axis=0, kind="stable")
+            buffer = merged[self.offsets[level]::2]
+            self.offsets[level] = 1 - self.offsets[level]
+            self.levels[level] = None
+            level += 1
+    
+    def quantile(self, q, cells=4096):
+        """
+        Quantiles of each series, skipping the missing values (NaN if there are none), interpolated linearly between
+        the values kept, each placed at the middle of the ranks it stands for.
+        :param q: quantile or list of quantiles, between 0 and 1
+        :param cells: number of cells processed at once
+        :return: array of shape q.shape + shape of the series
+        """
+        q = np.asarray(q, dtype=float)
+        buffers = [self.pending] + self.levels
+        weights = np.concatenate([np.full(len(buffer), 2. ** max(level - 1, 0))
+                                  for level, buffer in enumerate(buffers) if buffer is not None])
+        values = np.concatenate([buffer for buffer in buffers if buffer is not None])
+        if len(weights) == 0:
+            return np.full(q.shape + self.shape, np.nan)
+        if all(buffer is None for buffer in self.levels[1:]):
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                return np.nanquantile(values, q, axis=0).reshape(q.shape + self.shape)
+        
+        result = np.empty(q.shape + (values.shape[1],))
+        for start in range(0, values.shape[1], cells):
+            block = values[:, start:start + cells]
+            order = np.argsort(block, axis=0)
+            block = np.take_along_axis(block, order, axis=0).astype(float)
+            weight = np.where(np.isnan(block), 0., weights[order])
+            ranks = np.cumsum(weight, axis=0) - weight / 2
+            valid = np.maximum(np.sum(weight > 0, axis=0), 1)
+            for i, target in np.ndenumerate(q):
+                target = target * np.sum(weight, axis=0)
+                upper = np.minimum(np.sum(ranks < target, axis=0), valid - 1)
+                lower = np.maximum(upper - 1, 0)
+                rank_l, rank_u = np.take_along_axis(ranks, lower[np.newaxis], 0)[0], \
+                    np.take_along_axis(ranks, upper[np.newaxis], 0)[0]
+                value_l, value_u = np.take_along_axis(block, lower[np.newaxis], 0)[0], \
+                    np.take_along_axis(block, upper[np.newaxis], 0)[0]
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    fraction = np.clip(np.where(rank_u > rank_l, (target - rank_l) / (rank_u - rank_l), 0.), 0, 1)
+                result[i + (slice(start, start + cells),)] = value_l + fraction * (value_u - value_l)
+        return result.reshape(q.shape + self.shape)
+
+
 def coordinate_to_index(longitude, latitude, target_lon, target_lat):
     """
         Find the closet -or at least pretty clos- indexes from a coordiantes grid to a point.
@@ -153,41 +351,168 @@ def z_to_index(z, target_z):
     return (np.abs(z - target_z)).argmin()
 
 
+def range_to_slice(coordinate, value_min=None, value_max=None):
+    """
+    Indexes of the values of a 1D coordinate between value_min and value_max (included).
+    :param coordinate: 1D array
+    :param value_min: lower bound. No lower bound if None.
+    :param value_max: upper bound. No upper bound if None.
+    :return: slice if the coordinate is sorted, array of indexes otherwise
+    """
+    coordinate = np.asarray(coordinate)
+    lower = value_min if value_min is not None else -np.inf
+    upper = value_max if value_max is not None else np.inf
+    if np.all(coordinate[1:] >= coordinate[:-1]):
+        return slice(int(np.searchsorted(coordinate, lower, side='left')),
+                     int(np.searchsorted(coordinate, upper, side='right')))
+    return np.flatnonzero((coordinate >= lower) & (coordinate <= upper))
+
+
+def overlap_to_slice(coordinate, value_min=None, value_max=None):
+    """
+    Indexes of the cells of a 1D coordinate overlapping [value_min, value_max], the bounds of the cells being guessed
+    from their centers (see guess_bounds).
+    :return: slice if the coordinate is sorted, array of indexes otherwise
+    """
+    coordinate = np.asarray(coordinate)
+    if len(coordinate) <= 1:
+        return range_to_slice(coordinate, value_min, value_max)
+    bounds = guess_bounds(coordinate)
+    lower = value_min if value_min is not None else -np.inf
+    upper = value_max if value_max is not None else np.inf
+    if np.all(coordinate[1:] >= coordinate[:-1]):
+        return slice(int(np.searchsorted(bounds[1:], lower, side='right')),
+                     int(np.searchsorted(bounds[:-1], upper, side='left')))
+    return np.flatnonzero((np.maximum(bounds[1:], bounds[:-1]) > lower) & (np.minimum(bounds[1:], bounds[:-1]) < upper))
+
+
+def compose_indexes(size, first, second):
+    """
+    Single indexer equivalent to indexing an axis with first, then with second.
+    :param size: length of the axis
+    :param first: first indexer (integer, slice or array), None if there is no first indexer
+    :param second: second indexer
+    :return: integer, slice if the indexes are contiguous, array of indexes otherwise
+    """
+    indexes = np.arange(size)
+    indexes = indexes[first] if first is not None else indexes
+    indexes = indexes[second]
+    if np.ndim(indexes) == 0:
+        return int(indexes)
+    if len(indexes) == 0:
+        return slice(0, 0)
+    if np.all(np.diff(indexes) == 1):
+        return slice(int(indexes[0]), int(indexes[-1]) + 1)
+    return indexes
+
+
+@memoize
+def sort_indexes(coordinate):
+    """
+    Permutation sorting a coordinate in ascending order. Stable, as xarray's sortby.
+    """
+    return np.argsort(np.asarray(coordinate), kind="stable")
+
+
+@memoize
 def guess_bounds(coordinate):
     if coordinate is not None:
+        coordinate = np.asarray(coordinate)
         if len(coordinate) <= 1:
-            coordinateb = coordinate
-        else:
-            coordinateb = [(coordinate[i] + coordinate[i + 1]) / 2 for i in range(len(coordinate) - 1)]
-            coordinateb = np.append((3 * coordinate[0] - coordinate[1]) / 2, coordinateb)
-            coordinateb = np.append(coordinateb, (3 * coordinate[-1] - coordinate[-2]) / 2)
-        return np.array(coordinateb)
+            return np.array(coordinate)
+        return np.concatenate(([(3 * coordinate[0] - coordinate[1]) / 2], (coordinate[:-1] + coordinate[1:]) / 2,
+                               [(3 * coordinate[-1] - coordinate[-2]) / 2]))
     else:
         raise ValueError("Empty coordinate.")
 
 
+@memoize
 def guess_from_bounds(coordinateb):
     if coordinateb is not None:
+        coordinateb = np.asarray(coordinateb)
         if len(coordinateb) <= 1:
-            coordinate = coordinateb
-        else:
-            coordinate = [(coordinateb[i] + coordinateb[i + 1]) / 2 for i in range(len(coordinateb) - 1)]
-        return np.array(coordinate)
+            return np.array(coordinateb)
+        return (coordinateb[:-1] + coordinateb[1:]) / 2
     else:
         raise ValueError("Empty coordinate.")
 
 
+@memoize
 def compute_steps(coordinate):
     if coordinate is not None:
+        coordinate = np.asarray(coordinate)
         if len(coordinate) <= 1:
-            coordinates = 0
-        else:
-            coordinates = [(coordinate[i] - coordinate[i + 1]) for i in range(len(coordinate) - 1)]
-        return np.array(coordinates)
+            return np.array(0)
+        return coordinate[:-1] - coordinate[1:]
     else:
         raise ValueError("Empty coordinate.")
 
 
+# GRIDS
+
+# Coordinate families shared by all the datasets: (grid, axis, recipe, content of the coordinate) -> family.
+GRIDS = {}
+
+
+def grid_axis(grid, axis, coordinate, from_bounds=False, padding="append"):
+    """
+    Family of a horizontal coordinate of a HadCM3 grid: centers, bounds and steps and their padded versions used by
+    the plots. Computed once per grid and shared (read-only) by all the datasets and GeoDataArrays.
+    :param grid: name of the grid, such as "atmosphere_t", "atmosphere_uv", "ocean_t" or "ocean_uv"
+    :param axis: "lon" or "lat"
+    :param coordinate: coordinate read from the data
+    :param from_bounds: True if the coordinate contains the bounds of the cells instead of their centers
+    :param padding: "append" adds a step at the end, "poles" adds -90 and 90 and "none" doesn't pad the centers
+    :return: dictionary {axis, axis+"b", axis+"s", axis+"_p", axis+"b_p", axis+"s_p"}
+    """
+    coordinate = np.sort(np.asarray(coordinate))
+    key = (grid, axis, from_bounds, padding, array_key(coordinate))
+    if key not in GRIDS:
+        if from_bounds:
+            bounds, centers = coordinate, guess_from_bounds(coordinate)
+        else:
+            centers, bounds = coordinate, guess_bounds(coordinate)
+        steps = bounds[1:] - bounds[0:-1]
+        if padding == "append":
+            centers_p = np.append(centers, centers[-1] + steps[-1])
+        elif padding == "poles":
+            centers_p = np.concatenate(([-90], centers, [90]))
+        elif padding == "none":
+            centers_p = centers
+        else:
+            raise ValueError(f"Unknown padding: {padding}.")
+        bounds_p = guess_bounds(centers_p)
+        GRIDS[key] = read_only_family(axis, centers, bounds, steps, centers_p, bounds_p, bounds_p[1:] - bounds_p[0:-1])
+    return GRIDS[key]
+
+
+def grid_levels(grid, coordinate, from_bounds=True):
+    """
+    Family of the vertical coordinate of a HadCM3 grid. The levels are not padded.
+    :param grid: name of the levels, such as "ocean_levels"
+    :param coordinate: coordinate read from the data (already oriented upwards)
+    :param from_bounds: True if the coordinate contains the bounds of the levels instead of their centers
+    :return: dictionary {"z", "zb", "zs", "z_p", "zb_p", "zs_p"}
+    """
+    coordinate = np.sort(np.asarray(coordinate))
+    key = (grid, "z", from_bounds, None, array_key(coordinate))
+    if key not in GRIDS:
+        if from_bounds:
+            bounds, centers = coordinate, guess_from_bounds(coordinate)
+        else:
+            centers, bounds = coordinate, guess_bounds(coordinate)
+        steps = bounds[1:] - bounds[0:-1]
+        GRIDS[key] = read_only_family("z", centers, bounds, steps, centers, bounds, steps)
+    return GRIDS[key]
+
+
+def read_only_family(axis, *coordinates):
+    names = [axis, axis + "b", axis + "s", axis + "_p", axis + "b_p", axis + "s_p"]
+    for coordinate in coordinates:
+        coordinate.flags.writeable = False
+    return dict(zip(names, coordinates))
+
+
 # def guess_bounds_old(coordinate, mode):
 #     """
 #     DEPRECATED
@@ -286,10 +611,329 @@ def generate_input(path):
     return result_dict
 
 
+def missing_files(paths, n_threads=16):
+    """
+    Find the paths that do not exist on disk.
+    Each directory is listed once and the file names are checked against the listing. If a directory cannot be
+    listed, the paths it contains are checked with stat calls spread over a thread pool.
+    :param paths: list of file paths
+    :param n_threads: number of threads used for the stat calls
+    :return: list of the missing paths, in the order of paths
+    """
+    directories = dict()
+    for path in paths:
+        directories.setdefault(os.path.dirname(path), []).append(path)
+    
+    missing = set()
+    for directory, directory_paths in directories.items():
+        try:
+            names = set(os.listdir(directory if directory != "" else "."))
+            missing.update(path for path in directory_paths if os.path.basename(path) not in names)
+        except OSError:
+            with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                exist = list(executor.map(os.path.isfile, directory_paths))
+            missing.update(path for path, is_file in zip(directory_paths, exist) if not is_file)
+    return [path for path in paths if path in missing]
+
+
+class MultiFileArray(xr.backends.BackendArray):
+    """
+    Variable split along its first dimension between several netcdf files, with the same number of steps per file.
+    Indexing it only opens the files of the selected steps and reads the selected hyperslab of each of them.
+    """
+    
+    def __init__(self, paths, name, steps, shape, dtype):
+        self.paths = paths
+        self.name = name
+        self.steps = steps
+        self.shape = shape
+        self.dtype = dtype
+    
+    def __getitem__(self, key):
+        return indexing.explicit_indexing_adapter(key, self.shape, indexing.IndexingSupport.OUTER, self._getitem)
+    
+    def _getitem(self, key):
+        indexes = np.arange(self.shape[0])[key[0]]
+        squeeze = np.ndim(indexes) == 0
+        indexes = np.atleast_1d(indexes)
+        # Shape of the result of the other keys, for the empty selections.
+        shape = tuple(len(np.arange(size)[k]) for size, k in zip(self.shape[1:], key[1:]) if np.ndim(k) != 0 or
+                      isinstance(k, slice))
+        if len(indexes) == 0 or 0 in shape:
+            return np.empty(shape if squeeze else (len(indexes),) + shape, dtype=self.dtype)
+        
+        parts = []
+        files = indexes // self.steps
+        for run in np.split(indexes, np.flatnonzero(np.diff(files)) + 1):
+            local = run % self.steps
+            local = slice(int(local[0]), int(local[-1]) + 1) if np.all(np.diff(local) == 1) else local
+            with netCDF4.Dataset(self.paths[run[0] // self.steps]) as dataset:
+                variable = dataset.variables[self.name]
+                if variable.shape[0] != self.steps:
+                    raise ValueError(f"!!!! {self.paths[run[0] // self.steps]} has {variable.shape[0]} time steps "
+                                     f"instead of {self.steps}.")
+                variable.set_auto_maskandscale(False)
+                parts.append(np.asarray(variable[(local,) + tuple(key[1:])]))
+        data = np.concatenate(parts, axis=0)
+        return data[0] if squeeze else data
+
+
+def read_times(paths, dim="t"):
+    """
+    Decoded times of several netcdf files, in the order of the paths. The units may differ from one file to the other.
+    :return: array of cftime dates
+    """
+    times = []
+    for path in paths:
+        with netCDF4.Dataset(path) as dataset:
+            variable = dataset.variables[dim]
+            times.append(cftime.num2date(variable[:], units=variable.units,
+                                         calendar=getattr(variable, "calendar", "standard")))
+    return np.concatenate(times) if times else np.array([], dtype=object)
+
+
+def shifted_times(paths, dates, dim="t"):
+    """
+    Times of files of successive months, built from the times of the first file: all the months last 30 days in the
+    360 days calendar, so that the times of each file are those of the first one shifted by whole months. Only the
+    last file is opened to check them.
+    :param paths: paths of the files, in the order of the dates
+    :param dates: (year, month number) of each file
+    :return: array of cftime dates, None if the calendar of the first file isn't the 360 days one or if the times of
+    the last file differ
+    """
+    with netCDF4.Dataset(paths[0]) as dataset:
+        variable = dataset.variables[dim]
+        if getattr(variable, "calendar", "standard").lower() not in ["360_day", "360"]:
+            return None
+        days = t_to_days(cftime.num2date(variable[:], units=variable.units, calendar="360_day"))
+    year, month = dates[0]
+    offsets = np.array([(y - year) * 360 + (m - month) * 30 for y, m in dates], dtype=float)
+    times = (offsets[:, np.newaxis] + days[np.newaxis, :]).ravel()
+    with netCDF4.Dataset(paths[-1]) as dataset:
+        variable = dataset.variables[dim]
+        last = t_to_days(cftime.num2date(variable[:], units=variable.units,
+                                         calendar=getattr(variable, "calendar", "standard")))
+    if len(last) != len(days) or not np.allclose(last, times[len(times) - len(days):]):
+        return None
+    return np.asarray(days_to_t(times))
+
+
+def open_concatenated(paths, dim="t", dates=None):
+    """
+    Lazy dataset of several netcdf files concatenated along dim, with the coordinates of the first file.
+    Nothing is read before the data is indexed or loaded. The selections (isel) are pushed down to the files, so that
+    only the selected files are opened and only the selected hyperslab is read from each of them.
+    :param paths: paths of the files, in the concatenation order
+    :param dim: concatenation dimension
+    :param dates: (year, month number) of each file. If given, dim is built from the first file (see shifted_times)
+    instead of being read from all of them.
+    :return: xarray Dataset, None if the files can't be concatenated lazily: a variable along dim doesn't have it as
+    first dimension, or the files don't all have the time steps of the first one
+    """
+    if indexing is None:
+        return None
+    with netCDF4.Dataset(paths[0]) as sample:
+        steps = sample.dimensions[dim].size
+        variables = {name: (variable.dimensions, variable.shape, variable.dtype,
+                            {attr: variable.getncattr(attr) for attr in variable.ncattrs()})
+                     for name, variable in sample.variables.items() if dim in variable.dimensions}
+    if any(dims[0] != dim for dims, _, _, _ in variables.values()):
+        return None
+    
+    times = shifted_times(paths, dates, dim) if dates is not None else None
+    if times is None:
+        times = read_times(paths, dim)
+        if len(times) != steps * len(paths):
+            return None
+    encoded = xr.Dataset({name: xr.Variable(dims, indexing.LazilyIndexedArray(
+        MultiFileArray(paths, name, steps, (steps * len(paths),) + shape[1:], dtype)), attrs)
+        for name, (dims, shape, dtype, attrs) in variables.items() if name != dim})
+    dataset = xr.open_dataset(paths[0]).drop_vars(list(variables))
+    return dataset.assign_coords({dim: (dim, times)}).assign(xr.decode_cf(encoded, decode_coords=False).data_vars)
+
+
 # TIME
 
+def read_time_extent(path):
+    """
+    Read the time extent of a netcdf file. Only the first and last times are decoded.
+    :param path: path of the file
+    :return: dictionary with the first and last years, the length, the units and the calendar of t
+    """
+    with netCDF4.Dataset(path) as dataset:
+        times = dataset.variables['t']
+        values = times[:]
+        first, last = netCDF4.num2date([np.min(values), np.max(values)], units=times.units, calendar=times.calendar)
+        return {"start_year": int(first.year), "end_year": int(last.year), "length": int(len(values)),
+                "units": times.units, "calendar": times.calendar}
+
+
+class TimeExtentCache:
+    """
+    Time extents of netcdf files, kept in memory and in a json sidecar file.
+    An entry is invalidated when the modification time or the size of its file changes.
+    """
+    
+    def __init__(self, sidecar_path):
+        self.sidecar_path = sidecar_path
+        self.extents = None
+    
+    def load(self):
+        try:
+            with open(self.sidecar_path) as f:
+                self.extents = json.load(f)
+        except (OSError, ValueError):
+            self.extents = dict()
+    
+    def save(self):
+        # Written to a temporary file of its own, then renamed: concurrent processes don't write in the same file.
+        f = None
+        try:
+            with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(self.sidecar_path) or ".", suffix=".tmp",
+                                             delete=False) as f:
+                json.dump(self.extents, f, indent=1)
+            os.replace(f.name, self.sidecar_path)
+        except OSError as error:
+            print(f"!!!! The time extents could not be saved in {self.sidecar_path}: {error}")
+            if f is not None and os.path.exists(f.name):
+                os.remove(f.name)
+    
+    def get(self, key, path):
+        """
+        Time extent of a file, read from the file only if the cached entry is missing or out of date.
+        :param key: name of the entry
+        :param path: path of the file
+        :return: dictionary, see read_time_extent
+        """
+        if self.extents is None:
+            self.load()
+        stat = os.stat(path)
+        extent = self.extents.get(key)
+        if extent is None or extent["path"] != path or extent["mtime"] != stat.st_mtime or \
+                extent["size"] != stat.st_size:
+            extent = read_time_extent(path)
+            extent.update({"path": path, "mtime": stat.st_mtime, "size": stat.st_size})
+            self.extents[key] = extent
+            self.save()
+        return extent
+
+
+DAYS_UNITS = "days since 0001-01-01 00:00:00"
+# Groups of months of the climatologies. All the months of the 360 days calendar last 30 days: the mean of the monthly
+# means of a season is its mean over the days. Each winter gathers the december of the year before with the january
+# and february of its year (see group_selection).
+MONTHS_OF_YEAR = {month: [month] for month in range(1, 13)}
+SEASONS = {"djf": [12, 1, 2], "mam": [3, 4, 5], "jja": [6, 7, 8], "son": [9, 10, 11]}
+
+
+def t_to_days(t):
+    """
+    Numeric time axis : days since 0001-01-01 in the 360 days calendar.
+    :param t: cftime.Datetime360Day or array of cftime.Datetime360Day
+    :return: float or array of floats, with the shape of t
+    """
+    return np.asarray(cftime.date2num(np.asarray(t).ravel(), DAYS_UNITS, calendar="360_day"),
+                      dtype=float).reshape(np.shape(t))
+
+
+def as_days(t):
+    """
+    Times in days (see t_to_days), converted only if they are dates.
+    """
+    t = np.asarray(t)
+    return t if np.issubdtype(t.dtype, np.number) else t_to_days(t)
+
+
+def days_to_t(days):
+    """
+    Dates of times in days (see t_to_days). To display them: the selections use the days.
+    :param days: float or array of floats
+    :return: cftime.Datetime360Day or array of cftime.Datetime360Day
+    """
+    return cftime.num2date(days, DAYS_UNITS, calendar="360_day")
+
+
+def dates_to_days(years, months, day=1):
+    """
+    Days (see t_to_days) of a day of each month of each year, in chronological order, without creating the dates.
+    :param years: list of years
+    :param months: list of months (numbers)
+    :param day: day of the month
+    :return: array of floats
+    """
+    return ((np.asarray(years)[:, np.newaxis] - 1) * 360 + (np.asarray(months)[np.newaxis, :] - 1) * 30 +
+            (day - 1)).ravel().astype(float)
+
+
+def years_to_slice(t, start_year=None, end_year=None):
+    """
+    Indexes of the times between 01/01/start_year and 30/12/end_year (included).
+    :param t: times in days (see t_to_days), or array of cftime.Datetime360Day
+    :param start_year: first year. No lower bound if None.
+    :param end_year: last year. No upper bound if None.
+    :return: slice if t is sorted, array of indexes otherwise
+    """
+    lower = dates_to_days([start_year], [1])[0] if start_year is not None else None
+    upper = dates_to_days([end_year], [12], day=30)[0] if end_year is not None else None
+    return range_to_slice(as_days(t), lower, upper)
+
+
+def months_of_year(t):
+    """
+    Month of the year (1 to 12) of each time, computed from the numeric days of the 360 days calendar.
+    :param t: times in days (see t_to_days), or array of cftime.Datetime360Day
+    :return: array of integers
+    """
+    return (np.floor(as_days(t)) % 360 // 30 + 1).astype(int)
+
+
+def group_selection(t, group, first_year, last_year):
+    """
+    Times of a group of months (see SEASONS). A group which wraps the year, such as djf, gathers the last months of a
+    year with the first months of the next one: the groups which don't lie between first_year and last_year, the
+    incomplete winters at the edges of the series, are left out.
+    :param t: times in days (see t_to_days), or array of cftime.Datetime360Day
+    :param group: months of the group, in their order in the group
+    :param first_year: year of the first time of the series
+    :param last_year: year of the last time of the series
+    :return: boolean array
+    """
+    days = as_days(t)
+    months = months_of_year(days)
+    selected = np.isin(months, group)
+    if group[0] > group[-1]:
+        # Year of the end of the group: the months of the year before are shifted into the next year.
+        years = (np.floor(days) // 360 + 1).astype(int) + (months >= group[0])
+        selected &= (years > first_year) & (years <= last_year)
+    return selected
+
+
+def months_to_indexes(months, month_list):
+    """
+    Indexes of the times whose month is in month_list.
+    :param months: month of the year of each time, see months_of_year
+    :param month_list: list of months (numbers or "ja", "fb", ...)
+    :return: array of indexes
+    """
+    return np.flatnonzero(np.isin(months, months_to_number(month_list)))
+
+
 def t_to_index(t, target_t: cftime.Datetime360Day):
-    return (abs(t - target_t)).argmin()
+    """
+    Index of the time closest to target_t (the first one if two times are as close), found by binary search.
+    :param t: sorted times in days (see t_to_days), or sorted array of cftime.Datetime360Day
+    :param target_t: date
+    :return: integer
+    """
+    days = as_days(t)
+    if len(days) == 0:
+        raise ValueError(f"!!!! No time to select {target_t} from.")
+    target = float(t_to_days(target_t))
+    i = int(np.searchsorted(days, target))
+    if i == len(days) or (i > 0 and target - days[i - 1] <= days[i] - target):
+        return i - 1
+    return i
 
 
 def months_to_number(month_list):
@@ -302,6 +946,25 @@ def months_to_number(month_list):
         print(error)
 
 
+def pad(array, proc_lon, proc_lat, proc_z, latitudes=None, levels=None):
+    """
+    Padding of the arrays processed by the HadCM3 datasets. The paddings are gathered with a single outer-indexed isel:
+    one output buffer, lazy if the data is chunked. The first longitude is appended to the longitudes.
+    :param array: DataArray
+    :param latitudes: dictionary latitude dimension -> function of its size returning the indexes of the padded
+    latitudes. The dimensions missing in the array are skipped.
+    :param levels: same as latitudes, for the vertical dimensions
+    :return: DataArray
+    """
+    sizes, indexes = array.sizes, {}
+    if proc_lon:
+        indexes.update({dim: np.r_[0:sizes[dim], 0] for dim in ["longitude", "longitudeb"] if dim in sizes})
+    for process, paddings in [(proc_lat, latitudes), (proc_z, levels)]:
+        if process and paddings is not None:
+            indexes.update({dim: padding(sizes[dim]) for dim, padding in paddings.items() if dim in sizes})
+    return array.isel(indexes) if indexes else array
+
+
 def cycle_lon(array):
     if array.ndim > 1:
         return np.append(array, array[:, 0][:, np.newaxis], axis=1)
@@ -1,7 +1,9 @@
 import numpy as np
 # import numpy.ma as ma
 import abc
-# import pylaeoclim_leeds.util_hadcm3 as util
+import pylaeoclim_leeds.util_hadcm3 as util
+
+HORIZONTAL_DIMS = ['longitude', 'longitudeb', 'latitude', 'latitudeb']
 
 
 class Zone:
@@ -10,9 +12,15 @@ class Zone:
         self.verbose = verbose
     
     @abc.abstractmethod
-    def compact(self, cube):
+    def compact(self, cube, overlap=False):
         return
     
+    def ranges(self):
+        """
+        Bounds of the zone for each dimension of the data, none by default.
+        """
+        return dict()
+    
     @abc.abstractmethod
     def import_coordinates(self, data_source, lon, lat, z):
         pass
@@ -23,7 +31,7 @@ class NoZone(Zone):
     def __init__(self, verbose=False):
         super(NoZone, self).__init__(verbose)
     
-    def compact(self, data_array):
+    def compact(self, data_array, overlap=False):
         return data_array
     
     def import_coordinates(self, data_source=None, lon=None, lat=None, z=None):
@@ -77,33 +85,27 @@ class Box(Zone):
         # f"{util.print_coordinates('zb', self.zb)}; {util.print_coordinates('zb_p', self.zb_p)}\n" \
         # f"{util.print_coordinates('zs', self.zs)}; {util.print_coordinates('zs_p', self.zs_p)}\n" \
     
-    def compact(self, geo_da):
-        # Test lon etc.
+    def ranges(self):
+        """
+        Bounds of the box for each dimension of the data.
+        :return: dictionary dimension -> (minimum, maximum)
+        """
+        return {'longitude': (self.lon_min, self.lon_max), 'longitudeb': (self.lon_min, self.lon_max),
+                'latitude': (self.lat_min, self.lat_max), 'latitudeb': (self.lat_min, self.lat_max),
+                'z': (self.z_min, self.z_max), 'zb': (self.z_min, self.z_max)}
+    
+    def compact(self, geo_da, overlap=False):
+        """
+        :param overlap: keep all the cells overlapping the box horizontally, not only the ones centered inside it
+        """
+        # The coordinates are sorted by GeoDataArray.sort_data: the box is a range of indexes along each dimension.
         
-        if self.lon_min is not None and 'longitude' in geo_da.data.dims:
-            geo_da.data = geo_da.data.where(geo_da.data.longitude >= self.lon_min, drop=True)
-        if self.lon_min is not None and 'longitudeb' in geo_da.data.dims:
-            geo_da.data = geo_da.data.where(geo_da.data.longitudeb >= self.lon_min, drop=True)
-        if self.lon_max is not None and 'longitude' in geo_da.data.dims:
-            geo_da.data = geo_da.data.where(geo_da.data.longitude <= self.lon_max, drop=True)
-        if self.lon_max is not None and 'longitudeb' in geo_da.data.dims:
-            geo_da.data = geo_da.data.where(geo_da.data.longitudeb <= self.lon_max, drop=True)
-        if self.lat_min is not None and 'latitude' in geo_da.data.dims:
-            geo_da.data = geo_da.data.where(geo_da.data.latitude >= self.lat_min, drop=True)
-        if self.lat_min is not None and 'latitudeb' in geo_da.data.dims:
-            geo_da.data = geo_da.data.where(geo_da.data.latitudeb >= self.lat_min, drop=True)
-        if self.lat_max is not None and 'latitude' in geo_da.data.dims:
-            geo_da.data = geo_da.data.where(geo_da.data.latitude <= self.lat_max, drop=True)
-        if self.lat_max is not None and 'latitudeb' in geo_da.data.dims:
-            geo_da.data = geo_da.data.where(geo_da.data.latitudeb <= self.lat_max, drop=True)
-        if self.z_min is not None and 'z' in geo_da.data.dims:
-            geo_da.data = geo_da.data.where(geo_da.data.z >= self.z_min, drop=True)
-        if self.z_min is not None and 'zb' in geo_da.data.dims:
-            geo_da.data = geo_da.data.where(geo_da.data.zb >= self.z_min, drop=True)
-        if self.z_max is not None and 'z' in geo_da.data.dims:
-            geo_da.data = geo_da.data.where(geo_da.data.z <= self.z_max, drop=True)
-        if self.z_max is not None and 'zb' in geo_da.data.dims:
-            geo_da.data = geo_da.data.where(geo_da.data.zb <= self.z_max, drop=True)
+        indexes = {}
+        for dim, (value_min, value_max) in self.ranges().items():
+            if dim in geo_da.dims and (value_min is not None or value_max is not None):
+                to_slice = util.overlap_to_slice if overlap and dim in HORIZONTAL_DIMS else util.range_to_slice
+                indexes[dim] = to_slice(geo_da.coordinate(dim).values, value_min, value_max)
+        geo_da.select(**indexes)
         
         print("____ Data compacted to the zone.")
         # geo_da.fit_coordinates_to_data()
@@ -111,84 +113,42 @@ class Box(Zone):
     
     def fit_coordinates_to_data(self, geo_da):
         """
-        A reprendre
+        Crop the coordinates of the GeoDataArray to the box, with the same indexes as the data.
+        The steps (lons, lats, zs) are recomputed from the cropped coordinates.
         :param geo_da:
         :return:
         """
-        if self.lon_min is not None:
-            condition = np.where(geo_da.lon >= self.lon_min)
-            conditionb = np.where(geo_da.lonb >= self.lon_min)
-            lon = geo_da.lon[condition]
-            lon_p = geo_da.lon_p[condition]
-            lonb = geo_da.lonb[conditionb]  # not good, find something else.
-            lonb_p = geo_da.lonb_p[conditionb]
-            lons = geo_da.lonb[1:] - geo_da.lonb[0:-1]
-            lons_p = geo_da.lonb_p[1:] - geo_da.lonb_p[0:-1]
-            geo_da.lon, geo_da.lonb, geo_da.lons = lon, lonb, lons
-            geo_da.lon_p, geo_da.lonb_p, geo_da.lons_p = lon_p, lonb_p, lons_p
-            geo_da.proc_lon = False
-        if self.lon_max is not None:
-            condition = np.where(geo_da.lon <= self.lon_max)
-            conditionb = np.where(geo_da.lonb <= self.lon_max)
-            lon = geo_da.lon[condition]
-            lon_p = geo_da.lon_p[condition]
-            lonb = geo_da.lonb[conditionb]  # not good, find something else.
-            lonb_p = geo_da.lonb_p[conditionb]
-            lons = geo_da.lonb[1:] - geo_da.lonb[0:-1]
-            lons_p = geo_da.lonb_p[1:] - geo_da.lonb_p[0:-1]
-            geo_da.lon, geo_da.lonb, geo_da.lons = lon, lonb, lons
-            geo_da.lon_p, geo_da.lonb_p, geo_da.lons_p = lon_p, lonb_p, lons_p
-            geo_da.proc_lon = False
-        if self.lat_min is not None:
-            condition = np.where(geo_da.lat >= self.lat_min)
-            conditionb = np.where(geo_da.latb >= self.lat_min)
-            lat = geo_da.lat[condition]
-            lat_p = geo_da.lat_p[condition]
-            latb = geo_da.latb[conditionb]  # not good, find something else.
-            latb_p = geo_da.latb_p[conditionb]
-            lats = geo_da.latb[1:] - geo_da.latb[0:-1]
-            lats_p = geo_da.latb_p[1:] - geo_da.latb_p[0:-1]
-            geo_da.lat, geo_da.latb, geo_da.lats = lat, latb, lats
-            geo_da.lat_p, geo_da.latb_p, geo_da.lats_p = lat_p, latb_p, lats_p
-            geo_da.proc_lat = False
-        if self.lat_max is not None:
-            condition = np.where(geo_da.lat <= self.lat_max)
-            conditionb = np.where(geo_da.latb <= self.lat_max)
-            lat = geo_da.lat[condition]
-            lat_p = geo_da.lat_p[condition]
-            latb = geo_da.latb[conditionb]  # not good, find something else.
-            latb_p = geo_da.latb_p[conditionb]
-            lats = geo_da.latb[1:] - geo_da.latb[0:-1]
-            lats_p = geo_da.latb_p[1:] - geo_da.latb_p[0:-1]
-            geo_da.lat, geo_da.latb, geo_da.lats = lat, latb, lats
-            geo_da.lat_p, geo_da.latb_p, geo_da.lats_p = lat_p, latb_p, lats_p
-            geo_da.proc_lat = False
-        if self.z_min is not None:
-            condition = np.where(geo_da.z >= self.z_min)
-            conditionb = np.where(geo_da.zb >= self.z_min)
-            z = geo_da.z[condition]
-            z_p = geo_da.z_p[condition]
-            zb = geo_da.zb[conditionb]  # not good, find something else.
-            zb_p = geo_da.zb_p[conditionb]
-            zs = geo_da.zb[1:] - geo_da.zb[0:-1]
-            zs_p = geo_da.zb_p[1:] - geo_da.zb_p[0:-1]
-            geo_da.z, geo_da.zb, geo_da.zs = z, zb, zs
-            geo_da.z_p, geo_da.zb_p, geo_da.zs_p = z_p, zb_p, zs_p
-            geo_da.proc_z = False
-        if self.z_max is not None:
-            condition = np.where(geo_da.z <= self.z_max)
-            conditionb = np.where(geo_da.zb <= self.z_max)
-            z = geo_da.z[condition]
-            z_p = geo_da.z_p[condition]
-            zb = geo_da.zb[conditionb]  # not good, find something else.
-            zb_p = geo_da.zb_p[conditionb]
-            zs = geo_da.zb[1:] - geo_da.zb[0:-1]
-            zs_p = geo_da.zb_p[1:] - geo_da.zb_p[0:-1]
-            geo_da.z, geo_da.zb, geo_da.zs = z, zb, zs
-            geo_da.z_p, geo_da.zb_p, geo_da.zs_p = z_p, zb_p, zs_p
-            geo_da.proc_z = False
+        for name, dim, proc in [('lon', 'longitude', 'proc_lon'), ('lat', 'latitude', 'proc_lat'),
+                                ('z', 'z', 'proc_z')]:
+            value_min, value_max = self.ranges()[dim]
+            if value_min is None and value_max is None:
+                continue
+            
+            coordinate, coordinateb = getattr(geo_da, name), getattr(geo_da, f"{name}b")
+            index = self.coordinate_to_slice(coordinate, value_min, value_max)
+            indexb = self.coordinate_to_slice(coordinateb, value_min, value_max)
+            if index is not None:
+                setattr(geo_da, name, coordinate[index])
+                if getattr(geo_da, f"{name}_p") is not None:
+                    setattr(geo_da, f"{name}_p", getattr(geo_da, f"{name}_p")[index])
+            if indexb is not None:
+                coordinateb = coordinateb[indexb]
+                setattr(geo_da, f"{name}b", coordinateb)
+                setattr(geo_da, f"{name}s", coordinateb[1:] - coordinateb[0:-1])
+                coordinateb_p = getattr(geo_da, f"{name}b_p")
+                if coordinateb_p is not None:
+                    coordinateb_p = coordinateb_p[indexb]
+                    setattr(geo_da, f"{name}b_p", coordinateb_p)
+                    setattr(geo_da, f"{name}s_p", coordinateb_p[1:] - coordinateb_p[0:-1])
+            setattr(geo_da, proc, False)
         return geo_da
     
+    @staticmethod
+    def coordinate_to_slice(coordinate, value_min, value_max):
+        if coordinate is None or np.ndim(coordinate) != 1:
+            return None
+        return util.range_to_slice(coordinate, value_min, value_max)
+    
     def import_coordinates(self, data_source=None, lon=None, lat=None, z=None):
         pass
     